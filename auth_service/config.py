@@ -32,6 +32,27 @@ class Settings(BaseSettings):
     MINIO_SECRET_KEY: str
     MINIO_BUCKET: str
 
+    PASSWORD_BCRYPT_ROUNDS: int = 12  # Стоимость bcrypt; хэши с другой стоимостью пересчитываются при входе
+    PASSWORD_HASH_WORKERS: int = 4  # Потоков для bcrypt
+    PASSWORD_HASH_MAX_PENDING: int = 64  # Сколько запросов может ждать свободного потока, остальные получают 503
+    LOGIN_MAX_ATTEMPTS_PER_USERNAME: int = 5  # Неудачных входов на имя пользователя за окно
+    LOGIN_MAX_ATTEMPTS_PER_IP: int = 50  # Неудачных входов с одного IP за окно
+    LOGIN_ATTEMPTS_WINDOW: int = 900  # Окно подсчета неудачных входов, секунды
+
+    ACCESS_TOKEN_TTL: int = 180  # Срок жизни access-токена, секунды
+    REFRESH_TOKEN_TTL: int = 7 * 86400  # Срок жизни сессии (семейства refresh-токенов) от входа, секунды
+    REFRESH_REUSE_GRACE: int = 30  # Сколько секунд только что обмененный refresh-токен возвращает того же преемника (параллельные обновления), 0 - отключено
+    CORS_ORIGINS: str = "http://localhost:3000"  # Origins фронтенда через запятую: только им разрешены запросы с cookie
+    REVOCATION_BLOOM_ENABLED: bool = True  # Фильтр Блума отозванных токенов в памяти воркера (без него отзыв проверяется запросом к Redis)
+    REVOCATION_BLOOM_CAPACITY: int = 100000  # На сколько отозванных токенов рассчитан фильтр
+    REVOCATION_BLOOM_ERROR_RATE: float = 0.001  # Доля ложноположительных ответов фильтра
+    REVOCATION_BLOOM_REBUILD_INTERVAL: float = 300.0  # Как часто пересобирать фильтр без истекших токенов, секунды
+    REVOCATION_FAIL_OPEN: bool = False  # Принимать токены, если Redis недоступен для проверки отзыва (иначе 503)
+
+    PRINCIPAL_CACHE_TTL: int = 300  # TTL кэша пользователя в Redis для выпуска access-токенов, секунды
+    PRINCIPAL_LOCAL_TTL: float = 5.0  # TTL кэша пользователя в памяти воркера, секунды (0 - отключен)
+    PRINCIPAL_LOCAL_MAX_ENTRIES: int = 10000  # Максимум пользователей в кэше воркера
+
     model_config = SettingsConfigDict(
         env_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env")
     )
@@ -58,6 +79,42 @@ def get_auth_data():
 def get_redis_settings():
     return {"host": settings.REDIS_HOST, "port": settings.REDIS_PORT}
 
+def get_password_settings():
+    return {
+        "bcrypt_rounds": settings.PASSWORD_BCRYPT_ROUNDS,
+        "workers": settings.PASSWORD_HASH_WORKERS,
+        "max_pending": settings.PASSWORD_HASH_MAX_PENDING,
+        "max_attempts_per_username": settings.LOGIN_MAX_ATTEMPTS_PER_USERNAME,
+        "max_attempts_per_ip": settings.LOGIN_MAX_ATTEMPTS_PER_IP,
+        "attempts_window": settings.LOGIN_ATTEMPTS_WINDOW
+    }
+
+def get_token_settings():
+    return {
+        "access_ttl": settings.ACCESS_TOKEN_TTL,
+        "refresh_ttl": settings.REFRESH_TOKEN_TTL,
+        "reuse_grace": settings.REFRESH_REUSE_GRACE
+    }
+
+def get_cors_origins():
+    return [origin.strip() for origin in settings.CORS_ORIGINS.split(",") if origin.strip()]
+
+def get_revocation_settings():
+    return {
+        "bloom_enabled": settings.REVOCATION_BLOOM_ENABLED,
+        "bloom_capacity": settings.REVOCATION_BLOOM_CAPACITY,
+        "bloom_error_rate": settings.REVOCATION_BLOOM_ERROR_RATE,
+        "bloom_rebuild_interval": settings.REVOCATION_BLOOM_REBUILD_INTERVAL,
+        "fail_open": settings.REVOCATION_FAIL_OPEN
+    }
+
+def get_principal_cache_settings():
+    return {
+        "redis_ttl": settings.PRINCIPAL_CACHE_TTL,
+        "local_ttl": settings.PRINCIPAL_LOCAL_TTL,
+        "max_entries": settings.PRINCIPAL_LOCAL_MAX_ENTRIES
+    }
+
 def get_elasticsearch_settings():
     return {
         "host": settings.ELASTICSEARCH_HOST,
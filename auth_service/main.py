@@ -1,6 +1,9 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from auth_service.config import get_cors_origins
 from auth_service.routers.users_router import router as users_router
+from auth_service.services.auth_service import revocation_list
+from auth_service.services.password_service import password_hasher
 from shared.tracing.tracer import get_tracer
 
 # Инициализация трейсинга
@@ -17,25 +20,28 @@ app = FastAPI(
 tracer.instrument_all(app=app)
 
 # Настройка CORS для фронтенда
+# С cookie (access-токен и refresh-токен для POST /auth/refresh) браузер ходит только
+# к явно перечисленным origins: с "*" credentials не разрешены
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Разрешаем все origins для отладки
-    allow_credentials=False,  # Отключаем credentials для отладки
+    allow_origins=get_cors_origins(),
+    allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Дополнительный middleware для CORS (на случай если стандартный не работает)
-@app.middleware("http")
-async def add_cors_headers(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "*"
-    return response
-
 app.include_router(users_router)
 
+@app.on_event("startup")
+async def startup_event():
+    """Запускает синхронизацию фильтра отозванных токенов"""
+    await revocation_list.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await revocation_list.close()
+    password_hasher.close()
+
 @app.get("/")
 def home_page():
     return {"message": "auth service"}
@@ -1,14 +1,25 @@
-from fastapi import APIRouter, HTTPException, status, Response, Depends
+from fastapi import APIRouter, HTTPException, status, Request, Response, Depends
 
-from auth_service.services.users_service import UsersService
+from auth_service.services.users_service import UsersService, principal_cache
 from auth_service.schemas.User_schema import RegisterUser, AuthUser
 from auth_service.services.auth_service import get_password_hash, authenticate_user_by_username, create_access_token, \
-    get_current_user
-from auth_service.models.User import User
+    get_current_user, revoke_token
+from auth_service.services.refresh_service import refresh_token_service, REFRESH_COOKIE
+from auth_service.services.password_service import login_rate_limiter
+from auth_service.config import get_token_settings
+from shared.auth.principal_cache import Principal
 
 router = APIRouter(prefix='/auth', tags=['Авторизация'])
 
 
+def set_auth_cookies(response: Response, access_token: str, refresh_token: str):
+    response.set_cookie(key="users_access_token", value=access_token, httponly=False)
+    response.set_cookie(
+        key=REFRESH_COOKIE, value=refresh_token, httponly=True, samesite="strict",
+        path="/auth", max_age=get_token_settings()["refresh_ttl"]
+    )
+
+
 @router.post("/register", summary="Создать пользователя")
 async def add_user(user_add: RegisterUser) -> dict:
     user = await UsersService.get_user_by_username(username=user_add.username)
@@ -19,37 +30,67 @@ async def add_user(user_add: RegisterUser) -> dict:
         )
 
     user_dict = user_add.model_dump()
-    user_dict['password'] = get_password_hash(user_add.password)
+    user_dict['password'] = await get_password_hash(user_add.password)
     await UsersService.add_user(**user_dict)
     return {'message': 'Вы успешно зарегистрированы!'}
 
 
 @router.post("/login/", summary="Вход в аккаунт")
-async def auth_user(response: Response, user_data: AuthUser):
+async def auth_user(request: Request, response: Response, user_data: AuthUser):
+    # За nginx адрес клиента подставляет uvicorn из X-Forwarded-For (--proxy-headers, FORWARDED_ALLOW_IPS)
+    client_ip = request.client.host if request.client else "unknown"
+    await login_rate_limiter.check(user_data.username, client_ip)
+
     user = await authenticate_user_by_username(username=user_data.username, password=user_data.password)
 
     if user is None:
+        await login_rate_limiter.register_failure(user_data.username, client_ip)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
                             detail='Неверная почта или пароль')
+    await login_rate_limiter.reset(user_data.username)
 
-    access_token = create_access_token({"sub": str(user.id)})
-    response.set_cookie(key="users_access_token", value=access_token, httponly=False)
+    access_token = create_access_token(Principal(**user.to_dict()).to_claims())
+    refresh_token = await refresh_token_service.issue(user.id)
+    set_auth_cookies(response, access_token, refresh_token)
 
-    try:
-        await UsersService.add_session_to_cache(user.id)
-    except Exception as e:
-        print(f"Error adding session to cache: {e}")
+    return {'access_token': access_token}
+
+@router.post("/refresh", summary="Обновить access-токен")
+async def refresh_access_token(request: Request, response: Response):
+    """Обменивает refresh-токен из cookie на новую пару токенов (старый refresh-токен больше не действует)"""
+    token = request.cookies.get(REFRESH_COOKIE)
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Refresh token not found')
 
+    rotated = await refresh_token_service.rotate(token)
+    if rotated is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Вы не авторизованы или сессия истекла')
+    user_id, refresh_token = rotated
+
+    user = await principal_cache.get(user_id, UsersService.get_principal_by_id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='User not found')
+
+    access_token = create_access_token(user.to_claims())
+    set_auth_cookies(response, access_token, refresh_token)
     return {'access_token': access_token}
 
 @router.post("/logout", summary="Выход из аккаунта")
-async def logout_user(response: Response, user_data = Depends(get_current_user)):
+async def logout_user(request: Request, response: Response):
     response.delete_cookie(key="users_access_token")
-    
+    response.delete_cookie(key=REFRESH_COOKIE, path="/auth")
+
     try:
-        await UsersService.delete_session_from_cache(user_data.id)
+        refresh_token = request.cookies.get(REFRESH_COOKIE)
+        if refresh_token:
+            user_id = await refresh_token_service.revoke(refresh_token)
+            if user_id is not None:
+                await principal_cache.invalidate(user_id)
+        access_token = request.cookies.get('users_access_token')
+        if access_token:
+            await revoke_token(access_token)
     except Exception as e:
-        print(f"Error deleting session from cache: {e}")
+        print(f"Error revoking session: {e}")
     
     return {'message': 'Пользователь успешно вышел из системы'}
 
@@ -66,6 +107,6 @@ async def health_check():
     await UsersService.check_cache_health()
 
 @router.get("/me")
-async def get_me(user_data: User = Depends(get_current_user)):
+async def get_me(user_data: Principal = Depends(get_current_user)):
     data = user_data.to_dict()
     print(data)
\ No newline at end of file
@@ -1,49 +1,38 @@
-from passlib.context import CryptContext
-
-from jose import jwt, JWTError
+from jose import jwt, JWTError, ExpiredSignatureError
 from datetime import datetime, timedelta, timezone
-from auth_service.config import get_auth_data
+from auth_service.config import get_auth_data, get_token_settings, get_revocation_settings
 from auth_service.services.users_service import UsersService
 
-from fastapi import Request, HTTPException, status, Depends, Response
-from auth_service.services.users_service import UsersService
+from fastapi import Request, HTTPException, status, Depends
 from auth_service.cache_redis import redis_client
+from auth_service.services.password_service import password_hasher
+from shared.auth.principal_cache import Principal
+from shared.auth.token_revocation import TokenRevocationList, RevocationCheckError, new_token_id, get_token_id
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-async def add_expired_token_to_cache(user_id: int, token: str) -> None:
-    try:
-        await redis_client.set(f"expired_{user_id}", f"{token}")
-        await redis_client.expire(f"expired_{user_id}", 3600)
-        
-        print(f"Expired token for user {user_id} added to cache")
-        
-    except Exception as e:
-        raise e  
-
-def refresh_token(data: dict) -> str:
-    return create_access_token(data)
+revocation_list = TokenRevocationList(redis_client, **get_revocation_settings())
 
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=3)
-    to_encode.update({"exp": expire})
+    expire = datetime.now(timezone.utc) + timedelta(seconds=get_token_settings()["access_ttl"])
+    to_encode.update({"exp": expire, "jti": new_token_id()})
     auth_data = get_auth_data()
     encode_jwt = jwt.encode(to_encode, auth_data['secret_key'], algorithm=auth_data['algorithm'])
     return encode_jwt
 
 async def authenticate_user_by_username(username: str, password: str):
     user = await UsersService.get_user_by_username(username=username)
-    if not user or verify_password(plain_password=password, hashed_password=user.password) is False:
+    if not user:
         return None
+    valid, new_hash = await password_hasher.verify_and_update(password, user.password)
+    if not valid:
+        return None
+    if new_hash:
+        # Стоимость bcrypt изменилась - сохраняем хэш с текущей
+        await UsersService.update_password(user.id, new_hash)
     return user
 
 
@@ -54,40 +43,35 @@ def get_token(request: Request):
     return token
 
 
-async def get_current_user(token: str = Depends(get_token), response: Response = Response):
+async def get_current_user(token: str = Depends(get_token)) -> Principal:
+    """Пользователь из access-токена: проверяются только подпись и срок, без обращения к БД и Redis"""
     try:
         auth_data = get_auth_data()
-        payload = jwt.decode(token, auth_data['secret_key'], algorithms=[auth_data['algorithm']], options={"verify_exp": False})
+        payload = jwt.decode(token, auth_data['secret_key'], algorithms=[auth_data['algorithm']])
+    except ExpiredSignatureError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Срок действия токена истек')
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Токен не валидный!')
-    
-    user_id = payload.get('sub')
-    if not user_id:
+
+    user = Principal.from_claims(payload)
+    if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Не найден ID пользователя')
-    
-    if await redis_client.get(f"expired_{user_id}") == token:
+
+    try:
+        revoked = await revocation_list.is_revoked(get_token_id(payload, token))
+    except RevocationCheckError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Не удалось проверить токен, повторите позже')
+    if revoked:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Вы не авторизованы или сессия истекла')
-    
-    user = await UsersService.get_user_by_id(int(user_id))
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='User not found')
 
-    expire = payload.get('exp')
-    if (not expire):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Срока истечения токена нет')
-    
-    expire_time = datetime.fromtimestamp(int(expire), tz=timezone.utc)
-    if (expire_time < datetime.now(timezone.utc)):
-        print("Token expired")
-        
-        if await redis_client.exists(f"user_{user_id}"):
-            await add_expired_token_to_cache(user_id, token)
+    return user
 
-            access_token = refresh_token({"sub": str(user.id)})
-            response.set_cookie(key="users_access_token", value=access_token, httponly=False)
-            print(f"Token for user {user_id} refreshed")
-        
-        else:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Вы не авторизованы или сессия истекла')
 
-    return user
\ No newline at end of file
+async def revoke_token(token: str) -> None:
+    """Отзывает access-токен (например, при выходе), чтобы его нельзя было использовать до конца срока"""
+    auth_data = get_auth_data()
+    try:
+        payload = jwt.decode(token, auth_data['secret_key'], algorithms=[auth_data['algorithm']], options={"verify_exp": False})
+    except JWTError:
+        return
+    await revocation_list.revoke(get_token_id(payload, token), int(payload.get('exp', 0)))
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from auth_service.cache_redis import redis_client
+from auth_service.config import get_password_settings
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasher:
+    """
+    Хэширование и проверка паролей bcrypt вне event loop.
+
+    bcrypt отпускает GIL, поэтому хватает пула потоков: одновременно считается не больше
+    workers хэшей, еще max_pending запросов ждут в очереди, остальные сразу получают 503,
+    а не выстраиваются за воркером. Стоимость задается rounds; хэши с другой стоимостью
+    при успешном входе пересчитываются (verify_and_update).
+    """
+
+    def __init__(self):
+        self.settings = get_password_settings()
+        rounds = self.settings["bcrypt_rounds"]
+        self.context = CryptContext(
+            schemes=["bcrypt"], deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_desired_rounds=rounds, bcrypt__max_desired_rounds=rounds
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = asyncio.Semaphore(self.settings["workers"] + self.settings["max_pending"])
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """(пароль верный, новый хэш или None, если пересчет не нужен)"""
+        return await self._run(self.context.verify_and_update, password, hashed_password)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, func, *args):
+        if self._slots.locked():
+            logger.warning("Password hashing queue is full")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Сервис перегружен, повторите попытку позже',
+                headers={"Retry-After": "1"}
+            )
+        async with self._slots:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.settings["workers"], thread_name_prefix="password"
+                )
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+
+class LoginRateLimiter:
+    """
+    Ограничение неудачных попыток входа по имени пользователя и по IP (окно фиксированной
+    длины в Redis). Лимит проверяется до проверки пароля, поэтому подбор не тратит bcrypt.
+    """
+
+    def __init__(self):
+        self.settings = get_password_settings()
+
+    @staticmethod
+    def _keys(username: str, ip: str) -> Tuple[str, str]:
+        return f"login_attempts:user:{username.lower()}", f"login_attempts:ip:{ip}"
+
+    async def check(self, username: str, ip: str) -> None:
+        """Бросает 429, если для имени или IP исчерпан лимит попыток"""
+        user_key, ip_key = self._keys(username, ip)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.get(user_key)
+            pipe.get(ip_key)
+            pipe.ttl(user_key)
+            pipe.ttl(ip_key)
+            user_attempts, ip_attempts, user_ttl, ip_ttl = await pipe.execute()
+
+        retry_after = 0
+        if int(user_attempts or 0) >= self.settings["max_attempts_per_username"]:
+            retry_after = max(retry_after, user_ttl)
+        if int(ip_attempts or 0) >= self.settings["max_attempts_per_ip"]:
+            retry_after = max(retry_after, ip_ttl)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail='Слишком много попыток входа, повторите позже',
+                headers={"Retry-After": str(max(retry_after, 1))}
+            )
+
+    async def register_failure(self, username: str, ip: str) -> None:
+        window = self.settings["attempts_window"]
+        async with redis_client.pipeline(transaction=True) as pipe:
+            for key in self._keys(username, ip):
+                pipe.incr(key)
+                pipe.expire(key, window, nx=True)
+            await pipe.execute()
+
+    async def reset(self, username: str) -> None:
+        """Сбрасывает счетчик по имени после успешного входа (счетчик IP продолжает действовать)"""
+        await redis_client.delete(self._keys(username, "")[0])
+
+
+password_hasher = PasswordHasher()
+login_rate_limiter = LoginRateLimiter()
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import secrets
+import time
+import uuid
+from typing import Optional, Tuple
+
+from auth_service.cache_redis import redis_client
+from auth_service.config import get_token_settings
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REFRESH_COOKIE = "users_refresh_token"
+
+# Обменивает refresh-токен KEYS[1] на новый KEYS[2] атомарно; KEYS[3] - преемник KEYS[1]
+# на время ARGV[5] секунд после обмена.
+# Возвращает {1, user_id} - обмен выполнен, {2, user_id, token} - токен только что обменян
+# параллельным запросом, token - его преемник, {0} - токен неизвестен, истек или сессия
+# завершена, {-1, user_id} - токен уже обменивали: семейство отзывается целиком.
+ROTATE_SCRIPT = """
+local data = redis.call('get', KEYS[1])
+if not data then
+    return {0}
+end
+local record = cjson.decode(data)
+local family_key = 'refresh_family:' .. record['family']
+local current = redis.call('get', family_key)
+if not current then
+    return {0}
+end
+if record['used'] or current ~= ARGV[1] then
+    local successor = redis.call('get', KEYS[3])
+    if successor and current == record['successor'] then
+        return {2, record['user_id'], successor}
+    end
+    redis.call('del', family_key)
+    return {-1, record['user_id']}
+end
+local ttl = math.floor(tonumber(record['expires_at']) - tonumber(ARGV[3]))
+if ttl <= 0 then
+    redis.call('del', family_key)
+    return {0}
+end
+record['used'] = true
+record['successor'] = ARGV[2]
+redis.call('set', KEYS[1], cjson.encode(record), 'KEEPTTL')
+record['used'] = false
+record['successor'] = nil
+redis.call('set', KEYS[2], cjson.encode(record), 'EX', ttl)
+redis.call('set', family_key, ARGV[2], 'EX', ttl)
+if tonumber(ARGV[5]) > 0 then
+    redis.call('set', KEYS[3], ARGV[4], 'EX', math.min(tonumber(ARGV[5]), ttl))
+end
+return {1, record['user_id']}
+"""
+
+
+def refresh_token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def refresh_token_key(token_hash: str) -> str:
+    return f"refresh_token:{token_hash}"
+
+
+def refresh_family_key(family: str) -> str:
+    return f"refresh_family:{family}"
+
+
+def refresh_successor_key(token_hash: str) -> str:
+    return f"refresh_successor:{token_hash}"
+
+
+class RefreshTokenService:
+    """
+    Непрозрачные refresh-токены с ротацией.
+
+    Вход открывает семейство токенов (одно на устройство) со сроком refresh_ttl от входа.
+    Каждый обмен выдает новый токен семейства и помечает старый использованным; в Redis
+    хранятся только SHA-256 токенов. Повторное предъявление уже обмененного токена означает,
+    что он утек: семейство отзывается, и обновить сессию не сможет ни вор, ни владелец.
+    Исключение - reuse_grace секунд после обмена, пока преемник еще не обменян: параллельные
+    запросы одного клиента с тем же токеном получают того же преемника (только на это время
+    он хранится в Redis в открытом виде).
+    """
+
+    def __init__(self):
+        self.settings = get_token_settings()
+        self._rotate = redis_client.register_script(ROTATE_SCRIPT)
+
+    async def issue(self, user_id: int) -> str:
+        """Открывает новое семейство и возвращает его первый refresh-токен"""
+        token = secrets.token_urlsafe(32)
+        token_hash = refresh_token_hash(token)
+        family = uuid.uuid4().hex
+        ttl = self.settings["refresh_ttl"]
+        record = {"user_id": user_id, "family": family, "expires_at": int(time.time()) + ttl, "used": False}
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(refresh_token_key(token_hash), json.dumps(record), ex=ttl)
+            pipe.set(refresh_family_key(family), token_hash, ex=ttl)
+            await pipe.execute()
+        return token
+
+    async def rotate(self, token: str) -> Optional[Tuple[int, str]]:
+        """(user_id, новый refresh-токен); None, если токен недействителен или повторно использован"""
+        old_hash = refresh_token_hash(token)
+        new_token = secrets.token_urlsafe(32)
+        new_hash = refresh_token_hash(new_token)
+        result = await self._rotate(
+            keys=[refresh_token_key(old_hash), refresh_token_key(new_hash), refresh_successor_key(old_hash)],
+            args=[old_hash, new_hash, int(time.time()), new_token, self.settings["reuse_grace"]]
+        )
+        status = int(result[0])
+        if status == 2:
+            return int(result[1]), result[2]
+        if status == -1:
+            logger.warning(f"Refresh token reuse detected for user {result[1]}, token family revoked")
+            return None
+        if status != 1:
+            return None
+        return int(result[1]), new_token
+
+    async def revoke(self, token: str) -> Optional[int]:
+        """Отзывает семейство токена (выход); возвращает user_id или None, если токен неизвестен"""
+        data = await redis_client.get(refresh_token_key(refresh_token_hash(token)))
+        if data is None:
+            return None
+        record = json.loads(data)
+        # Без семейства токены сессии не обмениваются; повторное предъявление - не кража
+        await redis_client.delete(refresh_family_key(record["family"]))
+        return record["user_id"]
+
+
+refresh_token_service = RefreshTokenService()
@@ -1,11 +1,14 @@
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.exc import SQLAlchemyError
 
 from auth_service.database import async_session_maker
 from auth_service.models.User import User
 
 from auth_service.cache_redis import redis_client
-from datetime import datetime, timedelta
+from auth_service.config import get_principal_cache_settings
+from shared.auth.principal_cache import Principal, PrincipalCache
+
+principal_cache = PrincipalCache(redis_client, **get_principal_cache_settings())
 
 class UsersService:
 
@@ -17,6 +20,17 @@ class UsersService:
             users = result.scalars().one_or_none()
             return users
 
+    @classmethod
+    async def get_principal_by_id(cls, id):
+        """Идентификационные поля пользователя без хэша пароля"""
+        async with async_session_maker() as session:
+            query = select(User.id, User.username, User.email, User.is_admin).filter_by(id=id)
+            result = await session.execute(query)
+            row = result.one_or_none()
+            if row is None:
+                return None
+            return Principal(id=row.id, username=row.username, email=row.email, is_admin=row.is_admin)
+
     @classmethod
     async def get_user_by_username(cls, username):
         async with async_session_maker() as session:
@@ -39,6 +53,12 @@ class UsersService:
                     raise e
                 return new_instance
 
+    @classmethod
+    async def update_password(cls, id, hashed_password: str):
+        async with async_session_maker() as session:
+            async with session.begin():
+                await session.execute(update(User).filter_by(id=id).values(password=hashed_password))
+
     @classmethod
     async def make_admin(cls, id):
         async with async_session_maker() as session:
@@ -51,6 +71,7 @@ class UsersService:
                     user.is_admin = True
                     session.add(user)
                     await session.commit()  # Сохраняем изменения в базе данных
+                    await principal_cache.invalidate(id)
                     return True
 
                 else:
@@ -63,22 +84,3 @@ class UsersService:
             print("Cache is healthy")
         except Exception as e:
             raise e
-    
-    @classmethod
-    async def add_session_to_cache(cls, user_id: int) -> None:
-        try:
-            await redis_client.set(f"user_{user_id}", f"session_started_at_{datetime.now()}")
-            await redis_client.expire(f"user_{user_id}", timedelta(days=7))
-            
-            print(f"Session for user {user_id} added to cache")
-        except Exception as e:
-            raise e
-    
-    @classmethod
-    async def delete_session_from_cache(cls, user_id: int) -> None:
-        try:
-            await redis_client.delete(f"user_{user_id}")
-          
-            print(f"{user_id} stopped session")
-        except Exception as e:
-            raise e
@@ -30,12 +30,45 @@ class ETLConfig:
     TMDB_BASE_URL: str = "https://api.themoviedb.org/3"
     TMDB_IMAGE_BASE_URL: str = "https://image.tmdb.org/t/p/w500"
     TMDB_BACKDROP_BASE_URL: str = "https://image.tmdb.org/t/p/w1280"
+    TMDB_RATE_LIMIT: float = float(os.getenv("TMDB_RATE_LIMIT", "40"))  # Запросов в секунду (квота TMDB ~50)
+    TMDB_RATE_BURST: int = int(os.getenv("TMDB_RATE_BURST", "20"))  # Сколько запросов можно отправить подряд
+    TMDB_MAX_CONCURRENCY: int = int(os.getenv("TMDB_MAX_CONCURRENCY", "20"))  # Одновременных запросов к TMDB
+    TMDB_REQUEST_TIMEOUT: float = float(os.getenv("TMDB_REQUEST_TIMEOUT", "30"))  # Таймаут запроса, секунды
+    TMDB_BACKOFF_BASE: float = float(os.getenv("TMDB_BACKOFF_BASE", "0.5"))  # Первая пауза перед повтором, секунды
+    TMDB_BACKOFF_MAX: float = float(os.getenv("TMDB_BACKOFF_MAX", "30"))  # Максимальная пауза перед повтором, секунды
+    TMDB_CACHE_MODE: str = os.getenv("TMDB_CACHE_MODE", "on")  # on, off, offline - только ответы из кэша, без сети
+    TMDB_CACHE_PATH: str = os.getenv("TMDB_CACHE_PATH", ".cache/tmdb_responses.sqlite3")
+    TMDB_CACHE_TTL: int = int(os.getenv("TMDB_CACHE_TTL", str(24 * 3600)))  # Карточки фильмов, секунды
+    TMDB_CACHE_LIST_TTL: int = int(os.getenv("TMDB_CACHE_LIST_TTL", "600"))  # Популярные, поиск, лента изменений
+    TMDB_CACHE_STATIC_TTL: int = int(os.getenv("TMDB_CACHE_STATIC_TTL", str(7 * 24 * 3600)))  # Справочник жанров
     
     # ETL settings
     BATCH_SIZE: int = int(os.getenv("ETL_BATCH_SIZE", "10"))
-    MAX_RETRIES: int = int(os.getenv("ETL_MAX_RETRIES", "3"))
+    MAX_RETRIES: int = int(os.getenv("ETL_MAX_RETRIES", "3"))  # Повторы запроса к TMDB при 429, 5xx и сетевых ошибках
     RETRY_DELAY: int = int(os.getenv("ETL_RETRY_DELAY", "5"))
     
+    # Pipeline settings
+    ETL_PAGE_FETCHERS: int = int(os.getenv("ETL_PAGE_FETCHERS", "2"))  # Параллельных загрузок страниц списка
+    ETL_DETAIL_FETCHERS: int = int(os.getenv("ETL_DETAIL_FETCHERS", "16"))  # Параллельных запросов деталей фильмов
+    ETL_TRANSFORMERS: int = int(os.getenv("ETL_TRANSFORMERS", "2"))
+    ETL_LOADERS: int = int(os.getenv("ETL_LOADERS", "1"))  # Параллельных пакетных загрузок в PostgreSQL
+    ETL_QUEUE_SIZE: int = int(os.getenv("ETL_QUEUE_SIZE", "100"))  # Емкость очереди перед каждой стадией
+    ETL_BATCH_FLUSH_INTERVAL: float = float(os.getenv("ETL_BATCH_FLUSH_INTERVAL", "2"))  # Через сколько секунд простоя загружать неполный пакет
+    
+    # Delta sync settings
+    ETL_DELTA_DEFAULT_DAYS: int = int(os.getenv("ETL_DELTA_DEFAULT_DAYS", "1"))  # Период первой дельты, если синхронизаций еще не было
+    
+    # Job persistence settings
+    ETL_JOB_LEASE_TTL: float = float(os.getenv("ETL_JOB_LEASE_TTL", "30"))  # Через сколько секунд задачу упавшей реплики подхватит другая
+    ETL_JOB_HEARTBEAT_INTERVAL: float = float(os.getenv("ETL_JOB_HEARTBEAT_INTERVAL", "10"))  # Продление аренды и проверка отмены
+    ETL_JOB_RESUME_INTERVAL: float = float(os.getenv("ETL_JOB_RESUME_INTERVAL", "15"))  # Поиск незавершенных задач без аренды
+    ETL_JOB_HISTORY_TTL: int = int(os.getenv("ETL_JOB_HISTORY_TTL", str(7 * 24 * 3600)))  # Сколько хранить завершенные задачи, секунды
+    
+    # Similarity index settings
+    SIMILARITY_TOP_K: int = int(os.getenv("ETL_SIMILARITY_TOP_K", "20"))
+    SIMILARITY_CHUNK_SIZE: int = int(os.getenv("ETL_SIMILARITY_CHUNK_SIZE", "256"))
+    SIMILARITY_FEATURES_TTL: float = float(os.getenv("ETL_SIMILARITY_FEATURES_TTL", "3600"))  # Через сколько секунд кэш признаков перечитывается из БД целиком
+    
     @property
     def database_url(self) -> str:
         """Строка подключения к PostgreSQL"""
@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional
+from datetime import date
 import logging
 from etl_service.services.etl_orchestrator import ETLOrchestrator
 from etl_service.schemas.movie_schema import ETLJobRequest, ETLJobStatus
@@ -173,6 +174,35 @@ async def start_tmdb_specific_movies(
         logger.error(f"Ошибка запуска импорта конкретных фильмов: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/etl/tmdb/changes")
+async def start_tmdb_delta_sync(since: Optional[date] = None, until: Optional[date] = None):
+    """Инкрементальная синхронизация: фильмы, измененные в TMDB с последней успешной синхронизации"""
+    if since and until and since > until:
+        raise HTTPException(status_code=400, detail="since не может быть позже until")
+    request = ETLJobRequest(
+        source="tmdb", mode="delta",
+        since=since.isoformat() if since else None,
+        until=until.isoformat() if until else None
+    )
+
+    try:
+        job_id = await orchestrator.start_etl_job(request)
+        return {
+            "job_id": job_id,
+            "message": "Запущена синхронизация изменений TMDB",
+            "since": since,
+            "until": until
+        }
+    except Exception as e:
+        logger.error(f"Ошибка запуска синхронизации изменений TMDB: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/etl/similarity/rebuild")
+async def rebuild_similarity_index(background_tasks: BackgroundTasks):
+    """Полное перестроение индекса похожих фильмов (выполняется в фоне)"""
+    background_tasks.add_task(orchestrator.rebuild_similarity_index)
+    return {"message": "Перестроение индекса похожих фильмов запущено"}
+
 @app.get("/health")
 async def health_check():
     """Проверка здоровья сервиса"""
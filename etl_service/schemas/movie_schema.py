@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, Field, ValidationInfo, field_validator
+from typing import Any, Dict, Optional, List
 from datetime import date
 
 class TMDBMovieResponse(BaseModel):
@@ -46,18 +46,36 @@ class TransformedMovie(BaseModel):
 class ETLJobStatus(BaseModel):
     """Схема статуса ETL задачи"""
     job_id: str
-    status: str  # pending, running, completed, failed
+    status: str  # pending, running, completed, failed, cancelled
     total_items: int = 0
     processed_items: int = 0
     failed_items: int = 0
     started_at: Optional[str] = None
     completed_at: Optional[str] = None
     error_message: Optional[str] = None
+    stages: Dict[str, Dict[str, Any]] = {}  # Метрики стадий конвейера: пропускная способность, глубина очереди
 
 class ETLJobRequest(BaseModel):
     """Схема запроса на запуск ETL задачи"""
     source: str = "tmdb"  # tmdb, file, manual
+    mode: str = "full"  # full - страницы популярных или movie_ids, delta - изменения TMDB с последней синхронизации
     movie_ids: Optional[List[int]] = None  # Конкретные ID фильмов
+    since: Optional[str] = None  # delta: начало периода (YYYY-MM-DD), по умолчанию - дата последней синхронизации
+    until: Optional[str] = None  # delta: конец периода, по умолчанию - дата запуска задачи
     page_start: int = 1
     page_end: int = 5
-    update_existing: bool = False 
\ No newline at end of file
+    update_existing: bool = False
+
+    @field_validator('since', 'until')
+    def check_period(cls, value, info: ValidationInfo):
+        """Даты периода дельты в формате YYYY-MM-DD, since не позже until"""
+        if value is None:
+            return value
+        try:
+            value = date.fromisoformat(value).isoformat()
+        except ValueError:
+            raise ValueError("Дата должна быть в формате YYYY-MM-DD")
+        since = info.data.get('since')
+        if info.field_name == 'until' and since and since > value:
+            raise ValueError("since не может быть позже until")
+        return value
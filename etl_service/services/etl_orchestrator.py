@@ -1,11 +1,15 @@
 import asyncio
 import logging
+import socket
 import uuid
 from typing import List, Optional, Dict, Any
-from datetime import datetime
-from etl_service.services.tmdb_extractor import TMDBExtractor
+from datetime import datetime, date, timedelta
+from etl_service.services.tmdb_extractor import TMDBExtractor, CHANGES_MAX_DAYS
 from etl_service.services.data_transformer import DataTransformer
 from etl_service.services.postgres_loader import PostgresLoader
+from etl_service.services.similarity_builder import SimilarityIndexBuilder
+from etl_service.services.pipeline import Pipeline, PipelineStage
+from etl_service.services.job_store import ETLJobStore
 from etl_service.schemas.movie_schema import ETLJobStatus, ETLJobRequest, TransformedMovie
 from etl_service.config import config
 import redis.asyncio as redis
@@ -13,31 +17,68 @@ import json
 
 logger = logging.getLogger(__name__)
 
+ACTIVE_STATUSES = ("pending", "running")
+CHANGES_CURSOR = "tmdb_movie_changes"
+
 class ETLOrchestrator:
-    """Главный сервис для координации ETL процесса"""
+    """
+    Главный сервис для координации ETL процесса.
+
+    Задача выполняется конвейером стадий (страницы -> детали -> трансформация -> загрузка),
+    связанных ограниченными очередями: сетевые запросы к TMDB и запись в PostgreSQL идут
+    одновременно, а память не растет с числом страниц. Метрики стадий - в ETLJobStatus.stages.
+
+    Задачи и их контрольные точки хранятся в Redis (ETLJobStore). Задачу выполняет реплика,
+    взявшая ее аренду; если реплика упала или перезапускается, аренда истекает, и задачу
+    продолжает любая реплика с места остановки: обработанные страницы и фильмы пропускаются.
+    """
     
     def __init__(self):
         self.extractor = TMDBExtractor()
         self.transformer = DataTransformer()
         self.postgres_loader = PostgresLoader()
+        self.similarity_builder = SimilarityIndexBuilder(self.postgres_loader.async_session)
         self.redis_client = None
+        self.job_store: Optional[ETLJobStore] = None
+        self.replica_id = f"{socket.gethostname()}:{uuid.uuid4().hex[:8]}"
+        # Задачи, выполняемые этой репликой
         self.jobs: Dict[str, ETLJobStatus] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._pipelines: Dict[str, Pipeline] = {}
+        self._cancelled: set = set()
+        self._resume_task: Optional[asyncio.Task] = None
     
     async def initialize(self):
         """Инициализация сервиса"""
         try:
-            self.redis_client = redis.from_url(config.redis_url)
+            self.redis_client = redis.from_url(config.redis_url, decode_responses=True)
             await self.redis_client.ping()
-            logger.info("ETL Orchestrator инициализирован")
+            self.job_store = ETLJobStore(
+                self.redis_client,
+                self.replica_id,
+                lease_ttl=config.ETL_JOB_LEASE_TTL,
+                history_ttl=config.ETL_JOB_HISTORY_TTL
+            )
+            self._resume_task = asyncio.create_task(self._resume_loop())
+            logger.info(f"ETL Orchestrator инициализирован (реплика {self.replica_id})")
         except Exception as e:
             logger.error(f"Ошибка инициализации ETL Orchestrator: {e}")
             raise
     
     async def close(self):
         """Закрытие соединений"""
+        # Незавершенные задачи остаются в Redis в статусе running и продолжатся
+        # на другой реплике или после перезапуска
+        tasks = list(self._tasks.values())
+        if self._resume_task is not None:
+            tasks.append(self._resume_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
         if self.redis_client:
             await self.redis_client.close()
         await self.postgres_loader.close()
+        self.extractor.close()
     
     async def start_etl_job(self, request: ETLJobRequest) -> str:
         """Запуск ETL задачи"""
@@ -49,23 +90,75 @@ class ETLOrchestrator:
             started_at=datetime.now().isoformat()
         )
         
-        self.jobs[job_id] = job_status
-        
-        asyncio.create_task(self._run_etl_job(job_id, request))
+        await self.job_store.create(job_status, request)
+        # Если аренду перехватили раньше, задачу уже выполняет другая реплика
+        if await self.job_store.claim(job_id):
+            self._start_job(job_status, request)
         
         logger.info(f"ETL задача запущена: {job_id}")
         return job_id
     
+    def _start_job(self, job_status: ETLJobStatus, request: ETLJobRequest):
+        job_id = job_status.job_id
+        self.jobs[job_id] = job_status
+        task = asyncio.create_task(self._run_etl_job(job_id, request))
+        self._tasks[job_id] = task
+        
+        def cleanup(_):
+            self._tasks.pop(job_id, None)
+            self.jobs.pop(job_id, None)
+            self._cancelled.discard(job_id)
+        
+        task.add_done_callback(cleanup)
+    
+    async def _resume_loop(self):
+        """Подхватывает незавершенные задачи, аренду которых никто не держит"""
+        while True:
+            try:
+                for job_id in await self.job_store.active_job_ids():
+                    if job_id in self._tasks or not await self.job_store.claim(job_id):
+                        continue
+                    await self._resume_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка поиска незавершенных ETL задач: {e}")
+            await asyncio.sleep(config.ETL_JOB_RESUME_INTERVAL)
+    
+    async def _resume_job(self, job_id: str):
+        job_status = await self.job_store.get_status(job_id)
+        request = await self.job_store.get_request(job_id)
+        if job_status is None or request is None or job_status.status not in ACTIVE_STATUSES:
+            await self.job_store.release(job_id)
+            if job_status is not None:
+                await self.job_store.finish(job_status)
+            return
+        if await self.job_store.is_cancel_requested(job_id):
+            await self._finish_cancelled(job_status)
+            await self.job_store.release(job_id)
+            return
+        logger.info(f"Продолжение ETL задачи {job_id}: обработано {job_status.processed_items} из {job_status.total_items}")
+        self._start_job(job_status, request)
+    
     async def get_job_status(self, job_id: str) -> Optional[ETLJobStatus]:
         """Получение статуса ETL задачи"""
-        return self.jobs.get(job_id)
+        job_status = self.jobs.get(job_id)
+        if job_status is None:
+            return await self.job_store.get_status(job_id)
+        pipeline = self._pipelines.get(job_id)
+        if pipeline is not None:
+            job_status.stages = pipeline.metrics()
+        return job_status
     
     async def _run_etl_job(self, job_id: str, request: ETLJobRequest):
         """Выполнение ETL задачи"""
         job_status = self.jobs[job_id]
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, asyncio.current_task()))
         
         try:
             job_status.status = "running"
+            job_status.error_message = None
+            await self.job_store.save_status(job_status)
             await self._publish_job_status(job_status)
             
             if request.source == "tmdb":
@@ -75,116 +168,261 @@ class ETLOrchestrator:
             
             job_status.status = "completed"
             job_status.completed_at = datetime.now().isoformat()
+            if request.mode == "delta":
+                # Следующая дельта начнется с конца этого периода; день на стыке просматривается
+                # повторно, но неизменившиеся фильмы загрузчик не перезаписывает.
+                # Курсор не откатывается, если период задан вручную и закончился раньше
+                await self.job_store.advance_sync_cursor(CHANGES_CURSOR, request.until)
             
+        except asyncio.CancelledError:
+            if job_id in self._cancelled:
+                await self._finish_cancelled(job_status)
+            else:
+                # Остановка сервиса или потеря аренды: задачу продолжит другая реплика
+                logger.info(f"ETL задача {job_id} прервана, будет продолжена с контрольной точки")
+            return
         except Exception as e:
             logger.error(f"Ошибка выполнения ETL задачи {job_id}: {e}")
             job_status.status = "failed"
             job_status.error_message = str(e)
             job_status.completed_at = datetime.now().isoformat()
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            await asyncio.shield(self._release_lease(job_id))
         
+        await self.job_store.finish(job_status)
+        await self._publish_job_status(job_status)
+    
+    async def _heartbeat(self, job_id: str, task: asyncio.Task):
+        """Продлевает аренду задачи и останавливает ее при отмене или потере аренды"""
+        while True:
+            await asyncio.sleep(config.ETL_JOB_HEARTBEAT_INTERVAL)
+            try:
+                if not await self.job_store.renew(job_id):
+                    logger.warning(f"Аренда ETL задачи {job_id} потеряна, выполнение остановлено")
+                    task.cancel()
+                    return
+                if await self.job_store.is_cancel_requested(job_id):
+                    self._cancelled.add(job_id)
+                    task.cancel()
+                    return
+            except Exception as e:
+                logger.error(f"Ошибка продления аренды ETL задачи {job_id}: {e}")
+    
+    async def _release_lease(self, job_id: str):
+        try:
+            await self.job_store.release(job_id)
+        except Exception as e:
+            logger.error(f"Ошибка снятия аренды ETL задачи {job_id}: {e}")
+    
+    async def _finish_cancelled(self, job_status: ETLJobStatus):
+        job_status.status = "cancelled"
+        job_status.completed_at = datetime.now().isoformat()
+        await self.job_store.finish(job_status)
         await self._publish_job_status(job_status)
+        logger.info(f"ETL задача {job_status.job_id} отменена")
     
     async def _run_tmdb_etl(self, job_id: str, request: ETLJobRequest):
-        """Выполнение ETL из TMDB"""
+        """Выполнение ETL из TMDB с пропуском уже обработанных страниц и фильмов"""
         job_status = self.jobs[job_id]
+        pages_done, queued_ids, done_ids = await self.job_store.get_checkpoints(job_id)
+        # Сначала фильмы со страниц, разобранных до остановки, затем оставшиеся страницы
+        pending = [("movie", movie_id) for movie_id in queued_ids - done_ids]
         
         async with self.extractor:
-            if request.movie_ids:
-                await self._process_specific_movies(job_id, request.movie_ids)
+            if request.mode == "delta":
+                await self._resolve_delta_period(job_id, request)
+                # Фильмы из ленты изменений заведомо менялись: кэш ответов TMDB перепроверяется
+                stages = [self._pages_stage(job_status, queued_ids)] + self._movie_stages(job_status, revalidate=True)
+                source = self._changes_source(request, pending, pages_done)
+            elif request.movie_ids:
+                job_status.total_items = len(request.movie_ids)
+                if not queued_ids:
+                    await self.job_store.queue_movies(job_id, request.movie_ids)
+                stages = self._movie_stages(job_status)
+                source = self._iterate([movie_id for movie_id in request.movie_ids if movie_id not in done_ids])
             else:
-                await self._process_popular_movies(job_id, request.page_start, request.page_end)
-    
-    async def _process_specific_movies(self, job_id: str, movie_ids: List[int]):
-        """Обработка конкретных фильмов по ID"""
-        job_status = self.jobs[job_id]
-        job_status.total_items = len(movie_ids)
-        
-        for movie_id in movie_ids:
+                pages = [("popular", page) for page in range(request.page_start, request.page_end + 1)
+                         if f"popular:{page}" not in pages_done]
+                stages = [self._pages_stage(job_status, queued_ids)] + self._movie_stages(job_status)
+                source = self._iterate(pending + pages)
+            
+            pipeline = Pipeline(stages)
+            self._pipelines[job_id] = pipeline
             try:
-                movie_data = await self.extractor.get_movie_details(movie_id)
-                if not movie_data:
-                    logger.warning(f"Не удалось получить данные фильма {movie_id}")
-                    job_status.failed_items += 1
-                    continue
-                
-                cast_data = await self.extractor.get_movie_cast(movie_id)
-                
-                transformed_movie = self.transformer.transform_movie(movie_data, cast_data)
-                
-                if not self.transformer.validate_movie_data(transformed_movie):
-                    logger.warning(f"Данные фильма {movie_id} не прошли валидацию")
-                    job_status.failed_items += 1
-                    continue
-                
-                result = await self.postgres_loader.load_movie(transformed_movie)
-                if result:
-                    job_status.processed_items += 1
-                    await self._publish_movie_update(transformed_movie)
-                else:
-                    job_status.failed_items += 1
-                
-                await self._publish_job_status(job_status)
-                
-                await asyncio.sleep(0.5)
-                
-            except Exception as e:
-                logger.error(f"Ошибка обработки фильма {movie_id}: {e}")
-                job_status.failed_items += 1
+                await pipeline.run(source)
+            finally:
+                job_status.stages = pipeline.metrics()
+                self._pipelines.pop(job_id, None)
+        
+        if request.mode == "delta" and stages[0].failed:
+            # Пропущенные страницы ленты означают пропущенные изменения: задача завершается
+            # ошибкой, и курсор синхронизации не сдвигается
+            raise RuntimeError(f"Не получено страниц ленты изменений TMDB: {stages[0].failed}")
     
-    async def _process_popular_movies(self, job_id: str, page_start: int, page_end: int):
-        """Обработка популярных фильмов по страницам"""
-        job_status = self.jobs[job_id]
+    @staticmethod
+    async def _iterate(items):
+        for item in items:
+            yield item
+    
+    async def _resolve_delta_period(self, job_id: str, request: ETLJobRequest):
+        """
+        Фиксирует период дельты в сохраненном запросе задачи, чтобы продолжение после
+        остановки обходило ту же ленту изменений
+        """
+        if request.since and request.until:
+            return
+        today = date.today()
+        request.until = request.until or today.isoformat()
+        request.since = (
+            request.since
+            or await self.job_store.get_sync_cursor(CHANGES_CURSOR)
+            or (today - timedelta(days=config.ETL_DELTA_DEFAULT_DAYS)).isoformat()
+        )
+        await self.job_store.save_request(job_id, request)
+        logger.info(f"ETL задача {job_id}: изменения TMDB за {request.since} - {request.until}")
+    
+    async def _changes_source(self, request: ETLJobRequest, pending: List, pages_done: set):
+        """Страницы ленты изменений TMDB по периодам не длиннее CHANGES_MAX_DAYS дней"""
+        for item in pending:
+            yield item
         
-        all_movies = []
-        for page in range(page_start, page_end + 1):
-            movies = await self.extractor.get_popular_movies(page)
-            all_movies.extend(movies)
-            await asyncio.sleep(0.3)
+        start = date.fromisoformat(request.since)
+        until = date.fromisoformat(request.until)
+        while True:
+            end = min(start + timedelta(days=CHANGES_MAX_DAYS), until)
+            # Число страниц периода известно только из ответа; TMDBRequestError завершает задачу ошибкой
+            _, total_pages = await self.extractor.get_movie_changes(start.isoformat(), end.isoformat())
+            for page in range(1, total_pages + 1):
+                period_page = (start.isoformat(), end.isoformat(), page)
+                if self._page_label("changes", period_page) not in pages_done:
+                    yield ("changes", period_page)
+            if end >= until:
+                break
+            start = end
+    
+    @staticmethod
+    def _page_label(kind: str, value) -> str:
+        """Метка страницы в контрольной точке задачи"""
+        if kind == "changes":
+            return "changes:{}:{}:{}".format(*value)
+        return f"{kind}:{value}"
+    
+    def _pages_stage(self, job_status: ETLJobStatus, queued_ids: set) -> PipelineStage:
+        """
+        Страницы популярных фильмов или ленты изменений -> ID фильмов (повторы отбрасываются).
+        Фильмы, поставленные в очередь до перезапуска задачи, проходят стадию без запросов.
+        """
+        seen_ids = set(queued_ids)
         
-        job_status.total_items = len(all_movies)
-        await self._publish_job_status(job_status)
+        async def fetch_page(item) -> List[int]:
+            kind, value = item
+            if kind == "movie":
+                return [value]
+            # Ошибка получения страницы (TMDBRequestError) пробрасывается: страница не отмечается
+            # обработанной и учитывается в failed стадии
+            if kind == "changes":
+                page_ids, _ = await self.extractor.get_movie_changes(*value)
+            else:
+                page_ids = [movie.id for movie in await self.extractor.get_popular_movies(value)]
+            movie_ids = list(dict.fromkeys(movie_id for movie_id in page_ids if movie_id not in seen_ids))
+            if kind == "changes" and movie_ids:
+                # Лента изменений охватывает весь TMDB - обновляем только фильмы из нашего каталога
+                existing = await self.postgres_loader.get_existing_tmdb_ids(movie_ids)
+                movie_ids = [movie_id for movie_id in movie_ids if movie_id in existing]
+            seen_ids.update(movie_ids)
+            job_status.total_items += len(movie_ids)
+            await self.job_store.checkpoint_page(job_status, self._page_label(kind, value), movie_ids)
+            return movie_ids
         
-        batch_size = config.BATCH_SIZE
-        for i in range(0, len(all_movies), batch_size):
-            batch = all_movies[i:i + batch_size]
-            await self._process_movies_batch(job_id, batch)
+        return PipelineStage("pages", fetch_page, workers=config.ETL_PAGE_FETCHERS,
+                             queue_size=config.ETL_QUEUE_SIZE)
     
-    async def _process_movies_batch(self, job_id: str, movies_batch: List):
-        """Обработка пакета фильмов"""
-        job_status = self.jobs[job_id]
-        transformed_movies = []
+    def _movie_stages(self, job_status: ETLJobStatus, revalidate: bool = False) -> List[PipelineStage]:
+        """
+        ID фильма -> детали и актеры (TMDB) -> TransformedMovie -> пакетная загрузка в PostgreSQL.
+        Стадии работают одновременно: пока загружается пакет, следующий уже извлекается.
+        Каждый обработанный фильм отмечается в контрольной точке задачи.
+        """
         
-        for movie_data in movies_batch:
+        async def reject(movie_id: int):
+            job_status.failed_items += 1
+            await self.job_store.checkpoint_movies(job_status, [movie_id])
+        
+        async def fetch_details(movie_id: int):
+            movie_data, cast_data = await self.extractor.get_movie_with_cast(movie_id, revalidate=revalidate)
+            if not movie_data:
+                logger.warning(f"Не удалось получить данные фильма {movie_id}")
+                await reject(movie_id)
+                return None
+            return [(movie_data, cast_data)]
+        
+        async def transform(item) -> Optional[List[TransformedMovie]]:
+            movie_data, cast_data = item
             try:
-                detailed_movie = await self.extractor.get_movie_details(movie_data.id)
-                if not detailed_movie:
-                    job_status.failed_items += 1
-                    continue
-                
-                cast_data = await self.extractor.get_movie_cast(movie_data.id)
-                
-                transformed_movie = self.transformer.transform_movie(detailed_movie, cast_data)
-                
-                if self.transformer.validate_movie_data(transformed_movie):
-                    transformed_movies.append(transformed_movie)
-                else:
-                    job_status.failed_items += 1
-                
-                await asyncio.sleep(0.3)
-                
+                transformed_movie = self.transformer.transform_movie(movie_data, cast_data)
             except Exception as e:
                 logger.error(f"Ошибка обработки фильма {movie_data.id}: {e}")
-                job_status.failed_items += 1
+                await reject(movie_data.id)
+                return None
+            if not self.transformer.validate_movie_data(transformed_movie):
+                logger.warning(f"Данные фильма {movie_data.id} не прошли валидацию")
+                await reject(movie_data.id)
+                return None
+            return [transformed_movie]
         
-        if transformed_movies:
-            results = await self.postgres_loader.load_movies_batch(transformed_movies)
-            job_status.processed_items += results["success"]
+        async def load(movies: List[TransformedMovie]):
+            try:
+                results = await self.postgres_loader.load_movies_batch(movies)
+            except Exception:
+                # Ошибку логирует и учитывает в метриках стадии конвейер; фильмы не отмечаются
+                # обработанными и будут загружены повторно, если задачу продолжит другая реплика
+                job_status.failed_items += len(movies)
+                raise
+            # Повторы внутри пакета обработаны вместе с последней версией фильма
+            job_status.processed_items += results["success"] + results["skipped"]
             job_status.failed_items += results["failed"]
             
-            for movie in transformed_movies:
-                await self._publish_movie_update(movie)
+            # Событие об обновлении публикуется после пересчета похожих фильмов,
+            # чтобы main_service не закэшировал списки похожих по старому индексу.
+            # Для неизменившихся фильмов кэш не сбрасывается
+            await self._refresh_similarity_index(results["movie_ids"])
+            changed = set(results["changed_tmdb_ids"])
+            for movie in movies:
+                if movie.tmdb_id in changed:
+                    await self._publish_movie_update(movie)
+            
+            pipeline = self._pipelines.get(job_status.job_id)
+            if pipeline is not None:
+                job_status.stages = pipeline.metrics()
+            await self.job_store.checkpoint_movies(job_status, [movie.tmdb_id for movie in movies])
+            await self._publish_job_status(job_status)
         
-        await self._publish_job_status(job_status)
+        return [
+            PipelineStage("details", fetch_details, workers=config.ETL_DETAIL_FETCHERS,
+                          queue_size=config.ETL_QUEUE_SIZE),
+            PipelineStage("transform", transform, workers=config.ETL_TRANSFORMERS,
+                          queue_size=config.ETL_QUEUE_SIZE),
+            PipelineStage("load", load, workers=config.ETL_LOADERS,
+                          queue_size=config.ETL_QUEUE_SIZE, batch_size=config.BATCH_SIZE,
+                          flush_interval=config.ETL_BATCH_FLUSH_INTERVAL),
+        ]
+    
+    async def _refresh_similarity_index(self, movie_ids: List[int]):
+        """Инкрементальное обновление индекса похожих фильмов для загруженных фильмов"""
+        if not movie_ids:
+            return
+        try:
+            await self.similarity_builder.refresh_movies(movie_ids)
+        except Exception as e:
+            logger.error(f"Ошибка обновления индекса похожих фильмов: {e}")
+    
+    async def rebuild_similarity_index(self) -> int:
+        """Полное перестроение индекса похожих фильмов; main_service сбрасывает все кэши похожих"""
+        total = await self.similarity_builder.rebuild()
+        await self._publish_similarities_rebuilt()
+        return total
     
     async def _publish_job_status(self, job_status: ETLJobStatus):
         """Публикация статуса задачи в Redis"""
@@ -214,17 +452,41 @@ class ETLOrchestrator:
             except Exception as e:
                 logger.error(f"Ошибка публикации обновления фильма: {e}")
     
+    async def _publish_similarities_rebuilt(self):
+        """Публикация события о полном перестроении индекса похожих фильмов"""
+        if self.redis_client:
+            try:
+                await self.redis_client.publish(
+                    "movie_cache_update",
+                    json.dumps({"action": "similarities_rebuilt", "timestamp": datetime.now().isoformat()})
+                )
+            except Exception as e:
+                logger.error(f"Ошибка публикации перестроения индекса похожих фильмов: {e}")
+    
     async def get_all_jobs(self) -> List[ETLJobStatus]:
         """Получение всех ETL задач"""
-        return list(self.jobs.values())
+        statuses = await self.job_store.list_statuses()
+        # Для задач этой реплики - текущий статус, а не последняя контрольная точка
+        return [self.jobs.get(job_status.job_id, job_status) for job_status in statuses]
     
     async def cancel_job(self, job_id: str) -> bool:
-        """Отмена ETL задачи"""
-        if job_id in self.jobs:
-            job_status = self.jobs[job_id]
-            if job_status.status in ["pending", "running"]:
-                job_status.status = "cancelled"
-                job_status.completed_at = datetime.now().isoformat()
-                await self._publish_job_status(job_status)
-                return True
-        return False 
\ No newline at end of file
+        """Отмена ETL задачи: выполнение останавливается, где бы задача ни выполнялась"""
+        job_status = await self.get_job_status(job_id)
+        if job_status is None or job_status.status not in ACTIVE_STATUSES:
+            return False
+        
+        await self.job_store.request_cancel(job_id)
+        task = self._tasks.get(job_id)
+        if task is not None:
+            self._cancelled.add(job_id)
+            task.cancel()
+            return True
+        
+        # Задачу выполняет другая реплика - она увидит запрос при продлении аренды.
+        # Если аренды ни у кого нет, завершаем задачу сами
+        if await self.job_store.claim(job_id):
+            try:
+                await self._finish_cancelled(job_status)
+            finally:
+                await self.job_store.release(job_id)
+        return True
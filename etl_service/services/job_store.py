@@ -0,0 +1,204 @@
+import json
+import logging
+import time
+from typing import Iterable, List, Optional, Set, Tuple
+
+from etl_service.schemas.movie_schema import ETLJobRequest, ETLJobStatus
+
+logger = logging.getLogger(__name__)
+
+JOBS_KEY = "etl_jobs"
+ACTIVE_JOBS_KEY = "etl_jobs:active"
+
+# Продлевает аренду KEYS[1], только если она принадлежит ARGV[1]
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Снимает аренду KEYS[1], только если она принадлежит ARGV[1]
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Сдвигает курсор KEYS[1] на ARGV[1], только если он позже текущего (ISO-даты сравниваются как строки)
+ADVANCE_CURSOR_SCRIPT = """
+local current = redis.call('get', KEYS[1])
+if not current or ARGV[1] > current then
+    redis.call('set', KEYS[1], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+def sync_cursor_key(name: str) -> str:
+    return f"etl_sync:{name}"
+
+
+def job_key(job_id: str) -> str:
+    return f"etl_job:{job_id}"
+
+
+def lease_key(job_id: str) -> str:
+    return f"etl_job:{job_id}:lease"
+
+
+def pages_done_key(job_id: str) -> str:
+    return f"etl_job:{job_id}:pages_done"
+
+
+def movies_queued_key(job_id: str) -> str:
+    return f"etl_job:{job_id}:movies_queued"
+
+
+def movies_done_key(job_id: str) -> str:
+    return f"etl_job:{job_id}:movies_done"
+
+
+class ETLJobStore:
+    """
+    Состояние ETL задач в Redis.
+
+    etl_job:{id} - hash с запросом, статусом и флагом отмены; etl_jobs - история задач
+    (sorted set по времени запуска); etl_jobs:active - незавершенные задачи.
+    Контрольные точки: pages_done - страницы, ID фильмов которых уже записаны в movies_queued;
+    movies_done - фильмы, обработка которых завершена (загружены или отброшены).
+    Задачу выполняет реплика, держащая аренду etl_job:{id}:lease; аренда продлевается,
+    пока задача идет, и истекает, если реплика упала, - тогда задачу подхватит другая.
+    """
+
+    def __init__(self, redis_client, owner_id: str, lease_ttl: float, history_ttl: int):
+        self.redis_client = redis_client
+        self.owner_id = owner_id
+        self.lease_ttl_ms = int(lease_ttl * 1000)
+        self.history_ttl = history_ttl
+        self._renew = redis_client.register_script(RENEW_SCRIPT)
+        self._release = redis_client.register_script(RELEASE_SCRIPT)
+        self._advance_cursor = redis_client.register_script(ADVANCE_CURSOR_SCRIPT)
+
+    async def create(self, job_status: ETLJobStatus, request: ETLJobRequest):
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(job_key(job_status.job_id), mapping={
+                "status": job_status.json(),
+                "request": request.json()
+            })
+            pipe.zadd(JOBS_KEY, {job_status.job_id: time.time()})
+            pipe.sadd(ACTIVE_JOBS_KEY, job_status.job_id)
+            await pipe.execute()
+
+    async def save_request(self, job_id: str, request: ETLJobRequest):
+        await self.redis_client.hset(job_key(job_id), "request", request.json())
+
+    async def save_status(self, job_status: ETLJobStatus):
+        await self.redis_client.hset(job_key(job_status.job_id), "status", job_status.json())
+
+    async def get_status(self, job_id: str) -> Optional[ETLJobStatus]:
+        data = await self.redis_client.hget(job_key(job_id), "status")
+        return ETLJobStatus(**json.loads(data)) if data else None
+
+    async def get_request(self, job_id: str) -> Optional[ETLJobRequest]:
+        data = await self.redis_client.hget(job_key(job_id), "request")
+        return ETLJobRequest(**json.loads(data)) if data else None
+
+    async def list_statuses(self) -> List[ETLJobStatus]:
+        """Все задачи, новые первыми; задачи с истекшей историей удаляются из списка"""
+        job_ids = await self.redis_client.zrevrange(JOBS_KEY, 0, -1)
+        if not job_ids:
+            return []
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                pipe.hget(job_key(job_id), "status")
+            values = await pipe.execute()
+
+        statuses, expired = [], []
+        for job_id, data in zip(job_ids, values):
+            if data:
+                statuses.append(ETLJobStatus(**json.loads(data)))
+            else:
+                expired.append(job_id)
+        if expired:
+            await self.redis_client.zrem(JOBS_KEY, *expired)
+        return statuses
+
+    async def active_job_ids(self) -> List[str]:
+        return list(await self.redis_client.smembers(ACTIVE_JOBS_KEY))
+
+    async def get_checkpoints(self, job_id: str) -> Tuple[Set[str], Set[int], Set[int]]:
+        """(метки обработанных страниц, ID фильмов в очереди, обработанные ID фильмов)"""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.smembers(pages_done_key(job_id))
+            pipe.smembers(movies_queued_key(job_id))
+            pipe.smembers(movies_done_key(job_id))
+            pages, queued, done = await pipe.execute()
+        return set(pages), {int(m) for m in queued}, {int(m) for m in done}
+
+    async def checkpoint_page(self, job_status: ETLJobStatus, page: str, movie_ids: Iterable[int]):
+        """Страница разобрана: ее фильмы в очереди задачи, повторно страница не запрашивается"""
+        movie_ids = list(movie_ids)
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            if movie_ids:
+                pipe.sadd(movies_queued_key(job_status.job_id), *movie_ids)
+            pipe.sadd(pages_done_key(job_status.job_id), page)
+            pipe.hset(job_key(job_status.job_id), "status", job_status.json())
+            await pipe.execute()
+
+    async def queue_movies(self, job_id: str, movie_ids: Iterable[int]):
+        movie_ids = list(movie_ids)
+        if movie_ids:
+            await self.redis_client.sadd(movies_queued_key(job_id), *movie_ids)
+
+    async def checkpoint_movies(self, job_status: ETLJobStatus, movie_ids: Iterable[int]):
+        """Фильмы обработаны (загружены или отброшены) вместе со счетчиками в статусе задачи"""
+        movie_ids = list(movie_ids)
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            if movie_ids:
+                pipe.sadd(movies_done_key(job_status.job_id), *movie_ids)
+            pipe.hset(job_key(job_status.job_id), "status", job_status.json())
+            await pipe.execute()
+
+    async def finish(self, job_status: ETLJobStatus):
+        """Итоговый статус; контрольные точки удаляются, история хранится history_ttl"""
+        job_id = job_status.job_id
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(job_key(job_id), "status", job_status.json())
+            pipe.expire(job_key(job_id), self.history_ttl)
+            pipe.srem(ACTIVE_JOBS_KEY, job_id)
+            pipe.delete(pages_done_key(job_id), movies_queued_key(job_id), movies_done_key(job_id))
+            await pipe.execute()
+
+    async def get_sync_cursor(self, name: str) -> Optional[str]:
+        """Момент, до которого источник синхронизирован (например, лента изменений TMDB)"""
+        return await self.redis_client.get(sync_cursor_key(name))
+
+    async def set_sync_cursor(self, name: str, value: str):
+        await self.redis_client.set(sync_cursor_key(name), value)
+
+    async def advance_sync_cursor(self, name: str, value: str) -> bool:
+        """
+        Сдвигает курсор только вперед: синхронизация за прошлый период (например, повторная
+        с явным until) не должна откатывать его назад
+        """
+        return bool(await self._advance_cursor(keys=[sync_cursor_key(name)], args=[value]))
+
+    async def request_cancel(self, job_id: str):
+        await self.redis_client.hset(job_key(job_id), "cancel", 1)
+
+    async def is_cancel_requested(self, job_id: str) -> bool:
+        return bool(await self.redis_client.hexists(job_key(job_id), "cancel"))
+
+    async def claim(self, job_id: str) -> bool:
+        """Берет аренду задачи, если ее никто не держит"""
+        return bool(await self.redis_client.set(lease_key(job_id), self.owner_id, nx=True, px=self.lease_ttl_ms))
+
+    async def renew(self, job_id: str) -> bool:
+        """Продлевает аренду; False - аренда истекла и, возможно, уже у другой реплики"""
+        return bool(await self._renew(keys=[lease_key(job_id)], args=[self.owner_id, self.lease_ttl_ms]))
+
+    async def release(self, job_id: str):
+        await self._release(keys=[lease_key(job_id)], args=[self.owner_id])
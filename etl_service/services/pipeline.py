@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+Handler = Callable[[Any], Awaitable[Optional[Iterable[Any]]]]
+
+
+class PipelineStage:
+    """
+    Стадия конвейера: workers обработчиков читают элементы из ограниченной очереди.
+
+    Обработчик возвращает элементы для следующей стадии (или None). Если следующая
+    стадия не успевает, ее очередь заполняется и обработчики этой стадии ждут
+    (backpressure), поэтому память конвейера ограничена суммой размеров очередей.
+    С batch_size обработчик получает список до batch_size элементов; неполный
+    пакет отдается, если новых элементов нет flush_interval секунд, и в конце.
+    """
+
+    def __init__(self, name: str, handler: Handler, workers: int = 1, queue_size: int = 100,
+                 batch_size: Optional[int] = None, flush_interval: float = 1.0):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+        self.processed = 0
+        self.failed = 0
+        self.emitted = 0
+        self.busy_seconds = 0.0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def metrics(self) -> Dict[str, Any]:
+        """Пропускная способность, загрузка обработчиков и заполненность очереди"""
+        if self.started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "processed": self.processed,
+            "failed": self.failed,
+            "emitted": self.emitted,
+            "throughput_per_sec": round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+            "utilization": round(self.busy_seconds / (elapsed * self.workers), 3) if elapsed > 0 else 0.0,
+        }
+
+    async def _handle(self, item: Any, output: Optional[asyncio.Queue]):
+        started = time.monotonic()
+        try:
+            results = await self.handler(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += len(item) if self.batch_size else 1
+            logger.error(f"[{self.name}] Ошибка обработки: {e}")
+            return
+        finally:
+            self.busy_seconds += time.monotonic() - started
+        self.processed += len(item) if self.batch_size else 1
+        if results is None or output is None:
+            return
+        for result in results:
+            self.emitted += 1
+            await output.put(result)
+
+    async def _worker(self, output: Optional[asyncio.Queue]):
+        if self.batch_size:
+            await self._batch_worker(output)
+            return
+        while True:
+            item = await self.queue.get()
+            if item is _END:
+                return
+            await self._handle(item, output)
+
+    async def _batch_worker(self, output: Optional[asyncio.Queue]):
+        batch: List[Any] = []
+        while True:
+            try:
+                timeout = self.flush_interval if batch else None
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if item is _END:
+                if batch:
+                    await self._handle(batch, output)
+                return
+            if item is not None:
+                batch.append(item)
+            if batch and (item is None or len(batch) >= self.batch_size):
+                await self._handle(batch, output)
+                batch = []
+
+
+class Pipeline:
+    """Цепочка стадий, связанных ограниченными очередями; стадии работают одновременно"""
+
+    def __init__(self, stages: List[PipelineStage]):
+        self.stages = stages
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {stage.name: stage.metrics() for stage in self.stages}
+
+    async def run(self, source: AsyncIterable[Any]):
+        """Подает элементы source в первую стадию и ждет, пока конвейер обработает все"""
+        tasks = [asyncio.create_task(self._feed(source))]
+        for index, stage in enumerate(self.stages):
+            output = self.stages[index + 1].queue if index + 1 < len(self.stages) else None
+            next_stage = self.stages[index + 1] if output is not None else None
+            tasks.append(asyncio.create_task(self._run_stage(stage, output, next_stage)))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _feed(self, source: AsyncIterable[Any]):
+        first = self.stages[0]
+        async for item in source:
+            await first.queue.put(item)
+        for _ in range(first.workers):
+            await first.queue.put(_END)
+
+    async def _run_stage(self, stage: PipelineStage, output: Optional[asyncio.Queue],
+                         next_stage: Optional[PipelineStage]):
+        stage.started_at = time.monotonic()
+        await asyncio.gather(*(stage._worker(output) for _ in range(stage.workers)))
+        stage.finished_at = time.monotonic()
+        # Все обработчики стадии завершились - сообщаем об окончании следующей
+        if next_stage is not None:
+            for _ in range(next_stage.workers):
+                await next_stage.queue.put(_END)
@@ -1,6 +1,8 @@
+import hashlib
+import json
 import logging
 import asyncio
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set, Tuple
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import text, select, insert, update
@@ -9,6 +11,22 @@ from etl_service.schemas.movie_schema import TransformedMovie
 
 logger = logging.getLogger(__name__)
 
+def movie_content_hash(movie: TransformedMovie) -> str:
+    """Хэш всего, что загрузчик записывает о фильме: полей, жанров и актеров"""
+    content = {
+        "title": movie.title,
+        "description": movie.description,
+        "release_date": movie.release_date.isoformat() if movie.release_date else None,
+        "duration": movie.duration,
+        "rating": movie.rating,
+        "poster_url": movie.poster_url,
+        "trailer_url": movie.trailer_url,
+        "genres": list(dict.fromkeys(movie.genres)),
+        "actors": [[actor["tmdb_id"], actor["name"], actor["character"], actor["photo_url"]]
+                   for actor in movie.actors],
+    }
+    return hashlib.sha256(json.dumps(content, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
 class PostgresLoader:
     """Сервис для загрузки данных в PostgreSQL"""
     
@@ -35,195 +53,266 @@ class PostgresLoader:
         
         async with self.async_session() as session:
             try:
-                existing_query = text("""
-                    SELECT id FROM movies WHERE tmdb_id = :tmdb_id
-                """)
-                result = await session.execute(existing_query, {"tmdb_id": movie.tmdb_id})
-                existing_movie = result.fetchone()
-                
-                if existing_movie:
-                    movie_id = existing_movie[0]
-                    await self._update_movie(session, movie_id, movie)
-                    logger.info(f"Фильм обновлен: {movie.title} (ID: {movie_id})")
-                else:
-                    movie_id = await self._create_movie(session, movie)
-                    logger.info(f"Фильм создан: {movie.title} (ID: {movie_id})")
-                
-                if movie.actors:
-                    await self._load_actors(session, movie_id, movie.actors)
-                
-                if movie.genres:
-                    await self._load_genres(session, movie_id, movie.genres)
-                
+                loaded = await self._upsert_movies(session, [movie])
                 await session.commit()
-                return movie_id
-                
+                return loaded[movie.tmdb_id][0]
             except Exception as e:
                 await session.rollback()
                 logger.error(f"Ошибка загрузки фильма '{movie.title}': {e}")
                 return None
     
-    async def _create_movie(self, session: AsyncSession, movie: TransformedMovie) -> int:
-        """Создание нового фильма"""
-        insert_query = text("""
-            INSERT INTO movies (
-                tmdb_id, title, description, release_date, duration, 
-                rating, poster_url, trailer_url, movie_url, created_at, updated_at
-            ) VALUES (
-                :tmdb_id, :title, :description, :release_date, :duration,
-                :rating, :poster_url, :trailer_url, :movie_url, NOW(), NOW()
-            ) RETURNING id
-        """)
-        
-        result = await session.execute(insert_query, {
-            "tmdb_id": movie.tmdb_id,
-            "title": movie.title,
-            "description": movie.description,
-            "release_date": movie.release_date,
-            "duration": movie.duration,
-            "rating": movie.rating,
-            "poster_url": movie.poster_url,
-            "trailer_url": movie.trailer_url,
-            "movie_url": movie.movie_url
-        })
-        
-        return result.fetchone()[0]
-    
-    async def _update_movie(self, session: AsyncSession, movie_id: int, movie: TransformedMovie):
-        """Обновление существующего фильма"""
-        update_query = text("""
-            UPDATE movies SET
-                title = :title,
-                description = :description,
-                release_date = :release_date,
-                duration = :duration,
-                rating = :rating,
-                poster_url = :poster_url,
-                trailer_url = :trailer_url,
-                updated_at = NOW()
-            WHERE id = :movie_id
-        """)
-        
-        await session.execute(update_query, {
-            "movie_id": movie_id,
-            "title": movie.title,
-            "description": movie.description,
-            "release_date": movie.release_date,
-            "duration": movie.duration,
-            "rating": movie.rating,
-            "poster_url": movie.poster_url,
-            "trailer_url": movie.trailer_url
-        })
-    
-    async def _load_actors(self, session: AsyncSession, movie_id: int, actors: List[Dict]):
-        """Загрузка актеров фильма"""
-        logger.info(f"Загрузка {len(actors)} актеров для фильма {movie_id}")
-        
-        delete_query = text("DELETE FROM movie_actors WHERE movie_id = :movie_id")
-        await session.execute(delete_query, {"movie_id": movie_id})
-        
-        for actor_data in actors:
-            actor_query = text("SELECT id FROM actors WHERE tmdb_id = :tmdb_id")
-            result = await session.execute(actor_query, {"tmdb_id": actor_data["tmdb_id"]})
-            existing_actor = result.fetchone()
-            
-            if existing_actor:
-                actor_id = existing_actor[0]
-                update_actor_query = text("""
-                    UPDATE actors SET 
-                        name = :name,
-                        photo_url = :photo_url,
-                        updated_at = NOW()
-                    WHERE id = :actor_id
-                """)
-                await session.execute(update_actor_query, {
-                    "actor_id": actor_id,
-                    "name": actor_data["name"],
-                    "photo_url": actor_data["photo_url"]
-                })
-            else:
-                insert_actor_query = text("""
-                    INSERT INTO actors (tmdb_id, name, photo_url, created_at, updated_at)
-                    VALUES (:tmdb_id, :name, :photo_url, NOW(), NOW())
-                    RETURNING id
-                """)
-                result = await session.execute(insert_actor_query, {
-                    "tmdb_id": actor_data["tmdb_id"],
-                    "name": actor_data["name"],
-                    "photo_url": actor_data["photo_url"]
-                })
-                actor_id = result.fetchone()[0]
-            
-            insert_movie_actor_query = text("""
-                INSERT INTO movie_actors (movie_id, actor_id, role_name)
-                VALUES (:movie_id, :actor_id, :role_name)
-                ON CONFLICT (movie_id, actor_id) DO UPDATE SET
-                    role_name = EXCLUDED.role_name
-            """)
-            await session.execute(insert_movie_actor_query, {
-                "movie_id": movie_id,
-                "actor_id": actor_id,
-                "role_name": actor_data["character"]
-            })
-    
-    async def _load_genres(self, session: AsyncSession, movie_id: int, genres: List[str]):
-        """Загрузка жанров фильма"""
-        logger.info(f"Загрузка {len(genres)} жанров для фильма {movie_id}")
-        
-        delete_query = text("DELETE FROM movie_genres WHERE movie_id = :movie_id")
-        await session.execute(delete_query, {"movie_id": movie_id})
-        
-        for genre_name in genres:
-            genre_query = text("SELECT id FROM genres WHERE name = :name")
-            result = await session.execute(genre_query, {"name": genre_name})
-            existing_genre = result.fetchone()
-            
-            if existing_genre:
-                genre_id = existing_genre[0]
-            else:
-                insert_genre_query = text("""
-                    INSERT INTO genres (name, created_at, updated_at)
-                    VALUES (:name, NOW(), NOW())
-                    RETURNING id
-                """)
-                result = await session.execute(insert_genre_query, {"name": genre_name})
-                genre_id = result.fetchone()[0]
-            
-            insert_movie_genre_query = text("""
-                INSERT INTO movie_genres (movie_id, genre_id)
-                VALUES (:movie_id, :genre_id)
-                ON CONFLICT (movie_id, genre_id) DO NOTHING
-            """)
-            await session.execute(insert_movie_genre_query, {
-                "movie_id": movie_id,
-                "genre_id": genre_id
-            })
-    
-    async def load_movies_batch(self, movies: List[TransformedMovie]) -> Dict[str, int]:
-        """Загрузка пакета фильмов"""
+    async def load_movies_batch(self, movies: List[TransformedMovie]) -> Dict[str, Any]:
+        """
+        Загрузка пакета фильмов несколькими множественными запросами (см. _upsert_movies).
+        Если пакет целиком не загрузился, фильмы загружаются по одному, чтобы отделить сбойные.
+        movie_ids и changed_tmdb_ids - только созданные и измененные фильмы;
+        skipped - повторы tmdb_id внутри пакета (загружается последняя версия, это не ошибка).
+        """
         logger.info(f"Загрузка пакета из {len(movies)} фильмов")
         
         results = {
             "success": 0,
             "failed": 0,
             "updated": 0,
-            "created": 0
+            "created": 0,
+            "unchanged": 0,
+            "skipped": 0,
+            "movie_ids": [],
+            "changed_tmdb_ids": []
         }
         
-        for movie in movies:
+        # При повторе tmdb_id в пакете остается последняя версия фильма
+        unique_movies = list({movie.tmdb_id: movie for movie in movies}.values())
+        
+        async with self.async_session() as session:
             try:
-                movie_id = await self.load_movie(movie)
-                if movie_id:
-                    results["success"] += 1
-                else:
-                    results["failed"] += 1
+                loaded = await self._upsert_movies(session, unique_movies)
+                await session.commit()
             except Exception as e:
-                logger.error(f"Ошибка загрузки фильма '{movie.title}': {e}")
+                await session.rollback()
+                logger.error(f"Ошибка загрузки пакета, загружаем фильмы по одному: {e}")
+                loaded = None
+        
+        if loaded is None:
+            loaded = {}
+            for movie in unique_movies:
+                async with self.async_session() as session:
+                    try:
+                        loaded.update(await self._upsert_movies(session, [movie]))
+                        await session.commit()
+                    except Exception as e:
+                        await session.rollback()
+                        logger.error(f"Ошибка загрузки фильма '{movie.title}': {e}")
+        
+        for movie in unique_movies:
+            if movie.tmdb_id in loaded:
+                movie_id, state = loaded[movie.tmdb_id]
+                results["success"] += 1
+                results[state] += 1
+                if state != "unchanged":
+                    results["movie_ids"].append(movie_id)
+                    results["changed_tmdb_ids"].append(movie.tmdb_id)
+            else:
                 results["failed"] += 1
+        results["skipped"] += len(movies) - len(unique_movies)
         
         logger.info(f"Результаты загрузки пакета: {results}")
         return results
     
+    async def _upsert_movies(self, session: AsyncSession,
+                             movies: List[TransformedMovie]) -> Dict[int, Tuple[int, str]]:
+        """
+        Upsert фильмов, актеров, жанров и связей за фиксированное число запросов
+        (массивы через unnest + ON CONFLICT), независимо от размера пакета.
+        Фильмы, хэш содержимого которых не изменился, не записываются вовсе; у остальных
+        меняются только отличающиеся строки связей.
+        Возвращает {tmdb_id: (id фильма, "created" | "updated" | "unchanged")}.
+        Транзакцию фиксирует вызывающий.
+        """
+        hashes = {movie.tmdb_id: movie_content_hash(movie) for movie in movies}
+        existing = await session.execute(text("""
+            SELECT id, tmdb_id, content_hash FROM movies
+            WHERE tmdb_id = ANY(CAST(:tmdb_ids AS integer[]))
+        """), {"tmdb_ids": list(hashes)})
+        loaded = {row.tmdb_id: (row.id, "unchanged") for row in existing
+                  if row.content_hash == hashes[row.tmdb_id]}
+        movies = [movie for movie in movies if movie.tmdb_id not in loaded]
+        if not movies:
+            return loaded
+        
+        movie_rows = await session.execute(text("""
+            INSERT INTO movies (
+                tmdb_id, title, description, release_date, duration,
+                rating, poster_url, trailer_url, movie_url, content_hash, created_at, updated_at
+            )
+            SELECT tmdb_id, title, description, release_date, duration,
+                   rating, poster_url, trailer_url, movie_url, content_hash, NOW(), NOW()
+            FROM unnest(
+                CAST(:tmdb_ids AS integer[]), CAST(:titles AS varchar[]), CAST(:descriptions AS text[]),
+                CAST(:release_dates AS date[]), CAST(:durations AS integer[]), CAST(:ratings AS float8[]),
+                CAST(:poster_urls AS varchar[]), CAST(:trailer_urls AS varchar[]), CAST(:movie_urls AS varchar[]),
+                CAST(:content_hashes AS varchar[])
+            ) AS m(tmdb_id, title, description, release_date, duration,
+                   rating, poster_url, trailer_url, movie_url, content_hash)
+            ON CONFLICT (tmdb_id) DO UPDATE SET
+                title = EXCLUDED.title,
+                description = EXCLUDED.description,
+                release_date = EXCLUDED.release_date,
+                duration = EXCLUDED.duration,
+                rating = EXCLUDED.rating,
+                poster_url = EXCLUDED.poster_url,
+                trailer_url = EXCLUDED.trailer_url,
+                content_hash = EXCLUDED.content_hash,
+                updated_at = NOW()
+            RETURNING id, tmdb_id, (xmax = 0) AS created
+        """), {
+            "tmdb_ids": [movie.tmdb_id for movie in movies],
+            "titles": [movie.title for movie in movies],
+            "descriptions": [movie.description for movie in movies],
+            "release_dates": [movie.release_date for movie in movies],
+            "durations": [movie.duration for movie in movies],
+            "ratings": [movie.rating for movie in movies],
+            "poster_urls": [movie.poster_url for movie in movies],
+            "trailer_urls": [movie.trailer_url for movie in movies],
+            "movie_urls": [movie.movie_url for movie in movies],
+            "content_hashes": [hashes[movie.tmdb_id] for movie in movies],
+        })
+        written = {row.tmdb_id: (row.id, "created" if row.created else "updated") for row in movie_rows}
+        movie_ids = [written[movie.tmdb_id][0] for movie in movies]
+        
+        actor_ids = await self._upsert_actors(session, movies)
+        genre_ids = await self._upsert_genres(session, movies)
+        
+        link_movie_ids, link_actor_ids, role_names, orders = [], [], [], []
+        for movie, movie_id in zip(movies, movie_ids):
+            seen = set()
+            for order, actor in enumerate(movie.actors):
+                if actor["tmdb_id"] in seen:
+                    continue
+                seen.add(actor["tmdb_id"])
+                link_movie_ids.append(movie_id)
+                link_actor_ids.append(actor_ids[actor["tmdb_id"]])
+                role_names.append(actor["character"])
+                orders.append(order)
+        
+        # Удаляются только исчезнувшие связи, меняются только отличающиеся
+        actor_links = {"batch_movie_ids": movie_ids, "movie_ids": link_movie_ids, "actor_ids": link_actor_ids,
+                       "role_names": role_names, "orders": orders}
+        await session.execute(text("""
+            DELETE FROM movie_actors
+            WHERE movie_id = ANY(CAST(:batch_movie_ids AS integer[]))
+              AND (movie_id, actor_id) NOT IN (
+                  SELECT * FROM unnest(CAST(:movie_ids AS integer[]), CAST(:actor_ids AS integer[]))
+              )
+        """), actor_links)
+        if link_movie_ids:
+            await session.execute(text("""
+                INSERT INTO movie_actors (movie_id, actor_id, role_name, "order")
+                SELECT * FROM unnest(
+                    CAST(:movie_ids AS integer[]), CAST(:actor_ids AS integer[]),
+                    CAST(:role_names AS varchar[]), CAST(:orders AS integer[])
+                )
+                ON CONFLICT (movie_id, actor_id) DO UPDATE SET
+                    role_name = EXCLUDED.role_name,
+                    "order" = EXCLUDED."order"
+                WHERE (movie_actors.role_name, movie_actors."order")
+                      IS DISTINCT FROM (EXCLUDED.role_name, EXCLUDED."order")
+            """), actor_links)
+        
+        genre_movie_ids, genre_link_ids = [], []
+        for movie, movie_id in zip(movies, movie_ids):
+            for genre_name in dict.fromkeys(movie.genres):
+                genre_movie_ids.append(movie_id)
+                genre_link_ids.append(genre_ids[genre_name])
+        
+        genre_links = {"batch_movie_ids": movie_ids, "movie_ids": genre_movie_ids, "genre_ids": genre_link_ids}
+        await session.execute(text("""
+            DELETE FROM movie_genres
+            WHERE movie_id = ANY(CAST(:batch_movie_ids AS integer[]))
+              AND (movie_id, genre_id) NOT IN (
+                  SELECT * FROM unnest(CAST(:movie_ids AS integer[]), CAST(:genre_ids AS integer[]))
+              )
+        """), genre_links)
+        if genre_movie_ids:
+            await session.execute(text("""
+                INSERT INTO movie_genres (movie_id, genre_id)
+                SELECT * FROM unnest(CAST(:movie_ids AS integer[]), CAST(:genre_ids AS integer[]))
+                ON CONFLICT (movie_id, genre_id) DO NOTHING
+            """), genre_links)
+        
+        logger.info(f"Загружено фильмов: {len(movies)} (без изменений: {len(loaded)}), актеров: {len(actor_ids)}, "
+                    f"связей с актерами: {len(link_movie_ids)}, связей с жанрами: {len(genre_movie_ids)}")
+        loaded.update(written)
+        return loaded
+    
+    async def _upsert_actors(self, session: AsyncSession, movies: List[TransformedMovie]) -> Dict[int, int]:
+        """Upsert всех актеров пакета одним запросом, возвращает {tmdb_id: id}"""
+        actors = {}
+        for movie in movies:
+            for actor in movie.actors:
+                actors[actor["tmdb_id"]] = actor
+        if not actors:
+            return {}
+        
+        # Актеры без изменений не перезаписываются; их id берутся из снимка таблицы
+        result = await session.execute(text("""
+            WITH input AS (
+                SELECT * FROM unnest(
+                    CAST(:tmdb_ids AS integer[]), CAST(:names AS varchar[]), CAST(:photo_urls AS varchar[])
+                ) AS a(tmdb_id, name, photo_url)
+            ), upserted AS (
+                INSERT INTO actors (tmdb_id, name, photo_url, created_at, updated_at)
+                SELECT tmdb_id, name, photo_url, NOW(), NOW() FROM input
+                ON CONFLICT (tmdb_id) DO UPDATE SET
+                    name = EXCLUDED.name,
+                    photo_url = EXCLUDED.photo_url,
+                    updated_at = NOW()
+                WHERE (actors.name, actors.photo_url) IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.photo_url)
+                RETURNING id, tmdb_id
+            )
+            SELECT id, tmdb_id FROM upserted
+            UNION
+            SELECT actors.id, actors.tmdb_id FROM actors JOIN input ON actors.tmdb_id = input.tmdb_id
+        """), {
+            "tmdb_ids": list(actors),
+            "names": [actor["name"] for actor in actors.values()],
+            "photo_urls": [actor["photo_url"] for actor in actors.values()],
+        })
+        return {row.tmdb_id: row.id for row in result}
+    
+    async def _upsert_genres(self, session: AsyncSession, movies: List[TransformedMovie]) -> Dict[str, int]:
+        """Создание недостающих жанров пакета и получение id всех его жанров одним запросом"""
+        names = list(dict.fromkeys(genre for movie in movies for genre in movie.genres))
+        if not names:
+            return {}
+        
+        # Вставленные строки не видны основному SELECT из genres (общий снимок), поэтому дублей нет
+        result = await session.execute(text("""
+            WITH input AS (
+                SELECT unnest(CAST(:names AS varchar[])) AS name
+            ), inserted AS (
+                INSERT INTO genres (name, created_at, updated_at)
+                SELECT name, NOW(), NOW() FROM input
+                ON CONFLICT (name) DO NOTHING
+                RETURNING id, name
+            )
+            SELECT id, name FROM inserted
+            UNION ALL
+            SELECT genres.id, genres.name FROM genres JOIN input ON genres.name = input.name
+        """), {"names": names})
+        return {row.name: row.id for row in result}
+    
+    async def get_existing_tmdb_ids(self, tmdb_ids: List[int]) -> Set[int]:
+        """TMDB ID из списка, фильмы с которыми уже есть в каталоге"""
+        if not tmdb_ids:
+            return set()
+        async with self.async_session() as session:
+            result = await session.execute(
+                text("SELECT tmdb_id FROM movies WHERE tmdb_id = ANY(CAST(:tmdb_ids AS integer[]))"),
+                {"tmdb_ids": list(tmdb_ids)}
+            )
+            return {row.tmdb_id for row in result}
+    
     async def get_movie_by_tmdb_id(self, tmdb_id: int) -> Optional[Dict]:
         """Получение фильма по TMDB ID"""
         async with self.async_session() as session:
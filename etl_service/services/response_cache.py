@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from etl_service.config import config
+
+logger = logging.getLogger(__name__)
+
+# Параметры, не влияющие на ответ: в ключ кэша не входят
+IGNORED_PARAMS = {"api_key"}
+
+
+@dataclass
+class CachedResponse:
+    key: str
+    body: Any
+    etag: Optional[str]
+    last_modified: Optional[str]
+    expires_at: float
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Заголовки для перепроверки устаревшей записи (ответ 304 - запись актуальна)"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+def cache_key(endpoint: str, params: Optional[Dict[str, Any]]) -> str:
+    params = {name: value for name, value in (params or {}).items() if name not in IGNORED_PARAMS}
+    raw = json.dumps([endpoint, params], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def ttl_for_endpoint(endpoint: str) -> int:
+    """Справочники живут долго, списки и лента изменений - недолго, карточки фильмов - сутки"""
+    if endpoint.startswith("genre/"):
+        return config.TMDB_CACHE_STATIC_TTL
+    if endpoint in ("movie/popular", "movie/changes") or endpoint.startswith("search/"):
+        return config.TMDB_CACHE_LIST_TTL
+    return config.TMDB_CACHE_TTL
+
+
+class TMDBResponseCache:
+    """
+    Кэш ответов TMDB на диске (SQLite), ключ - endpoint и параметры запроса без api_key.
+
+    Свежая запись возвращается без запроса. Устаревшая перепроверяется условным запросом
+    (If-None-Match / If-Modified-Since): на 304 срок записи продлевается, тело не скачивается.
+    Режим offline отдает записи независимо от срока и никогда не обращается к сети -
+    так ETL можно прогнать на сохраненных ответах без ключа API.
+    """
+
+    def __init__(self, path: str, offline: bool = False):
+        self.path = path
+        self.offline = offline
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                params TEXT NOT NULL,
+                body TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls) -> Optional["TMDBResponseCache"]:
+        """Кэш по настройкам TMDB_CACHE_*; None, если кэш выключен"""
+        if config.TMDB_CACHE_MODE == "off":
+            return None
+        return cls(config.TMDB_CACHE_PATH, offline=config.TMDB_CACHE_MODE == "offline")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    async def get(self, endpoint: str, params: Optional[Dict[str, Any]]) -> Optional[CachedResponse]:
+        return await asyncio.to_thread(self._get, cache_key(endpoint, params))
+
+    async def put(self, endpoint: str, params: Optional[Dict[str, Any]], body: Any,
+                  etag: Optional[str] = None, last_modified: Optional[str] = None):
+        await asyncio.to_thread(self._put, endpoint, params, body, etag, last_modified)
+
+    async def refresh(self, entry: CachedResponse, endpoint: str):
+        """Запись подтверждена ответом 304: продлеваем срок"""
+        entry.expires_at = time.time() + ttl_for_endpoint(endpoint)
+        await asyncio.to_thread(self._refresh, entry.key, entry.expires_at)
+
+    def _get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return CachedResponse(key=key, body=json.loads(row[0]), etag=row[1],
+                              last_modified=row[2], expires_at=row[3])
+
+    def _put(self, endpoint: str, params: Optional[Dict[str, Any]], body: Any,
+             etag: Optional[str], last_modified: Optional[str]):
+        now = time.time()
+        stored_params = {name: value for name, value in (params or {}).items() if name not in IGNORED_PARAMS}
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO responses
+                    (key, endpoint, params, body, etag, last_modified, fetched_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (cache_key(endpoint, params), endpoint, json.dumps(stored_params, sort_keys=True, default=str),
+                  json.dumps(body, ensure_ascii=False), etag, last_modified, now, now + ttl_for_endpoint(endpoint)))
+            self._conn.commit()
+
+    def _refresh(self, key: str, expires_at: float):
+        with self._lock:
+            self._conn.execute("UPDATE responses SET expires_at = ? WHERE key = ?", (expires_at, key))
+            self._conn.commit()
@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Iterable, Optional
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.metrics.pairwise import cosine_similarity
+from sqlalchemy import text
+from etl_service.config import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MovieFeatures:
+    """Векторные признаки всех фильмов каталога"""
+    movie_ids: np.ndarray  # id фильмов, порядок строк матриц
+    row_by_id: Dict[int, int]
+    genres: csr_matrix  # multi-hot по жанрам
+    cast: csr_matrix  # multi-hot по актерам
+    ratings: np.ndarray
+    years: np.ndarray  # NaN, если дата выхода неизвестна
+    genre_columns: Dict[int, int]  # id жанра -> столбец genres
+    cast_columns: Dict[int, int]  # id актера -> столбец cast
+    loaded_at: float
+
+
+class SimilarityIndexBuilder:
+    """Построение таблицы movie_similarities: top-K похожих фильмов для каждого фильма"""
+
+    # Веса составляющих итоговой оценки похожести
+    GENRE_WEIGHT = 0.45
+    CAST_WEIGHT = 0.30
+    RATING_WEIGHT = 0.15
+    YEAR_WEIGHT = 0.10
+    # Масштаб (в годах), на котором близость по году выхода падает в e раз
+    YEAR_SCALE = 10.0
+
+    def __init__(self, async_session, top_k: int = config.SIMILARITY_TOP_K,
+                 chunk_size: int = config.SIMILARITY_CHUNK_SIZE,
+                 features_ttl: float = config.SIMILARITY_FEATURES_TTL):
+        self.async_session = async_session
+        self.top_k = top_k
+        self.chunk_size = chunk_size
+        self.features_ttl = features_ttl
+        # Признаки каталога между вызовами: refresh_movies дочитывает только измененные фильмы
+        self._features: Optional[MovieFeatures] = None
+        self._lock = asyncio.Lock()
+
+    async def rebuild(self) -> int:
+        """Полное перестроение индекса. Возвращает количество обработанных фильмов"""
+        async with self._lock, self.async_session() as session:
+            features = self._features = await self._load_features(session)
+            total = len(features.movie_ids)
+            logger.info(f"Перестроение индекса похожих фильмов для {total} фильмов")
+
+            for start in range(0, total, self.chunk_size):
+                rows = np.arange(start, min(start + self.chunk_size, total))
+                neighbors, scores = await asyncio.to_thread(self._neighbors, features, rows)
+                await self._replace_neighbors(session, features, rows, neighbors, scores)
+                await session.commit()
+
+        logger.info(f"Индекс похожих фильмов перестроен: {total} фильмов")
+        return total
+
+    async def refresh_movies(self, movie_ids: Iterable[int]) -> int:
+        """
+        Инкрементальное обновление индекса после загрузки/обновления фильмов.
+        Списки самих фильмов и всех фильмов, в списках которых они были (прежние оценки
+        устарели), пересчитываются полностью. В остальные списки измененные фильмы
+        добавляются, если обходят их K-го соседа. Из БД читаются признаки только измененных фильмов.
+        """
+        movie_ids = sorted(set(movie_ids))
+        async with self._lock, self.async_session() as session:
+            features = self._features = await self._current_features(session, movie_ids)
+            result = await session.execute(
+                text("SELECT DISTINCT movie_id FROM movie_similarities WHERE similar_movie_id = ANY(CAST(:movie_ids AS int[]))"),
+                {"movie_ids": movie_ids}
+            )
+            dependent_ids = [row[0] for row in result.fetchall()]
+            changed = self._rows(features, movie_ids)
+            rows = self._rows(features, set(movie_ids) | set(dependent_ids))
+            if len(rows) == 0:
+                return 0
+
+            for start in range(0, len(rows), self.chunk_size):
+                chunk = rows[start:start + self.chunk_size]
+                neighbors, scores = await asyncio.to_thread(self._neighbors, features, chunk)
+                await self._replace_neighbors(session, features, chunk, neighbors, scores)
+
+            thresholds = await self._load_thresholds(session, features)
+            recomputed = np.zeros(len(features.movie_ids), dtype=bool)
+            recomputed[rows] = True
+            for start in range(0, len(changed), self.chunk_size):
+                chunk = changed[start:start + self.chunk_size]
+                pairs = await asyncio.to_thread(self._reverse_candidates, features, chunk, thresholds, recomputed)
+                await self._add_reverse_neighbors(session, *pairs)
+            await session.commit()
+
+        logger.info(f"Индекс похожих фильмов обновлен для {len(rows)} фильмов")
+        return len(rows)
+
+    async def _current_features(self, session, movie_ids: List[int]) -> MovieFeatures:
+        """Кэшированные признаки с подставленными строками movie_ids; весь каталог - раз в features_ttl"""
+        features = self._features
+        if features is None or time.monotonic() - features.loaded_at > self.features_ttl:
+            return await self._load_features(session)
+        return await self._patch_features(session, features, movie_ids)
+
+    async def _load_features(self, session, movie_ids: Optional[List[int]] = None,
+                             genre_columns: Optional[Dict[int, int]] = None,
+                             cast_columns: Optional[Dict[int, int]] = None) -> MovieFeatures:
+        """Загрузка признаков тремя запросами: всех фильмов или только movie_ids"""
+        params = {}
+        movies_filter = links_filter = ""
+        if movie_ids is not None:
+            params = {"movie_ids": list(movie_ids)}
+            movies_filter = "WHERE id = ANY(CAST(:movie_ids AS int[]))"
+            links_filter = "WHERE movie_id = ANY(CAST(:movie_ids AS int[]))"
+        movies = (await session.execute(text(f"""
+            SELECT id, rating, EXTRACT(YEAR FROM release_date) FROM movies {movies_filter} ORDER BY id
+        """), params)).fetchall()
+        movie_genres = (await session.execute(
+            text(f"SELECT movie_id, genre_id FROM movie_genres {links_filter}"), params)).fetchall()
+        movie_actors = (await session.execute(
+            text(f"SELECT movie_id, actor_id FROM movie_actors {links_filter}"), params)).fetchall()
+
+        movie_ids = np.array([row[0] for row in movies], dtype=np.int64)
+        row_by_id = {int(movie_id): row for row, movie_id in enumerate(movie_ids)}
+        ratings = np.array([row[1] or 0 for row in movies], dtype=np.float32)
+        years = np.array([row[2] if row[2] is not None else np.nan for row in movies], dtype=np.float32)
+        genre_columns = {} if genre_columns is None else genre_columns
+        cast_columns = {} if cast_columns is None else cast_columns
+
+        return MovieFeatures(
+            movie_ids=movie_ids,
+            row_by_id=row_by_id,
+            genres=self._multi_hot(movie_genres, row_by_id, genre_columns),
+            cast=self._multi_hot(movie_actors, row_by_id, cast_columns),
+            ratings=ratings,
+            years=years,
+            genre_columns=genre_columns,
+            cast_columns=cast_columns,
+            loaded_at=time.monotonic(),
+        )
+
+    async def _patch_features(self, session, features: MovieFeatures, movie_ids: List[int]) -> MovieFeatures:
+        """
+        Заменяет в кэше строки movie_ids свежими из БД: прежние строки этих фильмов убираются,
+        новые добавляются в конец (удаленные из БД фильмы просто пропадают из кэша)
+        """
+        changed = await self._load_features(session, movie_ids, features.genre_columns, features.cast_columns)
+        removed = set(movie_ids)
+        keep = np.array([row for row, movie_id in enumerate(features.movie_ids) if int(movie_id) not in removed],
+                        dtype=np.int64)
+        movie_ids = np.concatenate([features.movie_ids[keep], changed.movie_ids])
+
+        return MovieFeatures(
+            movie_ids=movie_ids,
+            row_by_id={int(movie_id): row for row, movie_id in enumerate(movie_ids)},
+            genres=self._stack(features.genres[keep], changed.genres),
+            cast=self._stack(features.cast[keep], changed.cast),
+            ratings=np.concatenate([features.ratings[keep], changed.ratings]),
+            years=np.concatenate([features.years[keep], changed.years]),
+            genre_columns=changed.genre_columns,
+            cast_columns=changed.cast_columns,
+            loaded_at=features.loaded_at,
+        )
+
+    @staticmethod
+    def _stack(kept: csr_matrix, changed: csr_matrix) -> csr_matrix:
+        """Объединяет строки; у новых фильмов могли появиться новые жанры/актеры - столбцов больше"""
+        columns = max(kept.shape[1], changed.shape[1])
+        kept.resize((kept.shape[0], columns))
+        changed.resize((changed.shape[0], columns))
+        return vstack([kept, changed], format="csr")
+
+    @staticmethod
+    def _multi_hot(pairs: List, row_by_id: Dict[int, int], column_by_feature: Dict[int, int]) -> csr_matrix:
+        """
+        Разреженная матрица фильм x признак из пар (movie_id, feature_id).
+        column_by_feature дополняется новыми признаками, чтобы столбцы совпадали между загрузками
+        """
+        pairs = [(row_by_id[movie_id], feature_id) for movie_id, feature_id in pairs if movie_id in row_by_id]
+        for _, feature_id in pairs:
+            column_by_feature.setdefault(feature_id, len(column_by_feature))
+        rows = np.array([p[0] for p in pairs], dtype=np.int64)
+        columns = np.array([column_by_feature[p[1]] for p in pairs], dtype=np.int64)
+        return csr_matrix(
+            (np.ones(len(pairs), dtype=np.float32), (rows, columns)),
+            shape=(len(row_by_id), max(len(column_by_feature), 1)),
+        )
+
+    @staticmethod
+    def _rows(features: MovieFeatures, movie_ids: Iterable[int]) -> np.ndarray:
+        """Строки матриц для фильмов, которые есть в признаках"""
+        return np.array(sorted({features.row_by_id[movie_id] for movie_id in movie_ids
+                                if movie_id in features.row_by_id}), dtype=np.int64)
+
+    async def _load_thresholds(self, session, features: MovieFeatures) -> np.ndarray:
+        """
+        Оценка K-го соседа в списке каждого фильма: чужой фильм попадает в список, только если обходит ее.
+        Неполный список (каталог меньше K) принимает любой фильм; фильмы без списка (индекс
+        еще не строился) не пополняются - их заполнит rebuild
+        """
+        thresholds = np.full(len(features.movie_ids), np.inf)
+        result = await session.execute(text(
+            "SELECT movie_id, COUNT(*), MIN(score) FROM movie_similarities GROUP BY movie_id"
+        ))
+        for movie_id, count, min_score in result.fetchall():
+            row = features.row_by_id.get(movie_id)
+            if row is not None:
+                thresholds[row] = min_score if count >= self.top_k else -np.inf
+        return thresholds
+
+    def _neighbors(self, features: MovieFeatures, rows: np.ndarray) -> tuple:
+        """Оценки и top-K для строк rows; CPU-bound, вызывается в потоке, чтобы не блокировать event loop"""
+        return self._top_k(self._score_rows(features, rows))
+
+    def _reverse_candidates(self, features: MovieFeatures, rows: np.ndarray,
+                            thresholds: np.ndarray, recomputed: np.ndarray) -> tuple:
+        """
+        Пары (фильм, фильм из rows, оценка) для списков, в top-K которых фильмы rows теперь попадают.
+        Пересчитанные списки пропускаются: они уже точные. Вызывается в потоке
+        """
+        scores = self._score_rows(features, rows)
+        chunk_rows, columns = np.nonzero((scores > thresholds[None, :]) & ~recomputed[None, :])
+        return features.movie_ids[columns], features.movie_ids[rows[chunk_rows]], scores[chunk_rows, columns]
+
+    def _score_rows(self, features: MovieFeatures, rows: np.ndarray) -> np.ndarray:
+        """Матрица оценок похожести (len(rows) x все фильмы)"""
+        genre_score = cosine_similarity(features.genres[rows], features.genres)
+        cast_score = cosine_similarity(features.cast[rows], features.cast)
+
+        rating_score = 1.0 - np.abs(features.ratings[rows, None] - features.ratings[None, :]) / 10.0
+        year_score = np.exp(-np.abs(features.years[rows, None] - features.years[None, :]) / self.YEAR_SCALE)
+        year_score = np.nan_to_num(year_score, nan=0.0)
+
+        scores = (self.GENRE_WEIGHT * genre_score
+                  + self.CAST_WEIGHT * cast_score
+                  + self.RATING_WEIGHT * rating_score
+                  + self.YEAR_WEIGHT * year_score)
+        # Фильм не может быть похож сам на себя
+        scores[np.arange(len(rows)), rows] = -np.inf
+        return scores
+
+    def _top_k(self, scores: np.ndarray) -> tuple:
+        """Индексы и оценки top-K соседей для каждой строки, по убыванию оценки"""
+        k = min(self.top_k, scores.shape[1] - 1)
+        if k <= 0:
+            empty = np.empty((scores.shape[0], 0))
+            return empty.astype(np.int64), empty
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+    async def _replace_neighbors(self, session, features: MovieFeatures, rows: np.ndarray,
+                                 neighbors: np.ndarray, scores: np.ndarray):
+        """Замена списков соседей для фильмов rows"""
+        source_ids = features.movie_ids[rows]
+        await session.execute(
+            text("DELETE FROM movie_similarities WHERE movie_id = ANY(CAST(:movie_ids AS int[]))"),
+            {"movie_ids": source_ids.tolist()}
+        )
+        await self._upsert(
+            session,
+            np.repeat(source_ids, neighbors.shape[1]),
+            features.movie_ids[neighbors].ravel(),
+            scores.ravel(),
+        )
+
+    async def _add_reverse_neighbors(self, session, movie_ids: np.ndarray,
+                                     similar_ids: np.ndarray, scores: np.ndarray):
+        """Добавляет пары в списки movie_ids и обрезает эти списки до top-K"""
+        if len(movie_ids) == 0:
+            return
+        await self._upsert(session, movie_ids, similar_ids, scores)
+        await session.execute(text("""
+            DELETE FROM movie_similarities s
+            USING (
+                SELECT movie_id, similar_movie_id,
+                       ROW_NUMBER() OVER (PARTITION BY movie_id ORDER BY score DESC) AS position
+                FROM movie_similarities
+                WHERE movie_id = ANY(CAST(:movie_ids AS int[]))
+            ) ranked
+            WHERE s.movie_id = ranked.movie_id
+              AND s.similar_movie_id = ranked.similar_movie_id
+              AND ranked.position > :top_k
+        """), {"movie_ids": np.unique(movie_ids).tolist(), "top_k": self.top_k})
+
+    @staticmethod
+    async def _upsert(session, movie_ids: np.ndarray, similar_ids: np.ndarray, scores: np.ndarray):
+        """Вставка пар одним запросом через unnest массивов"""
+        if len(movie_ids) == 0:
+            return
+        await session.execute(text("""
+            INSERT INTO movie_similarities (movie_id, similar_movie_id, score)
+            SELECT * FROM unnest(CAST(:movie_ids AS int[]), CAST(:similar_ids AS int[]), CAST(:scores AS float8[]))
+            ON CONFLICT (movie_id, similar_movie_id) DO UPDATE SET score = EXCLUDED.score
+        """), {
+            "movie_ids": movie_ids.tolist(),
+            "similar_ids": similar_ids.tolist(),
+            "scores": scores.astype(float).tolist(),
+        })
@@ -1,35 +1,91 @@
 import aiohttp
 import asyncio
 import logging
-from typing import List, Optional, Dict, Any
+import random
+from typing import List, Optional, Dict, Any, Tuple
 from etl_service.config import config
 from etl_service.schemas.movie_schema import TMDBMovieResponse, TMDBGenre, TMDBCast
+from etl_service.services.rate_limiter import TokenBucket
+from etl_service.services.response_cache import TMDBResponseCache
 
 logger = logging.getLogger(__name__)
 
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CAST_LIMIT = 10
+CHANGES_MAX_DAYS = 14  # Наибольший период одного запроса к movie/changes
+
+class TMDBRequestError(Exception):
+    """Запрос к TMDB не удался (после всех повторов) - в отличие от пустого ответа"""
+
+
 class TMDBExtractor:
-    """Сервис для извлечения данных из TMDB API"""
+    """
+    Сервис для извлечения данных из TMDB API.
+
+    Запросы можно выполнять параллельно: не больше TMDB_MAX_CONCURRENCY одновременно
+    и не чаще TMDB_RATE_LIMIT в секунду (token bucket). На 429 выдача запросов
+    приостанавливается на Retry-After, на 5xx и сетевые ошибки - экспоненциальная пауза
+    с разбросом; после MAX_RETRIES повторов запрос считается неудачным.
+
+    Ответы кэшируются на диске (TMDBResponseCache): свежий ответ не запрашивается повторно,
+    устаревший перепроверяется по ETag (ответ 304 не расходует трафик на тело).
+    С TMDB_CACHE_MODE=offline запросы выполняются только из кэша.
+    """
     
     def __init__(self):
         self.api_key = config.TMDB_API_KEY
         self.base_url = config.TMDB_BASE_URL
         self.session: Optional[aiohttp.ClientSession] = None
+        self.rate_limiter = TokenBucket(config.TMDB_RATE_LIMIT, config.TMDB_RATE_BURST)
+        self.semaphore = asyncio.Semaphore(config.TMDB_MAX_CONCURRENCY)
+        self.cache = TMDBResponseCache.from_config()
+        # Сессию используют все одновременно выполняемые задачи; закрывает ее последняя
+        self._users = 0
         
-        if not self.api_key:
+        if not self.api_key and not (self.cache and self.cache.offline):
             logger.warning("TMDB_API_KEY не установлен. Некоторые функции будут недоступны.")
     
     async def __aenter__(self):
         """Создание HTTP сессии"""
-        self.session = aiohttp.ClientSession()
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=config.TMDB_MAX_CONCURRENCY),
+                timeout=aiohttp.ClientTimeout(total=config.TMDB_REQUEST_TIMEOUT)
+            )
+        self._users += 1
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Закрытие HTTP сессии"""
-        if self.session:
-            await self.session.close()
+        self._users -= 1
+        if self._users == 0 and self.session:
+            session, self.session = self.session, None
+            await session.close()
+    
+    def close(self):
+        """Закрытие кэша ответов"""
+        if self.cache:
+            self.cache.close()
     
-    async def _make_request(self, endpoint: str, params: Dict[str, Any] = None) -> Optional[Dict]:
-        """Выполнение HTTP запроса к TMDB API"""
+    async def _make_request(self, endpoint: str, params: Dict[str, Any] = None,
+                            revalidate: bool = False) -> Optional[Dict]:
+        """
+        Выполнение HTTP запроса к TMDB API (через кэш ответов).
+        revalidate - перепроверить даже свежую запись кэша (данные заведомо менялись).
+        """
+        request_params = {"api_key": self.api_key, "language": "ru-RU"}
+        if params:
+            request_params.update(params)
+        
+        cached = await self.cache.get(endpoint, request_params) if self.cache else None
+        if self.cache and self.cache.offline:
+            if cached is None:
+                logger.warning(f"Нет ответа в кэше TMDB для {endpoint} {params or ''}")
+                return None
+            return cached.body
+        if cached is not None and cached.fresh and not revalidate:
+            return cached.body
+        
         if not self.api_key:
             logger.error("TMDB API ключ не настроен")
             return None
@@ -38,35 +94,80 @@ class TMDBExtractor:
             logger.error("HTTP сессия не инициализирована")
             return None
         
+        return await self._fetch(endpoint, request_params, cached)
+    
+    async def _fetch(self, endpoint: str, request_params: Dict[str, Any], cached=None) -> Optional[Dict]:
+        """Запрос к TMDB с повторами; с записью кэша - условный, 304 продлевает запись"""
         url = f"{self.base_url}/{endpoint}"
-        request_params = {"api_key": self.api_key, "language": "ru-RU"}
+        headers = cached.conditional_headers() if cached is not None else {}
         
-        if params:
-            request_params.update(params)
-        
-        try:
-            async with self.session.get(url, params=request_params) as response:
-                if response.status == 200:
-                    return await response.json()
-                elif response.status == 429:
-                    # Rate limiting - ждем и повторяем
-                    logger.warning("Rate limit достигнут, ожидание...")
-                    await asyncio.sleep(1)
-                    return await self._make_request(endpoint, params)
-                else:
-                    logger.error(f"TMDB API ошибка: {response.status}")
+        for attempt in range(config.MAX_RETRIES + 1):
+            last_attempt = attempt == config.MAX_RETRIES
+            try:
+                await self.rate_limiter.acquire()
+                async with self.semaphore:
+                    async with self.session.get(url, params=request_params, headers=headers) as response:
+                        if response.status == 200:
+                            data = await response.json()
+                            if self.cache:
+                                await self.cache.put(endpoint, request_params, data,
+                                                     etag=response.headers.get("ETag"),
+                                                     last_modified=response.headers.get("Last-Modified"))
+                            return data
+                        if response.status == 304 and cached is not None:
+                            await self.cache.refresh(cached, endpoint)
+                            return cached.body
+                        if response.status not in RETRY_STATUSES:
+                            logger.error(f"TMDB API ошибка: {response.status} ({endpoint})")
+                            return None
+                        retry_after = self._parse_retry_after(response.headers.get("Retry-After"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if last_attempt:
+                    logger.error(f"Ошибка запроса к TMDB ({endpoint}): {e}")
                     return None
-        except Exception as e:
-            logger.error(f"Ошибка запроса к TMDB: {e}")
+                delay = self._backoff(attempt)
+                logger.warning(f"Ошибка запроса к TMDB ({endpoint}): {e}, повтор через {delay:.1f} с")
+                await asyncio.sleep(delay)
+                continue
+            except Exception as e:
+                logger.error(f"Ошибка запроса к TMDB ({endpoint}): {e}")
+                return None
+
+            if last_attempt:
+                logger.error(f"TMDB API ошибка: {response.status} ({endpoint}), повторы исчерпаны")
+                return None
+            if response.status == 429:
+                # Квота общая для всех запросов - приостанавливаем выдачу токенов целиком
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                logger.warning(f"Rate limit достигнут, ожидание {delay:.1f} с")
+                self.rate_limiter.block_for(delay)
+            else:
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                logger.warning(f"TMDB API ошибка: {response.status} ({endpoint}), повтор через {delay:.1f} с")
+                await asyncio.sleep(delay)
+        return None
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        try:
+            return min(max(float(value), 0.0), config.TMDB_BACKOFF_MAX)
+        except ValueError:
             return None
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        delay = min(config.TMDB_BACKOFF_MAX, config.TMDB_BACKOFF_BASE * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
     
     async def get_popular_movies(self, page: int = 1) -> List[TMDBMovieResponse]:
-        """Получение популярных фильмов"""
+        """Получение популярных фильмов; TMDBRequestError, если страницу получить не удалось"""
         logger.info(f"Получение популярных фильмов, страница {page}")
         
         data = await self._make_request("movie/popular", {"page": page})
         if not data or "results" not in data:
-            return []
+            raise TMDBRequestError(f"Не удалось получить страницу {page} популярных фильмов")
         
         movies = []
         for movie_data in data["results"]:
@@ -79,6 +180,24 @@ class TMDBExtractor:
         logger.info(f"Получено {len(movies)} фильмов со страницы {page}")
         return movies
     
+    async def get_movie_changes(self, start_date: str, end_date: str, page: int = 1) -> Tuple[List[int], int]:
+        """
+        ID фильмов, измененных в TMDB за период (не больше 14 дней), и число страниц ленты.
+        TMDBRequestError, если страницу ленты получить не удалось: пропуск страницы потерял бы изменения
+        """
+        logger.info(f"Получение изменений фильмов {start_date} - {end_date}, страница {page}")
+        
+        data = await self._make_request("movie/changes", {
+            "start_date": start_date,
+            "end_date": end_date,
+            "page": page
+        })
+        if not data or "results" not in data:
+            raise TMDBRequestError(f"Не удалось получить изменения фильмов {start_date} - {end_date}, страница {page}")
+        
+        movie_ids = [item["id"] for item in data["results"] if "id" in item and not item.get("adult")]
+        return movie_ids, data.get("total_pages", 0)
+    
     async def get_movie_details(self, movie_id: int) -> Optional[TMDBMovieResponse]:
         """Получение детальной информации о фильме"""
         logger.info(f"Получение деталей фильма {movie_id}")
@@ -99,22 +218,44 @@ class TMDBExtractor:
             logger.error(f"Ошибка парсинга деталей фильма {movie_id}: {e}")
             return None
     
-    async def get_movie_cast(self, movie_id: int) -> List[TMDBCast]:
-        """Получение актерского состава фильма"""
-        logger.info(f"Получение актеров фильма {movie_id}")
+    async def get_movie_with_cast(self, movie_id: int,
+                                  revalidate: bool = False) -> Tuple[Optional[TMDBMovieResponse], List[TMDBCast]]:
+        """Детали фильма и актеры одним запросом (append_to_response=credits)"""
+        data = await self._make_request(f"movie/{movie_id}", {"append_to_response": "credits"}, revalidate=revalidate)
+        if not data:
+            return None, []
         
-        data = await self._make_request(f"movie/{movie_id}/credits")
-        if not data or "cast" not in data:
-            return []
+        try:
+            if "genres" in data:
+                data["genre_ids"] = [genre["id"] for genre in data["genres"]]
+            movie = TMDBMovieResponse(**data)
+        except Exception as e:
+            logger.error(f"Ошибка парсинга деталей фильма {movie_id}: {e}")
+            return None, []
         
+        return movie, self._parse_cast((data.get("credits") or {}).get("cast", []))
+    
+    @staticmethod
+    def _parse_cast(cast_items: List[Dict]) -> List[TMDBCast]:
         cast = []
         # Берем только первых 10 актеров
-        for cast_data in data["cast"][:10]:
+        for cast_data in cast_items[:CAST_LIMIT]:
             try:
                 actor = TMDBCast(**cast_data)
                 cast.append(actor)
             except Exception as e:
                 logger.warning(f"Ошибка парсинга актера: {e}")
+        return cast
+    
+    async def get_movie_cast(self, movie_id: int) -> List[TMDBCast]:
+        """Получение актерского состава фильма"""
+        logger.info(f"Получение актеров фильма {movie_id}")
+        
+        data = await self._make_request(f"movie/{movie_id}/credits")
+        if not data or "cast" not in data:
+            return []
+        
+        cast = self._parse_cast(data["cast"])
         
         logger.info(f"Получено {len(cast)} актеров для фильма {movie_id}")
         return cast
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from etl_service.config import config
+from etl_service.services.response_cache import TMDBResponseCache, cache_key, ttl_for_endpoint
+
+
+class FakeResponse:
+    def __init__(self, status, body=None, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+    async def json(self):
+        return self.body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class FakeSession:
+    """HTTP-сессия TMDB: отдает заготовленные ответы и запоминает запросы"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, params=None, headers=None):
+        self.calls.append({"url": url, "params": dict(params or {}), "headers": dict(headers or {})})
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "tmdb.sqlite3")
+
+
+@pytest.fixture
+def extractor_factory(monkeypatch, cache_path):
+    """TMDBExtractor с кэшем во временном файле и подставной HTTP-сессией"""
+    pytest.importorskip("aiohttp")
+    pytest.importorskip("pydantic")
+    from etl_service.services.tmdb_extractor import TMDBExtractor
+
+    monkeypatch.setattr(config, "TMDB_CACHE_PATH", cache_path)
+    monkeypatch.setattr(config, "TMDB_RATE_LIMIT", 1000.0)
+    extractors = []
+
+    def create(session=None, api_key="secret", mode="on"):
+        monkeypatch.setattr(config, "TMDB_API_KEY", api_key)
+        monkeypatch.setattr(config, "TMDB_CACHE_MODE", mode)
+        extractor = TMDBExtractor()
+        extractor.session = session
+        extractors.append(extractor)
+        return extractor
+
+    yield create
+    for extractor in extractors:
+        extractor.close()
+
+
+def expire(cache: TMDBResponseCache, endpoint: str, params: dict):
+    cache._refresh(cache_key(endpoint, params), time.time() - 1)
+
+
+def test_cache_key_ignores_api_key():
+    assert cache_key("movie/550", {"api_key": "a", "language": "ru-RU"}) == \
+        cache_key("movie/550", {"api_key": "b", "language": "ru-RU"})
+    assert cache_key("movie/550", {"language": "ru-RU"}) != cache_key("movie/550", {"language": "en-US"})
+
+
+def test_ttl_for_endpoint():
+    assert ttl_for_endpoint("genre/movie/list") == config.TMDB_CACHE_STATIC_TTL
+    assert ttl_for_endpoint("movie/popular") == config.TMDB_CACHE_LIST_TTL
+    assert ttl_for_endpoint("search/movie") == config.TMDB_CACHE_LIST_TTL
+    assert ttl_for_endpoint("movie/550") == config.TMDB_CACHE_TTL
+
+
+def test_get_put_and_refresh(cache_path):
+    cache = TMDBResponseCache(cache_path)
+    params = {"api_key": "secret", "language": "ru-RU"}
+    try:
+        assert asyncio.run(cache.get("movie/550", params)) is None
+
+        asyncio.run(cache.put("movie/550", params, {"id": 550}, etag='"v1"'))
+        entry = asyncio.run(cache.get("movie/550", params))
+        assert entry.body == {"id": 550}
+        assert entry.etag == '"v1"'
+        assert entry.fresh
+
+        expire(cache, "movie/550", params)
+        entry = asyncio.run(cache.get("movie/550", params))
+        assert not entry.fresh
+        assert entry.conditional_headers() == {"If-None-Match": '"v1"'}
+
+        asyncio.run(cache.refresh(entry, "movie/550"))
+        assert asyncio.run(cache.get("movie/550", params)).fresh
+    finally:
+        cache.close()
+
+
+def test_api_key_is_not_stored(cache_path):
+    cache = TMDBResponseCache(cache_path)
+    try:
+        asyncio.run(cache.put("movie/550", {"api_key": "secret", "language": "ru-RU"}, {"id": 550}))
+        with cache._lock:
+            row = cache._conn.execute("SELECT params, body FROM responses").fetchone()
+    finally:
+        cache.close()
+    assert json.loads(row[0]) == {"language": "ru-RU"}
+    assert "secret" not in row[0] + row[1]
+
+
+def test_extractor_miss_then_hit(extractor_factory):
+    session = FakeSession(FakeResponse(200, {"id": 550}, {"ETag": '"v1"'}))
+    extractor = extractor_factory(session)
+
+    assert asyncio.run(extractor._make_request("movie/550")) == {"id": 550}
+    assert asyncio.run(extractor._make_request("movie/550")) == {"id": 550}
+    assert len(session.calls) == 1
+    assert session.calls[0]["headers"] == {}
+
+
+def test_extractor_revalidates_stale_entry_with_etag(extractor_factory):
+    session = FakeSession(FakeResponse(200, {"id": 550}, {"ETag": '"v1"'}), FakeResponse(304))
+    extractor = extractor_factory(session)
+    asyncio.run(extractor._make_request("movie/550"))
+    expire(extractor.cache, "movie/550", session.calls[0]["params"])
+
+    assert asyncio.run(extractor._make_request("movie/550")) == {"id": 550}
+    assert len(session.calls) == 2
+    assert session.calls[1]["headers"] == {"If-None-Match": '"v1"'}
+    # 304 продлил запись - следующий запрос обходится без сети
+    assert asyncio.run(extractor._make_request("movie/550")) == {"id": 550}
+    assert len(session.calls) == 2
+
+
+def test_extractor_revalidate_replaces_changed_entry(extractor_factory):
+    session = FakeSession(FakeResponse(200, {"id": 550, "title": "old"}, {"ETag": '"v1"'}),
+                          FakeResponse(200, {"id": 550, "title": "new"}, {"ETag": '"v2"'}))
+    extractor = extractor_factory(session)
+    asyncio.run(extractor._make_request("movie/550"))
+
+    assert asyncio.run(extractor._make_request("movie/550", revalidate=True))["title"] == "new"
+    assert session.calls[1]["headers"] == {"If-None-Match": '"v1"'}
+    assert asyncio.run(extractor.cache.get("movie/550", session.calls[1]["params"])).etag == '"v2"'
+
+
+def test_extractor_cache_shared_across_api_keys(extractor_factory):
+    first = FakeSession(FakeResponse(200, {"id": 550}))
+    asyncio.run(extractor_factory(first, api_key="first")._make_request("movie/550"))
+
+    second = FakeSession()
+    extractor = extractor_factory(second, api_key="second")
+    assert asyncio.run(extractor._make_request("movie/550")) == {"id": 550}
+    assert second.calls == []
+
+
+def test_extractor_offline_mode(extractor_factory):
+    session = FakeSession(FakeResponse(200, {"id": 550}))
+    online = extractor_factory(session)
+    asyncio.run(online._make_request("movie/550"))
+    expire(online.cache, "movie/550", session.calls[0]["params"])
+
+    # Без ключа и без сессии: устаревшая запись отдается, отсутствующей - None
+    offline = extractor_factory(session=None, api_key=None, mode="offline")
+    assert asyncio.run(offline._make_request("movie/550")) == {"id": 550}
+    assert asyncio.run(offline._make_request("movie/551")) is None
+    assert len(session.calls) == 1
@@ -27,6 +27,27 @@ class Settings(BaseSettings):
     KIBANA_HOST: str
     KIBANA_PORT: int
 
+    LISTENER_WORKERS: int = 4  # Количество обработчиков сообщений pub/sub
+    LISTENER_QUEUE_SIZE: int = 1000  # Размер внутренней очереди сообщений
+    LISTENER_DRAIN_TIMEOUT: float = 10.0  # Сколько дообрабатывать очередь при остановке, секунды
+
+    LOG_TRANSPORT: str = "pubsub"  # Транспорт логов: pubsub (канал logs) или stream (Redis Stream logs)
+    LOG_STREAM_NAME: str = "logs"  # Имя Redis Stream с логами
+    LOG_STREAM_GROUP: str = "log_service"  # Consumer group, общая для всех реплик log_service
+    LOG_STREAM_CONSUMER: str = ""  # Имя потребителя в группе (по умолчанию hostname-pid)
+    LOG_STREAM_BATCH_SIZE: int = 100  # Сколько записей читать за один XREADGROUP
+    LOG_STREAM_BLOCK_MS: int = 1000  # Сколько ждать новых записей в XREADGROUP, миллисекунды
+    LOG_STREAM_CLAIM_IDLE_MS: int = 60000  # Через сколько простоя забирать записи упавших реплик, миллисекунды
+
+    LOG_INDEX_PATTERN: str = "logs-%Y.%m.%d"  # Имя индекса (strftime) или write-алиас rollover-индекса
+    LOG_BULK_MAX_DOCS: int = 500  # Сброс буфера по количеству документов
+    LOG_BULK_MAX_BYTES: int = 5 * 1024 * 1024  # Сброс буфера по объему, байты
+    LOG_BULK_FLUSH_INTERVAL: float = 2.0  # Сброс буфера по времени, секунды
+    LOG_BULK_MAX_RETRIES: int = 5  # Повторы для документов, отклоненных с временной ошибкой
+    LOG_BULK_RETRY_BACKOFF: float = 0.5  # Начальная задержка между повторами, секунды
+    LOG_SPILL_DIR: str = "/var/lib/log_service/spill"  # Локальный буфер на время недоступности Elasticsearch (volume log_spill)
+    LOG_SPILL_MAX_BYTES: int = 512 * 1024 * 1024  # Максимальный объем локального буфера, байты
+
     model_config = SettingsConfigDict(
         env_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env"),
         extra='ignore'
@@ -57,6 +78,39 @@ def get_redis_settings():
     return {"host": settings.REDIS_HOST, "port": settings.REDIS_PORT}
 
 
+def get_listener_settings():
+    return {
+        "workers": settings.LISTENER_WORKERS,
+        "queue_size": settings.LISTENER_QUEUE_SIZE,
+        "drain_timeout": settings.LISTENER_DRAIN_TIMEOUT
+    }
+
+
+def get_log_transport_settings():
+    return {
+        "transport": settings.LOG_TRANSPORT,
+        "stream": settings.LOG_STREAM_NAME,
+        "group": settings.LOG_STREAM_GROUP,
+        "consumer_name": settings.LOG_STREAM_CONSUMER or None,
+        "batch_size": settings.LOG_STREAM_BATCH_SIZE,
+        "block_ms": settings.LOG_STREAM_BLOCK_MS,
+        "claim_idle_ms": settings.LOG_STREAM_CLAIM_IDLE_MS
+    }
+
+
+def get_bulk_indexer_settings():
+    return {
+        "index_pattern": settings.LOG_INDEX_PATTERN,
+        "max_docs": settings.LOG_BULK_MAX_DOCS,
+        "max_bytes": settings.LOG_BULK_MAX_BYTES,
+        "flush_interval": settings.LOG_BULK_FLUSH_INTERVAL,
+        "max_retries": settings.LOG_BULK_MAX_RETRIES,
+        "retry_backoff": settings.LOG_BULK_RETRY_BACKOFF,
+        "spill_dir": settings.LOG_SPILL_DIR,
+        "spill_max_bytes": settings.LOG_SPILL_MAX_BYTES
+    }
+
+
 def get_elasticsearch_settings():
     return {
         "host": settings.ELASTICSEARCH_HOST,
@@ -45,5 +45,6 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "log_service",
-        "trace_id": get_trace_id()
+        "trace_id": get_trace_id(),
+        "listener": redis_listener.metrics()
     } 
\ No newline at end of file
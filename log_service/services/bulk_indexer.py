@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from elasticsearch import ApiError, TransportError
+
+from log_service.config import get_bulk_indexer_settings
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Item statuses worth resending
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+
+class BulkIndexer:
+    """
+    Buffered log writer for Elasticsearch based on the _bulk API.
+
+    Documents are flushed when the buffer reaches LOG_BULK_MAX_DOCS documents,
+    LOG_BULK_MAX_BYTES bytes or every LOG_BULK_FLUSH_INTERVAL seconds. Only items
+    rejected with a retryable status are resent, with exponential backoff. While
+    Elasticsearch is unreachable batches are spilled to JSONL files in LOG_SPILL_DIR
+    and replayed after the next successful flush.
+
+    Documents may carry the id of the message they came from. on_delivered is called
+    with those ids only once the documents are indexed (or permanently rejected) or
+    spilled to disk, so the source can acknowledge them without risking data loss.
+    """
+
+    def __init__(self, es_client, on_delivered: Optional[Callable[[List[Any]], Awaitable[None]]] = None):
+        self.es_client = es_client
+        self.on_delivered = on_delivered
+        self.settings = get_bulk_indexer_settings()
+        self._buffer: List[Tuple[str, dict, Any]] = []
+        self._buffer_bytes = 0
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.indexed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+
+    async def start(self):
+        """Start periodic flushing"""
+        os.makedirs(self.settings["spill_dir"], exist_ok=True)
+        self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def close(self):
+        """Stop periodic flushing and flush what is left in the buffer"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+
+    def index_name(self, document: dict) -> str:
+        """Daily index name from the document timestamp (or a static rollover write alias)"""
+        try:
+            timestamp = datetime.fromisoformat(document["timestamp"])
+        except (KeyError, TypeError, ValueError):
+            timestamp = datetime.now()
+        return timestamp.strftime(self.settings["index_pattern"])
+
+    async def add(self, document: dict, ack_id: Any = None):
+        """Add a document to the buffer, flushing it when a size limit is reached"""
+        self._buffer.append((self.index_name(document), document, ack_id))
+        self._buffer_bytes += len(json.dumps(document, default=str))
+        if (len(self._buffer) >= self.settings["max_docs"]
+                or self._buffer_bytes >= self.settings["max_bytes"]):
+            await self.flush()
+
+    async def flush(self):
+        """Send the buffer to Elasticsearch"""
+        async with self._flush_lock:
+            if self._buffer:
+                batch, self._buffer, self._buffer_bytes = self._buffer, [], 0
+                unsent = await self._send(batch)
+                lost = [] if not unsent or await self._spill(unsent) else unsent
+                # Entries that were neither delivered nor spilled stay unacknowledged and are redelivered
+                lost_ids = {id(item) for item in lost}
+                await self._delivered([item[2] for item in batch
+                                       if item[2] is not None and id(item) not in lost_ids])
+                if unsent:
+                    return
+            await self._replay_spill()
+
+    async def _delivered(self, ack_ids: List[Any]):
+        if not ack_ids or self.on_delivered is None:
+            return
+        try:
+            await self.on_delivered(ack_ids)
+        except Exception as e:
+            # Unacknowledged entries are delivered again later: duplicates, not losses
+            logger.error(f"Failed to acknowledge {len(ack_ids)} log entries: {e}")
+
+    def metrics(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "buffered_bytes": self._buffer_bytes,
+            "indexed": self.indexed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+        }
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.settings["flush_interval"])
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing logs to Elasticsearch: {e}")
+
+    async def _send(self, batch: List[Tuple[str, dict, Any]]) -> List[Tuple[str, dict, Any]]:
+        """
+        Send a batch, retrying only the failed items.
+        Returns the items that could not be delivered (empty list on success).
+        """
+        pending = batch
+        for attempt in range(self.settings["max_retries"] + 1):
+            operations = []
+            for index, document, _ in pending:
+                operations.append({"index": {"_index": index}})
+                operations.append(document)
+
+            try:
+                response = await self.es_client.bulk(operations=operations)
+            except (TransportError, ApiError) as e:
+                logger.error(f"Elasticsearch bulk request failed: {e}")
+                return pending
+
+            retry = []
+            for item, operation in zip(response["items"], pending):
+                result = item.get("index", {})
+                status = result.get("status", 500)
+                if status < 300:
+                    self.indexed += 1
+                elif status in RETRYABLE_STATUSES:
+                    retry.append(operation)
+                else:
+                    self.dropped += 1
+                    logger.warning(f"Log entry rejected by Elasticsearch ({status}): {result.get('error')}")
+
+            if not retry:
+                return []
+
+            pending = retry
+            self.retried += len(retry)
+            await asyncio.sleep(self.settings["retry_backoff"] * 2 ** attempt)
+
+        logger.error(f"{len(pending)} log entries still rejected after {self.settings['max_retries']} retries")
+        return pending
+
+    async def _spill(self, batch: List[Tuple[str, dict, Any]]) -> bool:
+        """Save a batch to the local disk buffer; False if it did not fit"""
+        spill_dir = self.settings["spill_dir"]
+        lines = "".join(
+            json.dumps({"index": index, "document": document}, default=str) + "\n"
+            for index, document, _ in batch
+        )
+
+        def write():
+            os.makedirs(spill_dir, exist_ok=True)
+            used = sum(
+                os.path.getsize(os.path.join(spill_dir, name)) for name in os.listdir(spill_dir)
+            )
+            if used + len(lines) > self.settings["spill_max_bytes"]:
+                return False
+            path = os.path.join(spill_dir, f"spill-{time.time_ns()}.jsonl")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(lines)
+            return True
+
+        try:
+            written = await asyncio.to_thread(write)
+        except OSError as e:
+            logger.error(f"Failed to spill log entries to {spill_dir}: {e}")
+            written = False
+        if written:
+            self.spilled += len(batch)
+            logger.warning(f"Spilled {len(batch)} log entries to {spill_dir}")
+        else:
+            self.dropped += len(batch)
+            logger.error(f"Disk buffer is full, could not spill {len(batch)} log entries")
+        return written
+
+    async def _replay_spill(self):
+        """Resend spilled batches in the order they were written"""
+        spill_dir = self.settings["spill_dir"]
+        if not os.path.isdir(spill_dir):
+            return
+        for name in sorted(os.listdir(spill_dir)):
+            path = os.path.join(spill_dir, name)
+
+            def read():
+                with open(path, encoding="utf-8") as file:
+                    return [json.loads(line) for line in file if line.strip()]
+
+            entries = [(entry["index"], entry["document"], None) for entry in await asyncio.to_thread(read)]
+            max_docs = self.settings["max_docs"]
+            for start in range(0, len(entries), max_docs):
+                chunk = entries[start:start + max_docs]
+                unsent = await self._send(chunk)
+                if unsent:
+                    # Elasticsearch is unavailable again: keep only the undelivered entries in the file
+                    remaining = unsent + entries[start + max_docs:]
+                    lines = "".join(
+                        json.dumps({"index": index, "document": document}, default=str) + "\n"
+                        for index, document, _ in remaining
+                    )
+                    await asyncio.to_thread(self._rewrite, path, lines)
+                    return
+                self.replayed += len(chunk)
+            await asyncio.to_thread(os.remove, path)
+            logger.info(f"Replayed {len(entries)} spilled log entries from {name}")
+
+    @staticmethod
+    def _rewrite(path: str, lines: str):
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(lines)
@@ -1,6 +1,9 @@
 from log_service.cache_redis import redis_client
-from elasticsearch import AsyncElasticsearch
-from log_service.config import get_elasticsearch_settings
+from elasticsearch import AsyncElasticsearch, ApiError, TransportError
+from log_service.config import get_elasticsearch_settings, get_listener_settings, get_log_transport_settings
+from log_service.services.bulk_indexer import BulkIndexer
+from shared.messaging.pubsub_consumer import PubSubConsumer
+from shared.messaging.stream_consumer import StreamConsumer
 import json
 import asyncio
 from datetime import datetime
@@ -12,10 +15,37 @@ logger = logging.getLogger(__name__)
 
 class RedisListener:
     def __init__(self):
-        self.running = False
-        self.pubsub = None
         self.es_settings = get_elasticsearch_settings()
+        self.listener_settings = get_listener_settings()
+        self.transport_settings = get_log_transport_settings()
         self.es_client = None
+        self.indexer = None
+        if self.transport_settings["transport"] == "stream":
+            # Реплики log_service делят поток через consumer group. Запись подтверждается
+            # только после того, как BulkIndexer отправил ее в Elasticsearch или на диск
+            self.consumer = StreamConsumer(
+                redis_client,
+                self.transport_settings["stream"],
+                self.transport_settings["group"],
+                self.process_message,
+                workers=self.listener_settings["workers"],
+                queue_size=self.listener_settings["queue_size"],
+                batch_size=self.transport_settings["batch_size"],
+                block_ms=self.transport_settings["block_ms"],
+                claim_idle_ms=self.transport_settings["claim_idle_ms"],
+                consumer_name=self.transport_settings["consumer_name"],
+                name="log_service",
+                auto_ack=False
+            )
+        else:
+            self.consumer = PubSubConsumer(
+                redis_client,
+                ['logs'],
+                self.process_message,
+                workers=self.listener_settings["workers"],
+                queue_size=self.listener_settings["queue_size"],
+                name="log_service"
+            )
 
     async def initialize_elasticsearch(self):
         """Initialize Elasticsearch client"""
@@ -26,8 +56,15 @@ class RedisListener:
                 verify_certs=False
             )
             # Test connection
-            await self.es_client.info()
-            logger.info("Successfully connected to Elasticsearch")
+            try:
+                await self.es_client.info()
+                logger.info("Successfully connected to Elasticsearch")
+            except (TransportError, ApiError) as e:
+                # Logs are spilled to the local disk buffer until Elasticsearch is reachable
+                logger.warning(f"Elasticsearch is not reachable yet: {e}")
+            on_delivered = self.consumer.ack if isinstance(self.consumer, StreamConsumer) else None
+            self.indexer = BulkIndexer(self.es_client, on_delivered=on_delivered)
+            await self.indexer.start()
         except Exception as e:
             logger.error(f"Failed to initialize Elasticsearch: {e}")
             raise
@@ -36,52 +73,58 @@ class RedisListener:
         """Start listening to Redis pub/sub events"""
         try:
             await self.initialize_elasticsearch()
-            self.running = True
-            self.pubsub = redis_client.pubsub()
-            await self.pubsub.subscribe('logs')
+            await self.consumer.start()
             logger.info("Started listening to Redis pub/sub events")
-            
-            while self.running:
-                try:
-                    message = await self.pubsub.get_message(ignore_subscribe_messages=True)
-                    if message:
-                        await self.process_message(message)
-                except Exception as e:
-                    logger.error(f"Error processing message: {e}")
-                await asyncio.sleep(0.1)
         except Exception as e:
             logger.error(f"Error in start_listening: {e}")
             raise
 
     async def stop_listening(self):
-        """Stop listening to Redis pub/sub events"""
-        self.running = False
-        if self.pubsub:
-            await self.pubsub.unsubscribe()
-            await self.pubsub.close()
+        """Stop listening and drain already received messages before closing Elasticsearch"""
+        await self.consumer.stop(drain_timeout=self.listener_settings["drain_timeout"])
+        if self.indexer:
+            await self.indexer.close()
         if self.es_client:
             await self.es_client.close()
         logger.info("Stopped listening to Redis pub/sub events")
 
+    def metrics(self) -> dict:
+        """Queue, worker and bulk indexing metrics"""
+        metrics = self.consumer.metrics()
+        if self.indexer:
+            metrics["indexer"] = self.indexer.metrics()
+        return metrics
+
     async def process_message(self, message):
-        """Process received message and store in Elasticsearch"""
+        """
+        Process received message and add it to the Elasticsearch bulk buffer.
+        Stream entries are acknowledged by the indexer once delivered; errors are raised
+        so that the entry stays pending and is redelivered.
+        """
+        ack_id = message.get("id")
+        if message["type"] != "message":
+            await self._ack_now(ack_id)
+            return
         try:
-            if message["type"] == "message":
-                data = json.loads(message["data"])
-                log_entry = {
-                    'timestamp': datetime.now().isoformat(),
-                    'service': data.get('service', 'unknown'),
-                    'level': data.get('level', 'info'),
-                    'message': data.get('message', ''),
-                    'metadata': data.get('metadata', {})
-                }
-                
-                await self.es_client.index(
-                    index='logs',
-                    document=log_entry
-                )
-                logger.info(f"Successfully stored log entry: {log_entry}")
-        except Exception as e:
-            logger.error(f"Error storing log in Elasticsearch: {e}")
+            data = json.loads(message["data"])
+            log_entry = {
+                'timestamp': datetime.now().isoformat(),
+                'service': data.get('service', 'unknown'),
+                'level': data.get('level', 'info'),
+                'message': data.get('message', ''),
+                'metadata': data.get('metadata', {})
+            }
+        except (TypeError, ValueError, AttributeError) as e:
+            # A malformed entry would fail on every redelivery: acknowledge and skip it
+            logger.error(f"Skipping malformed log entry: {e}")
+            await self._ack_now(ack_id)
+            return
+
+        await self.indexer.add(log_entry, ack_id)
+        logger.debug(f"Buffered log entry: {log_entry}")
+
+    async def _ack_now(self, ack_id):
+        if ack_id is not None and isinstance(self.consumer, StreamConsumer):
+            await self.consumer.ack([ack_id])
 
 redis_listener = RedisListener() 
\ No newline at end of file
@@ -31,9 +31,79 @@ class Settings(BaseSettings):
     MINIO_ACCESS_KEY: str
     MINIO_SECRET_KEY: str
     MINIO_BUCKET: str
+    MINIO_PUBLIC_ENDPOINT: str = "localhost:9000"  # Адрес MinIO, доступный клиентам (для presigned URL)
+    MINIO_REGION: str = "us-east-1"  # Регион для подписи URL (без запроса к MinIO)
+    MINIO_POOL_SIZE: int = 50  # Максимум соединений S3-клиента к MinIO на воркер
     
     TMDB_API_KEY: str = ""  # Опциональное поле для TMDB API
 
+    MOVIE_CACHE_TTL: int = 86400  # TTL кэша карточки фильма, секунды (сбрасывается событиями ETL)
+    CATALOG_CACHE_TTL: int = 3600  # TTL кэша страниц каталога, похожих фильмов и актеров, секунды
+    MOVIE_CACHE_NEGATIVE_TTL: int = 60  # TTL кэша отсутствующих фильмов, секунды
+    CACHE_TTL_JITTER: float = 0.1  # Разброс TTL (доля), чтобы ключи не истекали одновременно
+    CACHE_LOCK_TIMEOUT: float = 5.0  # Время жизни блокировки на загрузку ключа, секунды
+    CACHE_LOCK_WAIT: float = 2.0  # Сколько ждать результата чужой загрузки, секунды
+    CACHE_INVALIDATION_WINDOW: float = 0.5  # Окно накопления событий movie_cache_update, секунды
+    CACHE_INVALIDATION_BATCH_SIZE: int = 500  # Максимум фильмов в одной пачке инвалидации
+
+    MEDIA_TOKEN_TTL: int = 6 * 3600  # Срок ссылки на просмотр/скачивание (?token=...), секунды: плеер докачивает видео дольше срока access-токена
+    CORS_ORIGINS: str = "http://localhost:3000"  # Origins фронтенда через запятую: только им разрешены запросы с cookie
+    REVOCATION_BLOOM_ENABLED: bool = True  # Фильтр Блума отозванных токенов в памяти воркера (без него отзыв проверяется запросом к Redis)
+    REVOCATION_BLOOM_CAPACITY: int = 100000  # На сколько отозванных токенов рассчитан фильтр
+    REVOCATION_BLOOM_ERROR_RATE: float = 0.001  # Доля ложноположительных ответов фильтра
+    REVOCATION_BLOOM_REBUILD_INTERVAL: float = 300.0  # Как часто пересобирать фильтр без истекших токенов, секунды
+    REVOCATION_FAIL_OPEN: bool = False  # Принимать токены, если Redis недоступен для проверки отзыва (иначе 503)
+
+    LISTENER_WORKERS: int = 4  # Количество обработчиков сообщений pub/sub
+    LISTENER_QUEUE_SIZE: int = 1000  # Размер внутренней очереди сообщений
+    LISTENER_DRAIN_TIMEOUT: float = 10.0  # Сколько дообрабатывать очередь при остановке, секунды
+
+    STORAGE_DELIVERY_MODE: str = "proxy"  # proxy - данные идут через воркер, redirect - 302 на presigned URL
+    PRESIGNED_URL_TTL: int = 3600  # Срок действия presigned URL, секунды
+    PRESIGNED_URL_REFRESH_MARGIN: int = 300  # За сколько до истечения выдавать новый URL вместо кэшированного, секунды
+
+    UPLOAD_PART_SIZE: int = 16 * 1024 * 1024  # Размер части multipart-загрузки, байты (не меньше 5 МБ)
+    UPLOAD_PART_CONCURRENCY: int = 4  # Сколько частей одной загрузки отправлять в MinIO параллельно
+    UPLOAD_MAX_PART_SIZE: int = 64 * 1024 * 1024  # Максимальный размер части в возобновляемой загрузке, байты
+    UPLOAD_SESSION_TTL: int = 86400  # Сколько хранить незавершенную возобновляемую загрузку, секунды
+    UPLOAD_REAP_INTERVAL: int = 300  # Как часто отменять в MinIO загрузки истекших сессий, секунды
+
+    IMAGE_WIDTHS: str = "92,154,185,200,300,342,500,780,1280"  # Разрешенные ширины копий изображений
+    IMAGE_QUALITY: int = 80  # Качество сжатия копий
+    IMAGE_WORKERS: int = 2  # Процессов для ресайза и кодирования
+    IMAGE_MEMORY_CACHE_BYTES: int = 64 * 1024 * 1024  # LRU-кэш копий в памяти воркера, байты
+    IMAGE_DISK_CACHE_DIR: str = "/tmp/image_cache"  # Дисковый кэш копий
+    IMAGE_DISK_CACHE_BYTES: int = 1024 * 1024 * 1024  # Максимальный объем дискового кэша, байты
+    IMAGE_CACHE_MAX_AGE: int = 86400  # Cache-Control max-age для копий, секунды
+    IMAGE_INGEST_CONCURRENCY: int = 8  # Одновременных скачиваний при загрузке изображений по URL
+    IMAGE_FETCH_TIMEOUT: float = 30.0  # Таймаут скачивания изображения по URL, секунды
+
+    STREAM_CHUNK_SIZE: int = 512 * 1024  # Размер куска при проксировании видео, байты (256 КБ - 1 МБ)
+    STREAM_POOL_SIZE: int = 100  # Максимум соединений к хранилищу в пуле воркера
+    STREAM_KEEPALIVE_TIMEOUT: float = 30.0  # Сколько держать простаивающее соединение к хранилищу, секунды
+    STREAM_CONNECT_TIMEOUT: float = 5.0  # Таймаут подключения к хранилищу, секунды
+    STREAM_READ_TIMEOUT: float = 30.0  # Таймаут чтения куска из хранилища, секунды
+    STREAM_META_TTL: int = 300  # Сколько кэшировать размер и ETag видеофайла, секунды
+    STREAM_META_MAX_ENTRIES: int = 10000  # Максимум объектов в кэше метаданных воркера
+    STREAM_MAX_RANGES: int = 16  # Максимум диапазонов в одном multi-range запросе
+
+    PACKAGING_FFMPEG: str = "ffmpeg"  # Путь к ffmpeg
+    PACKAGING_FFPROBE: str = "ffprobe"  # Путь к ffprobe
+    PACKAGING_LADDER: str = "1080:5000,720:2800,480:1400,360:800"  # Качества HLS: высота:битрейт видео (кбит/с)
+    PACKAGING_AUDIO_BITRATE: int = 128  # Битрейт аудио, кбит/с
+    PACKAGING_SEGMENT_SECONDS: int = 6  # Длина HLS-сегмента, секунды
+    PACKAGING_PRESET: str = "veryfast"  # Пресет x264
+    PACKAGING_CONCURRENCY: int = 1  # Сколько фильмов упаковывать одновременно на воркер
+    PACKAGING_WORK_DIR: str = "/tmp/packaging"  # Временный каталог для сегментов
+    PACKAGING_UPLOAD_CONCURRENCY: int = 8  # Параллельных загрузок сегментов в MinIO
+    PACKAGING_HEARTBEAT_INTERVAL: int = 60  # Как часто идущая упаковка обновляет updated_at, секунды
+    PACKAGING_STALE_AFTER: int = 600  # Упаковка без обновлений дольше этого считается брошенной упавшим воркером, секунды
+    PACKAGING_SUPERSEDED_RETENTION: int = 6 * 3600  # Сколько хранить замененную версию упаковки (не меньше срока presigned URL плейлистов), секунды
+    PACKAGING_CLEANUP_INTERVAL: int = 600  # Как часто удалять замененные версии с истекшим сроком хранения, секунды
+
+    LOG_TRANSPORT: str = "pubsub"  # Транспорт логов: pubsub (канал logs) или stream (Redis Stream logs)
+    LOG_STREAM_MAXLEN: int = 1000000  # Примерный предел длины потока логов (XADD MAXLEN ~)
+
     model_config = SettingsConfigDict(
         env_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env")
     )
@@ -58,9 +128,105 @@ def get_db_url():
 def get_auth_data():
     return {"secret_key": settings.SECRET_KEY, "algorithm": settings.ALGORITHM}
 
+def get_media_token_ttl():
+    return settings.MEDIA_TOKEN_TTL
+
 def get_redis_settings():
     return {"host": settings.REDIS_HOST, "port": settings.REDIS_PORT}
 
+def get_cache_settings():
+    return {
+        "movie_ttl": settings.MOVIE_CACHE_TTL,
+        "movie_negative_ttl": settings.MOVIE_CACHE_NEGATIVE_TTL,
+        "catalog_ttl": settings.CATALOG_CACHE_TTL,
+        "ttl_jitter": settings.CACHE_TTL_JITTER,
+        "lock_timeout": settings.CACHE_LOCK_TIMEOUT,
+        "lock_wait": settings.CACHE_LOCK_WAIT,
+        "invalidation_window": settings.CACHE_INVALIDATION_WINDOW,
+        "invalidation_batch_size": settings.CACHE_INVALIDATION_BATCH_SIZE
+    }
+
+def get_cors_origins():
+    return [origin.strip() for origin in settings.CORS_ORIGINS.split(",") if origin.strip()]
+
+def get_revocation_settings():
+    return {
+        "bloom_enabled": settings.REVOCATION_BLOOM_ENABLED,
+        "bloom_capacity": settings.REVOCATION_BLOOM_CAPACITY,
+        "bloom_error_rate": settings.REVOCATION_BLOOM_ERROR_RATE,
+        "bloom_rebuild_interval": settings.REVOCATION_BLOOM_REBUILD_INTERVAL,
+        "fail_open": settings.REVOCATION_FAIL_OPEN
+    }
+
+def get_listener_settings():
+    return {
+        "workers": settings.LISTENER_WORKERS,
+        "queue_size": settings.LISTENER_QUEUE_SIZE,
+        "drain_timeout": settings.LISTENER_DRAIN_TIMEOUT
+    }
+
+def get_upload_settings():
+    return {
+        "part_size": max(settings.UPLOAD_PART_SIZE, 5 * 1024 * 1024),
+        "part_concurrency": settings.UPLOAD_PART_CONCURRENCY,
+        "max_part_size": settings.UPLOAD_MAX_PART_SIZE,
+        "session_ttl": settings.UPLOAD_SESSION_TTL,
+        "reap_interval": settings.UPLOAD_REAP_INTERVAL
+    }
+
+def get_image_settings():
+    return {
+        "widths": sorted(int(width) for width in settings.IMAGE_WIDTHS.split(",")),
+        "quality": settings.IMAGE_QUALITY,
+        "workers": settings.IMAGE_WORKERS,
+        "memory_cache_bytes": settings.IMAGE_MEMORY_CACHE_BYTES,
+        "disk_cache_dir": settings.IMAGE_DISK_CACHE_DIR,
+        "disk_cache_bytes": settings.IMAGE_DISK_CACHE_BYTES,
+        "max_age": settings.IMAGE_CACHE_MAX_AGE,
+        "ingest_concurrency": settings.IMAGE_INGEST_CONCURRENCY,
+        "fetch_timeout": settings.IMAGE_FETCH_TIMEOUT
+    }
+
+def get_streaming_settings():
+    return {
+        "chunk_size": settings.STREAM_CHUNK_SIZE,
+        "pool_size": settings.STREAM_POOL_SIZE,
+        "keepalive_timeout": settings.STREAM_KEEPALIVE_TIMEOUT,
+        "connect_timeout": settings.STREAM_CONNECT_TIMEOUT,
+        "read_timeout": settings.STREAM_READ_TIMEOUT,
+        "meta_ttl": settings.STREAM_META_TTL,
+        "meta_max_entries": settings.STREAM_META_MAX_ENTRIES,
+        "max_ranges": settings.STREAM_MAX_RANGES
+    }
+
+def get_packaging_settings():
+    ladder = []
+    for rung in settings.PACKAGING_LADDER.split(","):
+        height, bitrate = rung.split(":")
+        ladder.append((int(height), int(bitrate)))
+    return {
+        "ffmpeg": settings.PACKAGING_FFMPEG,
+        "ffprobe": settings.PACKAGING_FFPROBE,
+        "ladder": sorted(ladder, reverse=True),
+        "audio_bitrate": settings.PACKAGING_AUDIO_BITRATE,
+        "segment_seconds": settings.PACKAGING_SEGMENT_SECONDS,
+        "preset": settings.PACKAGING_PRESET,
+        "concurrency": settings.PACKAGING_CONCURRENCY,
+        "work_dir": settings.PACKAGING_WORK_DIR,
+        "upload_concurrency": settings.PACKAGING_UPLOAD_CONCURRENCY,
+        "heartbeat_interval": settings.PACKAGING_HEARTBEAT_INTERVAL,
+        "stale_after": settings.PACKAGING_STALE_AFTER,
+        # Плейлист с presigned URL кэшируется клиентом до минуты (Cache-Control плейлистов)
+        "superseded_retention": max(settings.PACKAGING_SUPERSEDED_RETENTION, settings.PRESIGNED_URL_TTL + 60),
+        "cleanup_interval": settings.PACKAGING_CLEANUP_INTERVAL
+    }
+
+def get_log_transport_settings():
+    return {
+        "transport": settings.LOG_TRANSPORT,
+        "stream_maxlen": settings.LOG_STREAM_MAXLEN
+    }
+
 def get_elasticsearch_settings():
     return {
         "host": settings.ELASTICSEARCH_HOST,
@@ -80,5 +246,15 @@ def get_minio_settings():
         "endpoint": settings.MINIO_ENDPOINT,
         "access_key": settings.MINIO_ACCESS_KEY,
         "secret_key": settings.MINIO_SECRET_KEY,
-        "bucket": settings.MINIO_BUCKET
+        "bucket": settings.MINIO_BUCKET,
+        "public_endpoint": settings.MINIO_PUBLIC_ENDPOINT,
+        "region": settings.MINIO_REGION,
+        "pool_size": settings.MINIO_POOL_SIZE
+    }
+
+def get_delivery_settings():
+    return {
+        "mode": settings.STORAGE_DELIVERY_MODE,
+        "presigned_ttl": settings.PRESIGNED_URL_TTL,
+        "presigned_refresh_margin": settings.PRESIGNED_URL_REFRESH_MARGIN
     }
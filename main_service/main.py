@@ -5,11 +5,21 @@ from main_service.routers.movies_router import router as movies_router
 from main_service.routers.files_router import router as files_router
 from main_service.routers.actors import router as actors_router
 from main_service.routers.streaming_router import router as streaming_router
+from main_service.routers.images_router import router as images_router
 from fastapi.responses import JSONResponse, HTMLResponse
 from main_service.services.redis_listener_service import redis_listener
+from main_service.services.streaming_service import streaming_service
+from main_service.services.file_service import file_service
+from main_service.services.packaging_service import packaging_service
+from main_service.services.image_service import image_service
+from main_service.services.upload_service import upload_session_service
+from main_service.config import get_cors_origins
+from main_service.services.movies_service import MovieService
+from main_service.services.dependencies_service import revocation_list
 from shared.tracing.tracer import get_tracer
 from main_service.database import engine
 import asyncio
+import logging
 import os
 import io
 
@@ -27,23 +37,16 @@ app = FastAPI(
 tracer.instrument_all(app=app, sqlalchemy_engine=engine)
 
 # Настройка CORS для фронтенда
+# Cookie users_access_token браузер отправляет только явно перечисленным origins
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Разрешаем все origins для отладки
-    allow_credentials=False,  # Отключаем credentials для отладки
+    allow_origins=get_cors_origins(),
+    allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Дополнительный middleware для CORS (на случай если стандартный не работает)
-@app.middleware("http")
-async def add_cors_headers(request: Request, call_next):
-    response = await call_next(request)
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-    response.headers["Access-Control-Allow-Headers"] = "*"
-    return response
-
 # Подключаем статические файлы
 static_dir = "/app/static"
 if not os.path.exists(static_dir):
@@ -54,11 +57,25 @@ app.mount("/static", StaticFiles(directory=static_dir), name="static")
 async def startup_event():
     """Запускает прослушивание Redis при старте приложения"""
     asyncio.create_task(redis_listener.start_listening())
+    try:
+        await file_service.start()
+    except Exception as e:
+        # MinIO может подняться позже - bucket проверим при первом обращении
+        logging.getLogger(__name__).warning(f"Object storage is not ready yet: {e}")
+    asyncio.create_task(packaging_service.start())
+    await upload_session_service.start()
+    await revocation_list.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Останавливает прослушивание Redis при завершении работы приложения"""
     await redis_listener.stop_listening()
+    await packaging_service.shutdown()
+    await upload_session_service.close()
+    await streaming_service.close()
+    await file_service.close()
+    image_service.close()
+    await revocation_list.close()
 
 @app.get("/health")
 async def health_check():
@@ -67,7 +84,8 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "main_service",
-        "trace_id": get_trace_id()
+        "trace_id": get_trace_id(),
+        "listener": redis_listener.metrics()
     }
 
 @app.exception_handler(Exception)
@@ -83,41 +101,28 @@ def home_page():
 
 @app.get("/proxy/poster/{movie_id}")
 async def proxy_poster(movie_id: int):
-    """Проксирует постеры из MinIO для избежания CORS проблем"""
-    from fastapi.responses import StreamingResponse
-    import aiohttp
+    """Проксирует постеры из MinIO для избежания CORS проблем (или перенаправляет на presigned URL)"""
+    from fastapi.responses import StreamingResponse, RedirectResponse
     import logging
-    from aiobotocore.session import get_session
     
     logger = logging.getLogger(__name__)
+    poster_path = f'movies/{movie_id}/poster.jpg'
+    
+    if file_service.redirect_mode:
+        # Подписываем только постер фильма из каталога (карточка берется из кэша)
+        if await MovieService.get_movie_or_none_by_id(movie_id) is None:
+            return JSONResponse(status_code=404, content={"detail": "Фильм не найден"})
+        return RedirectResponse(await file_service.get_presigned_url(poster_path), status_code=302)
     
     try:
-        # Используем aiobotocore для доступа к MinIO
-        session = get_session()
-        async with session.create_client(
-            's3',
-            endpoint_url='http://minio:9000',
-            aws_access_key_id='minioadmin',
-            aws_secret_access_key='minioadmin123',
-            region_name='us-east-1'
-        ) as s3_client:
-            
-            # Получаем объект из S3
-            response = await s3_client.get_object(
-                Bucket='cinema-files',
-                Key=f'movies/{movie_id}/poster.jpg'
-            )
-            
-            # Читаем содержимое
-            content = await response['Body'].read()
-            logger.info(f"Successfully fetched poster, size: {len(content)} bytes")
-            
+        # Общий S3-клиент воркера, постер отдается кусками без чтения целиком
+        poster_chunks = await file_service.download_file(poster_path)
+        if poster_chunks is not None:
             return StreamingResponse(
-                io.BytesIO(content),
+                poster_chunks,
                 media_type="image/jpeg",
                 headers={"Cache-Control": "max-age=3600"}
             )
-            
     except Exception as e:
         logger.error(f"Error fetching poster: {e}")
     
@@ -159,17 +164,16 @@ def demo_page():
             <div id="movies" class="movie-grid"></div>
         </div>
         <script>
-            fetch('/movies/')
+            fetch('/movies/?limit=20&order_by=rating&desc=true')
                 .then(r => r.json())
                 .then(movies => {
                     const container = document.getElementById('movies');
                     movies.sort((a, b) => (b.poster_url ? 1 : 0) - (a.poster_url ? 1 : 0) || b.rating - a.rating)
-                        .slice(0, 20)
                         .forEach(movie => {
                             const card = document.createElement('div');
                             card.className = 'movie-card';
                             const posterUrl = movie.poster_url ? 
-                                `/proxy/poster/${movie.id}` : 
+                                `/images/movies/${movie.id}/poster?w=300` : 
                                 'data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjQwMCIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj48cmVjdCB3aWR0aD0iMTAwJSIgaGVpZ2h0PSIxMDAlIiBmaWxsPSIjMzMzIi8+PHRleHQgeD0iNTAlIiB5PSI1MCUiIGZvbnQtZmFtaWx5PSJBcmlhbCIgZm9udC1zaXplPSIxOCIgZmlsbD0iI2ZmZiIgdGV4dC1hbmNob3I9Im1pZGRsZSIgZHk9Ii4zZW0iPk5vIFBvc3RlcjwvdGV4dD48L3N2Zz4=';
                             card.innerHTML = `
                                 <img src="${posterUrl}" 
@@ -192,4 +196,5 @@ def demo_page():
 app.include_router(movies_router)
 app.include_router(files_router)
 app.include_router(actors_router)
-app.include_router(streaming_router)
\ No newline at end of file
+app.include_router(streaming_router)
+app.include_router(images_router)
\ No newline at end of file
@@ -0,0 +1,33 @@
+"""Add superseded_hls_versions table
+
+Revision ID: b3e7f1a9d5c2
+Revises: f2c9a7e3b8d4
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3e7f1a9d5c2'
+down_revision: Union[str, None] = 'f2c9a7e3b8d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('superseded_hls_versions',
+    sa.Column('hls_prefix', sa.String(), nullable=False),
+    sa.Column('movie_id', sa.Integer(), nullable=False),
+    sa.Column('superseded_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('hls_prefix')
+    )
+    op.create_index('ix_superseded_hls_versions_superseded_at', 'superseded_hls_versions', ['superseded_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_superseded_hls_versions_superseded_at', table_name='superseded_hls_versions')
+    op.drop_table('superseded_hls_versions')
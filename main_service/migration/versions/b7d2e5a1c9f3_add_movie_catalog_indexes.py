@@ -0,0 +1,35 @@
+"""Add movie catalog indexes
+
+Revision ID: b7d2e5a1c9f3
+Revises: a8e2c49177c0
+Create Date: 2025-06-10 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2e5a1c9f3'
+down_revision: Union[str, None] = 'a8e2c49177c0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Индексы под keyset-пагинацию каталога: ORDER BY <поле>, id
+    op.create_index('ix_movies_rating_id', 'movies', ['rating', 'id'])
+    op.create_index('ix_movies_release_date_id', 'movies', ['release_date', 'id'])
+    # Поиск по префиксу названия: lower(title) LIKE 'prefix%'
+    op.create_index('ix_movies_title_lower_pattern', 'movies', [sa.text('lower(title) text_pattern_ops')])
+    # Фильтр по жанру: EXISTS (... WHERE genre_id = :genre_id AND movie_id = movies.id)
+    op.create_index('ix_movie_genres_genre_id_movie_id', 'movie_genres', ['genre_id', 'movie_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_movie_genres_genre_id_movie_id', table_name='movie_genres')
+    op.drop_index('ix_movies_title_lower_pattern', table_name='movies')
+    op.drop_index('ix_movies_release_date_id', table_name='movies')
+    op.drop_index('ix_movies_rating_id', table_name='movies')
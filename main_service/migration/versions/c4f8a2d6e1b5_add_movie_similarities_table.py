@@ -0,0 +1,35 @@
+"""Add movie_similarities table
+
+Revision ID: c4f8a2d6e1b5
+Revises: b7d2e5a1c9f3
+Create Date: 2025-06-12 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f8a2d6e1b5'
+down_revision: Union[str, None] = 'b7d2e5a1c9f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('movie_similarities',
+    sa.Column('movie_id', sa.Integer(), nullable=False),
+    sa.Column('similar_movie_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['movie_id'], ['movies.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['similar_movie_id'], ['movies.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('movie_id', 'similar_movie_id')
+    )
+    op.create_index('ix_movie_similarities_movie_id_score', 'movie_similarities', ['movie_id', 'score'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_movie_similarities_movie_id_score', table_name='movie_similarities')
+    op.drop_table('movie_similarities')
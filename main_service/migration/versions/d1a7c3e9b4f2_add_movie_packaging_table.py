@@ -0,0 +1,35 @@
+"""Add movie_packaging table
+
+Revision ID: d1a7c3e9b4f2
+Revises: c4f8a2d6e1b5
+Create Date: 2025-06-14 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd1a7c3e9b4f2'
+down_revision: Union[str, None] = 'c4f8a2d6e1b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('movie_packaging',
+    sa.Column('movie_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('hls_prefix', sa.String(), nullable=True),
+    sa.Column('renditions', sa.String(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['movie_id'], ['movies.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('movie_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('movie_packaging')
@@ -0,0 +1,29 @@
+"""Add tmdb_id to actors table
+
+Revision ID: e4b8d1f6a2c7
+Revises: d1a7c3e9b4f2
+Create Date: 2025-06-20 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b8d1f6a2c7'
+down_revision: Union[str, None] = 'd1a7c3e9b4f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ETL сопоставляет актеров по ID из TMDB и делает upsert ON CONFLICT (tmdb_id)
+    op.add_column('actors', sa.Column('tmdb_id', sa.Integer(), nullable=True))
+    op.create_unique_constraint('actors_tmdb_id_key', 'actors', ['tmdb_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('actors_tmdb_id_key', 'actors', type_='unique')
+    op.drop_column('actors', 'tmdb_id')
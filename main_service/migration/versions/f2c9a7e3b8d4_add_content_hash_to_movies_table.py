@@ -0,0 +1,27 @@
+"""Add content_hash to movies table
+
+Revision ID: f2c9a7e3b8d4
+Revises: e4b8d1f6a2c7
+Create Date: 2025-06-24 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c9a7e3b8d4'
+down_revision: Union[str, None] = 'e4b8d1f6a2c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ETL сравнивает хэш содержимого фильма и не перезаписывает неизменившиеся фильмы
+    op.add_column('movies', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('movies', 'content_hash')
@@ -10,6 +10,7 @@ from datetime import datetime
 # Модель актера
 class Actor(Base):
     
+    tmdb_id: Mapped[int] = mapped_column(Integer, unique=True, nullable=True)  # ID из TMDB API
     name: Mapped[str] = mapped_column(String(255), nullable=False)  # Имя актера
     birth_date: Mapped[Date] = mapped_column(Date, nullable=True)  # Дата рождения  
     photo_url: Mapped[str_null_true]  # URL фото актера
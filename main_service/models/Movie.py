@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, Text, Date, TIMESTAMP, ForeignKey, UniqueConstraint, Table, func
+from sqlalchemy import Integer, String, Text, Date, TIMESTAMP, ForeignKey, UniqueConstraint, Table, Index, func, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -13,6 +13,13 @@ from datetime import datetime
 
 # Модель фильма
 class Movie(Base):
+    __table_args__ = (
+        # Составные индексы под keyset-пагинацию каталога: (поле сортировки, id)
+        Index("ix_movies_rating_id", "rating", "id"),
+        Index("ix_movies_release_date_id", "release_date", "id"),
+        # Поиск по префиксу названия: lower(title) LIKE 'prefix%'
+        Index("ix_movies_title_lower_pattern", text("lower(title) text_pattern_ops")),
+    )
 
     tmdb_id: Mapped[int] = mapped_column(Integer, unique=True, nullable=True)  # ID из TMDB API
     title: Mapped[str_null_true]
@@ -24,6 +31,7 @@ class Movie(Base):
     poster_url: Mapped[str_null_true]  # URL постера в MinIO
     backdrop_url: Mapped[str_null_true]  # URL фонового изображения в MinIO
     trailer_url: Mapped[str_null_true]  # URL трейлера в MinIO
+    content_hash: Mapped[str] = mapped_column(String(64), nullable=True)  # Хэш данных из TMDB, по нему ETL пропускает неизменившиеся фильмы
 
     genres: Mapped[list["Genre"]] = relationship("Genre",
                                                  secondary=movie_genres,
@@ -19,12 +19,12 @@ class User(Base):
     favorites: Mapped[list["Movie"]] = relationship("Movie",
                                                  secondary=user_favorites,
                                                  back_populates="favorites_users",
-                                                 lazy='joined')
+                                                 lazy='select')
 
     watchlists: Mapped[list["Movie"]] = relationship("Movie",
                                                  secondary=user_watchlist,
                                                  back_populates="watchlists_users",
-                                                 lazy='joined')
+                                                 lazy='select')
 
     def to_dict(self) -> dict:
         return {
@@ -6,6 +6,8 @@ from main_service.models.movie_genres import movie_genres
 from main_service.models.user_favorites import user_favorites
 from main_service.models.user_watchlist import user_watchlist
 from main_service.models.movie_actors import movie_actors
+from main_service.models.movie_similarities import movie_similarities
+from main_service.models.movie_packaging import movie_packaging, superseded_hls_versions
 
 # Import models
 from main_service.models.Genre import Genre
@@ -20,6 +22,9 @@ __all__ = [
     "user_favorites", 
     "user_watchlist",
     "movie_actors",
+    "movie_similarities",
+    "movie_packaging",
+    "superseded_hls_versions",
     "Genre",
     "Movie",
     "User",
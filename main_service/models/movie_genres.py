@@ -1,9 +1,11 @@
-from sqlalchemy import Table, Integer, ForeignKey, Column
+from sqlalchemy import Table, Integer, ForeignKey, Column, Index
 from main_service.database import Base
 
 movie_genres = Table(
     'movie_genres',
     Base.metadata,
     Column('movie_id', Integer, ForeignKey('movies.id'), primary_key=True),
-    Column('genre_id', Integer, ForeignKey('genres.id'), primary_key=True)
+    Column('genre_id', Integer, ForeignKey('genres.id'), primary_key=True),
+    # Обратный индекс к PK (movie_id, genre_id) для фильтра каталога по жанру
+    Index('ix_movie_genres_genre_id_movie_id', 'genre_id', 'movie_id')
 )
@@ -0,0 +1,24 @@
+from sqlalchemy import Table, Integer, String, Text, TIMESTAMP, ForeignKey, Column, func
+from main_service.database import Base
+
+# Статус упаковки фильма в HLS (см. main_service/services/packaging_service.py)
+movie_packaging = Table(
+    'movie_packaging',
+    Base.metadata,
+    Column('movie_id', Integer, ForeignKey('movies.id', ondelete='CASCADE'), primary_key=True),
+    Column('status', String(20), nullable=False),  # pending, processing, ready, failed
+    Column('hls_prefix', String, nullable=True),  # Префикс объектов готовой упаковки в MinIO
+    Column('renditions', String, nullable=True),  # Высоты качеств через запятую, например 1080,720,480
+    Column('error', Text, nullable=True),
+    Column('updated_at', TIMESTAMP, server_default=func.now(), nullable=False)
+)
+
+# Замененные версии упаковки: удаляются из MinIO после PACKAGING_SUPERSEDED_RETENTION,
+# пока у зрителей еще могут быть плейлисты и presigned URL на старую версию
+superseded_hls_versions = Table(
+    'superseded_hls_versions',
+    Base.metadata,
+    Column('hls_prefix', String, primary_key=True),
+    Column('movie_id', Integer, nullable=False),
+    Column('superseded_at', TIMESTAMP, server_default=func.now(), nullable=False)
+)
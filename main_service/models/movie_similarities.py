@@ -0,0 +1,12 @@
+from sqlalchemy import Table, Integer, Float, ForeignKey, Column, Index
+from main_service.database import Base
+
+# Предрассчитанные top-K похожих фильмов (строится ETL сервисом, см. etl_service/services/similarity_builder.py)
+movie_similarities = Table(
+    'movie_similarities',
+    Base.metadata,
+    Column('movie_id', Integer, ForeignKey('movies.id', ondelete='CASCADE'), primary_key=True),
+    Column('similar_movie_id', Integer, ForeignKey('movies.id', ondelete='CASCADE'), primary_key=True),
+    Column('score', Float, nullable=False),
+    Index('ix_movie_similarities_movie_id_score', 'movie_id', 'score')
+)
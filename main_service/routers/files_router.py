@@ -1,12 +1,18 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request, Header
+from fastapi.responses import StreamingResponse, RedirectResponse, Response
+from email.utils import format_datetime
 from typing import List, Optional
-import io
+from urllib.parse import quote
 import logging
+import mimetypes
 
 from main_service.services.file_service import file_service
-from main_service.models.User import User
-from main_service.services.dependencies_service import get_current_user
+from main_service.services.upload_service import upload_session_service
+from shared.auth.principal_cache import Principal
+from main_service.services.dependencies_service import (
+    get_current_user, authorize_file_download, create_media_token, file_resource
+)
+from main_service.utils import parse_range_header, is_not_modified
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,22 +20,30 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix='/files', tags=['Работа с файлами'])
 
+UPLOAD_READ_SIZE = 1024 * 1024
+
+async def iter_upload_file(file: UploadFile):
+    """Читает загруженный файл кусками, не поднимая его в память целиком"""
+    while True:
+        chunk = await file.read(UPLOAD_READ_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
 @router.post("/upload", summary="Загрузить файл")
 async def upload_file(
     file: UploadFile = File(...),
     folder: str = "uploads",
-    user_data: User = Depends(get_current_user)
+    user_data: Principal = Depends(get_current_user)
 ):
     """Загружает файл в MinIO"""
     try:
-        # Читаем содержимое файла
-        file_content = await file.read()
         file_path = f"{folder}/{file.filename}"
         
-        # Загружаем файл
-        file_url = await file_service.upload_file(
+        # Загружаем файл частями (multipart), память ограничена несколькими частями
+        file_url = await file_service.upload_stream(
             file_path, 
-            file_content, 
+            iter_upload_file(file), 
             file.content_type or "application/octet-stream"
         )
         
@@ -45,12 +59,79 @@ async def upload_file(
         logger.error(f"Error uploading file: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка загрузки файла: {str(e)}")
 
+async def get_upload_session_or_404(session_id: str, user_data: Principal) -> dict:
+    session = await upload_session_service.get(session_id, user_data.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Сессия загрузки не найдена или истекла")
+    return session
+
+@router.post("/uploads", summary="Начать возобновляемую загрузку")
+async def create_upload_session(
+    filename: str,
+    folder: str = "uploads",
+    content_type: str = "application/octet-stream",
+    user_data: Principal = Depends(get_current_user)
+):
+    """
+    Открывает сессию загрузки большого файла. Части отправляются через
+    PUT /files/uploads/{session_id}/parts/{part_number} (тело запроса - байты части,
+    необязательный заголовок Content-MD5), после обрыва соединения список уже
+    загруженных частей можно получить через GET /files/uploads/{session_id}.
+    """
+    try:
+        return await upload_session_service.create(user_data.id, f"{folder}/{filename}", content_type)
+    except Exception as e:
+        logger.error(f"Error creating upload session: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка создания загрузки: {str(e)}")
+
+@router.get("/uploads/{session_id}", summary="Состояние возобновляемой загрузки")
+async def get_upload_session(session_id: str, user_data: Principal = Depends(get_current_user)):
+    session = await get_upload_session_or_404(session_id, user_data)
+    return await upload_session_service.describe(session)
+
+@router.put("/uploads/{session_id}/parts/{part_number}", summary="Загрузить часть файла")
+async def upload_part(
+    session_id: str,
+    part_number: int,
+    request: Request,
+    content_md5: Optional[str] = Header(default=None),
+    user_data: Principal = Depends(get_current_user)
+):
+    session = await get_upload_session_or_404(session_id, user_data)
+    try:
+        return await upload_session_service.upload_part(session, part_number, request.stream(), content_md5)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error uploading part {part_number} of {session_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка загрузки части файла: {str(e)}")
+
+@router.post("/uploads/{session_id}/complete", summary="Завершить возобновляемую загрузку")
+async def complete_upload(session_id: str, user_data: Principal = Depends(get_current_user)):
+    session = await get_upload_session_or_404(session_id, user_data)
+    try:
+        file_url = await upload_session_service.complete(session)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "message": "Файл успешно загружен",
+        "file_url": file_url,
+        "file_path": session["file_path"],
+        "content_type": session["content_type"]
+    }
+
+@router.delete("/uploads/{session_id}", summary="Отменить возобновляемую загрузку")
+async def abort_upload(session_id: str, user_data: Principal = Depends(get_current_user)):
+    session = await get_upload_session_or_404(session_id, user_data)
+    await upload_session_service.abort(session)
+    return {"message": "Загрузка отменена", "session_id": session_id}
+
 @router.post("/upload-image-from-url", summary="Загрузить изображение по URL")
 async def upload_image_from_url(
     image_url: str,
     filename: str,
     folder: str = "images",
-    user_data: User = Depends(get_current_user)
+    user_data: Principal = Depends(get_current_user)
 ):
     """Скачивает изображение по URL и загружает в MinIO"""
     try:
@@ -71,32 +152,75 @@ async def upload_image_from_url(
         logger.error(f"Error uploading image from URL: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка загрузки изображения: {str(e)}")
 
+@router.get("/download-url/{file_path:path}", summary="Ссылка на скачивание файла")
+async def get_download_url(file_path: str, user_data: Principal = Depends(get_current_user)):
+    """Ссылка с токеном на MEDIA_TOKEN_TTL: докачка по Range работает и после истечения access-токена"""
+    token = create_media_token(user_data.id, file_resource(file_path))
+    return {"url": f"{router.prefix}/download/{quote(file_path)}?token={quote(token)}"}
+
 @router.get("/download/{file_path:path}", summary="Скачать файл")
-async def download_file(file_path: str):
-    """Скачивает файл из MinIO"""
+async def download_file(file_path: str, request: Request, user_id: int = Depends(authorize_file_download)):
+    """Скачивает файл из MinIO потоком, с поддержкой Range и условных запросов"""
+    file_name = file_path.split('/')[-1]
+    if file_service.redirect_mode:
+        return RedirectResponse(
+            await file_service.get_presigned_url(file_path, download_name=file_name),
+            status_code=302
+        )
     try:
-        file_data = await file_service.download_file(file_path)
+        file_info = await file_service.stat_file(file_path)
         
-        if file_data is None:
+        if file_info is None:
             raise HTTPException(status_code=404, detail="Файл не найден")
         
-        # Определяем тип контента по расширению файла
-        content_type = "application/octet-stream"
-        if file_path.lower().endswith(('.jpg', '.jpeg')):
-            content_type = "image/jpeg"
-        elif file_path.lower().endswith('.png'):
-            content_type = "image/png"
-        elif file_path.lower().endswith('.gif'):
-            content_type = "image/gif"
-        elif file_path.lower().endswith('.mp4'):
-            content_type = "video/mp4"
-        elif file_path.lower().endswith('.json'):
-            content_type = "application/json"
+        # Тип контента по расширению файла, иначе - тот, с которым файл загружали
+        content_type = mimetypes.guess_type(file_name)[0] or file_info["content_type"]
+        etag = file_info["etag"]
+        last_modified = file_info["last_modified"]
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(file_name)}"
+        }
+        if etag:
+            headers["ETag"] = etag
+        if last_modified:
+            headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+        
+        if is_not_modified(request.headers.get("If-None-Match"), request.headers.get("If-Modified-Since"),
+                           etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        
+        size = file_info["size"]
+        ranges = None
+        range_header = request.headers.get("Range")
+        if_range = request.headers.get("If-Range")
+        # If-Range: докачка возможна, только если файл не изменился с прошлого раза
+        if range_header and size > 0 and (if_range is None or if_range in (etag, headers.get("Last-Modified"))):
+            # Несколько диапазонов для скачивания не нужны - отдаем файл целиком
+            ranges = parse_range_header(range_header, size, max_ranges=1)
+        
+        if ranges == []:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        
+        if ranges:
+            start, end = ranges[0]
+            file_chunks = await file_service.download_file(file_path, byte_range=(start, end))
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+        else:
+            file_chunks = await file_service.download_file(file_path)
+            status_code = 200
+            headers["Content-Length"] = str(size)
+        
+        if file_chunks is None:
+            raise HTTPException(status_code=404, detail="Файл не найден")
         
         return StreamingResponse(
-            io.BytesIO(file_data),
+            file_chunks,
+            status_code=status_code,
             media_type=content_type,
-            headers={"Content-Disposition": f"attachment; filename={file_path.split('/')[-1]}"}
+            headers=headers
         )
         
     except HTTPException:
@@ -108,7 +232,7 @@ async def download_file(file_path: str):
 @router.delete("/delete/{file_path:path}", summary="Удалить файл")
 async def delete_file(
     file_path: str,
-    user_data: User = Depends(get_current_user)
+    user_data: Principal = Depends(get_current_user)
 ):
     """Удаляет файл из MinIO"""
     try:
@@ -128,11 +252,11 @@ async def delete_file(
 @router.get("/list", summary="Получить список файлов")
 async def list_files(
     prefix: str = "",
-    user_data: User = Depends(get_current_user)
+    user_data: Principal = Depends(get_current_user)
 ):
     """Возвращает список файлов в bucket"""
     try:
-        files = file_service.list_files(prefix)
+        files = await file_service.list_files(prefix)
         
         return {
             "files": files,
@@ -0,0 +1,78 @@
+from fastapi import APIRouter, HTTPException, Request, Response, Query
+from typing import Optional
+import logging
+
+from main_service.services.actors_service import ActorService
+from main_service.services.file_service import file_service
+from main_service.services.image_service import image_service, IMAGE_CONTENT_TYPES
+from main_service.services.movies_service import MovieService
+from main_service.utils import is_not_modified
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix='/images', tags=['Изображения'])
+
+
+async def image_response(request: Request, source_url: Optional[str],
+                         width: Optional[int], image_format: Optional[str]) -> Response:
+    """Отдает копию изображения нужной ширины и формата"""
+    if not source_url:
+        raise HTTPException(status_code=404, detail="Image not found")
+    bucket, file_path = file_service.parse_object_url(source_url)
+    if bucket != file_service.bucket_name:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    chosen_format = image_service.choose_format(image_format, request.headers.get("Accept", ""))
+    if chosen_format is None:
+        raise HTTPException(status_code=400, detail=f"Unsupported format, available: {image_service.formats}")
+    chosen_width = image_service.choose_width(width)
+
+    source_etag = await image_service.get_source_etag(file_path)
+    if source_etag is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    derivative_path = image_service.derivative_path(file_path, source_etag, chosen_width, chosen_format)
+    headers = {
+        "ETag": image_service.etag_for(derivative_path),
+        "Cache-Control": f"public, max-age={image_service.settings['max_age']}",
+    }
+    if image_format is None:
+        # Формат выбран по Accept - кэши должны различать ответы по нему
+        headers["Vary"] = "Accept"
+    if is_not_modified(request.headers.get("If-None-Match"), None, headers["ETag"], None):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        data = await image_service.get_derivative(file_path, derivative_path, chosen_width, chosen_format)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    except Exception as e:
+        logger.error(f"Error rendering {derivative_path}: {e}")
+        raise HTTPException(status_code=500, detail="Error rendering image")
+    return Response(content=data, media_type=IMAGE_CONTENT_TYPES[chosen_format], headers=headers)
+
+
+@router.get("/movies/{movie_id}/poster", summary="Постер фильма нужной ширины")
+async def get_movie_poster(request: Request, movie_id: int,
+                           w: Optional[int] = Query(default=None, ge=1),
+                           format: Optional[str] = Query(default=None, pattern="^(avif|webp|jpeg|jpg)$")):
+    movie = await MovieService.get_movie_or_none_by_id(movie_id)
+    return await image_response(request, movie and movie.get("poster_url"), w, format)
+
+
+@router.get("/movies/{movie_id}/backdrop", summary="Фоновое изображение фильма нужной ширины")
+async def get_movie_backdrop(request: Request, movie_id: int,
+                             w: Optional[int] = Query(default=None, ge=1),
+                             format: Optional[str] = Query(default=None, pattern="^(avif|webp|jpeg|jpg)$")):
+    movie = await MovieService.get_movie_or_none_by_id(movie_id)
+    return await image_response(request, movie and movie.get("backdrop_url"), w, format)
+
+
+@router.get("/actors/{actor_id}/photo", summary="Фото актера нужной ширины")
+async def get_actor_photo(request: Request, actor_id: int,
+                          w: Optional[int] = Query(default=None, ge=1),
+                          format: Optional[str] = Query(default=None, pattern="^(avif|webp|jpeg|jpg)$")):
+    actor = await ActorService.get_actor_details(actor_id)
+    return await image_response(request, actor and actor.get("photo_url"), w, format)
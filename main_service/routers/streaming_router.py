@@ -1,11 +1,19 @@
-from fastapi import APIRouter, HTTPException, Request, Response, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Request, Response, Depends, Path, Query
+from fastapi.responses import StreamingResponse, RedirectResponse
 from sqlalchemy import text
 from main_service.database import async_session_maker
+from main_service.services.streaming_service import streaming_service, ObjectMeta, to_internal_url
+from main_service.services.file_service import file_service
+from main_service.services.packaging_service import packaging_service, MASTER_PLAYLIST, HLS_CONTENT_TYPES
+from main_service.services.dependencies_service import (
+    get_current_user, authorize_movie_playback, create_media_token, movie_resource
+)
+from shared.auth.principal_cache import Principal
+from main_service.utils import parse_range_header
 import aiohttp
-import asyncio
-from typing import Optional
-import re
+import uuid
+from urllib.parse import quote
+from typing import List, Optional, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,98 +30,142 @@ async def get_movie_video_url(movie_id: int) -> Optional[str]:
             return row[0]
         return None
 
-def parse_range_header(range_header: str, file_size: int) -> tuple:
-    """Парсит Range header и возвращает start и end позиции"""
-    range_match = re.match(r'bytes=(\d+)-(\d*)', range_header)
-    if not range_match:
-        return 0, file_size - 1
-    
-    start = int(range_match.group(1))
-    end = int(range_match.group(2)) if range_match.group(2) else file_size - 1
-    
-    return start, min(end, file_size - 1)
-
-async def stream_from_url(url: str, start: int = 0, end: Optional[int] = None, chunk_size: int = 8192):
-    """Стримит данные из URL с поддержкой Range requests"""
-    headers = {}
-    if end is not None:
-        headers['Range'] = f'bytes={start}-{end}'
-    elif start > 0:
-        headers['Range'] = f'bytes={start}-'
-    
+async def open_range(video_url: str, meta: ObjectMeta, start: int, end: int):
+    """Открывает диапазон в хранилище, ошибки хранилища превращает в HTTP-ошибки"""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                if response.status not in [200, 206]:
-                    raise HTTPException(status_code=response.status, detail="Error streaming video")
-                
-                async for chunk in response.content.iter_chunked(chunk_size):
-                    yield chunk
-    except Exception as e:
-        logger.error(f"Error streaming from URL {url}: {e}")
-        raise HTTPException(status_code=500, detail="Error streaming video")
+        upstream = await streaming_service.open_range(video_url, meta, start, end)
+    except aiohttp.ClientError as e:
+        logger.error(f"Error streaming from URL {video_url}: {e}")
+        raise HTTPException(status_code=502, detail="Error streaming video")
+    if upstream is None:
+        # Файл изменился после кэширования размера - клиент повторит запрос с новыми данными
+        raise HTTPException(status_code=409, detail="Video file has changed, retry the request")
+    return upstream
+
+async def stream_multipart(video_url: str, meta: ObjectMeta, ranges: List[Tuple[int, int]], boundary: str):
+    """Отдает несколько диапазонов одним ответом multipart/byteranges"""
+    for start, end in ranges:
+        yield multipart_part_header(meta, start, end, boundary)
+        upstream = await streaming_service.open_range(video_url, meta, start, end)
+        if upstream is None:
+            # Заголовки уже отправлены - остается только оборвать ответ
+            raise RuntimeError(f"Video file {video_url} has changed during multipart response")
+        async for chunk in streaming_service.iter_response(upstream):
+            yield chunk
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+def multipart_part_header(meta: ObjectMeta, start: int, end: int, boundary: str) -> bytes:
+    return (f"\r\n--{boundary}\r\n"
+            f"Content-Type: {meta.content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{meta.size}\r\n\r\n").encode()
 
 @router.get("/{movie_id}")
-async def stream_movie(movie_id: int, request: Request):
-    """Стримит видео фильма с поддержкой Range requests"""
+async def stream_movie(movie_id: int, request: Request, user_id: int = Depends(authorize_movie_playback)):
+    """Стримит видео фильма с поддержкой Range requests (в том числе bytes=-N и нескольких диапазонов)"""
     
     # Получаем URL видео из базы данных
     video_url = await get_movie_video_url(movie_id)
     if not video_url:
         raise HTTPException(status_code=404, detail="Video not found for this movie")
     
-    # Для MinIO URL нужно добавить префикс если его нет
-    if not video_url.startswith(('http://', 'https://')):
-        # Предполагаем, что это относительный путь в MinIO
-        video_url = f"http://minio:9000/{video_url}"
-    elif "localhost:9000" in video_url:
-        # Заменяем localhost на minio для внутреннего доступа в Docker
-        video_url = video_url.replace("localhost:9000", "minio:9000")
+    if file_service.redirect_mode:
+        # Данные отдает MinIO напрямую, Range-запросы клиент шлет уже ему
+        bucket, file_path = file_service.parse_object_url(video_url)
+        return RedirectResponse(await file_service.get_presigned_url(file_path, bucket=bucket), status_code=302)
+    video_url = to_internal_url(video_url)
     
-    # Получаем размер файла
+    # Размер файла берется из кэша воркера, HEAD выполняется только при промахе
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.head(video_url) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=404, detail="Video file not found")
-                file_size = int(response.headers.get('Content-Length', 0))
-    except Exception as e:
+        meta = await streaming_service.get_object_meta(video_url)
+    except aiohttp.ClientError as e:
         logger.error(f"Error getting file size for {video_url}: {e}")
         raise HTTPException(status_code=500, detail="Error accessing video file")
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Video file not found")
+    
+    base_headers = {'Accept-Ranges': 'bytes'}
+    if meta.etag:
+        base_headers['ETag'] = meta.etag
     
     # Обрабатываем Range header
     range_header = request.headers.get('Range')
-    if range_header:
-        start, end = parse_range_header(range_header, file_size)
-        content_length = end - start + 1
-        
+    ranges = None
+    if range_header and meta.size > 0:
+        ranges = parse_range_header(range_header, meta.size, streaming_service.settings["max_ranges"])
+    
+    if ranges == []:
+        return Response(
+            status_code=416,
+            headers={**base_headers, 'Content-Range': f'bytes */{meta.size}'}
+        )
+    
+    if ranges and len(ranges) == 1:
+        start, end = ranges[0]
+        upstream = await open_range(video_url, meta, start, end)
         headers = {
-            'Content-Range': f'bytes {start}-{end}/{file_size}',
-            'Accept-Ranges': 'bytes',
-            'Content-Length': str(content_length),
-            'Content-Type': 'video/mp4'
+            **base_headers,
+            'Content-Range': f'bytes {start}-{end}/{meta.size}',
+            'Content-Length': str(end - start + 1),
+            'Content-Type': meta.content_type
         }
         
         return StreamingResponse(
-            stream_from_url(video_url, start, end),
+            streaming_service.iter_response(upstream),
             status_code=206,
             headers=headers,
-            media_type='video/mp4'
+            media_type=meta.content_type
         )
-    else:
-        # Полная отдача файла
+    
+    if ranges:
+        boundary = uuid.uuid4().hex
+        content_length = sum(
+            len(multipart_part_header(meta, start, end, boundary)) + end - start + 1
+            for start, end in ranges
+        ) + len(f"\r\n--{boundary}--\r\n")
+        media_type = f'multipart/byteranges; boundary={boundary}'
         headers = {
-            'Content-Length': str(file_size),
-            'Accept-Ranges': 'bytes',
-            'Content-Type': 'video/mp4'
+            **base_headers,
+            'Content-Length': str(content_length),
+            'Content-Type': media_type
         }
         
         return StreamingResponse(
-            stream_from_url(video_url),
-            status_code=200,
+            stream_multipart(video_url, meta, ranges, boundary),
+            status_code=206,
             headers=headers,
-            media_type='video/mp4'
+            media_type=media_type
         )
+    
+    # Полная отдача файла
+    upstream = await open_range(video_url, meta, 0, meta.size - 1)
+    headers = {
+        **base_headers,
+        'Content-Length': str(meta.size),
+        'Content-Type': meta.content_type
+    }
+    
+    return StreamingResponse(
+        streaming_service.iter_response(upstream),
+        status_code=200,
+        headers=headers,
+        media_type=meta.content_type
+    )
+
+@router.get("/{movie_id}/playback", summary="Ссылки на просмотр фильма")
+async def get_playback_urls(movie_id: int, user_data: Principal = Depends(get_current_user)):
+    """
+    Выдает токен просмотра фильма на MEDIA_TOKEN_TTL и ссылки с ним. Плеер запрашивает их
+    один раз при открытии страницы: <video> не обновляет access-токен, и перемотка
+    после его истечения иначе получала бы 401
+    """
+    if await get_movie_video_url(movie_id) is None:
+        raise HTTPException(status_code=404, detail="Video not found for this movie")
+    token = create_media_token(user_data.id, movie_resource(movie_id))
+    return {
+        "token": token,
+        "stream_url": f"{router.prefix}/{movie_id}?token={quote(token)}",
+        "hls_url": f"{router.prefix}/{movie_id}/{MASTER_PLAYLIST}?token={quote(token)}"
+    }
 
 @router.get("/{movie_id}/info")
 async def get_video_info(movie_id: int):
@@ -121,30 +173,97 @@ async def get_video_info(movie_id: int):
     video_url = await get_movie_video_url(movie_id)
     if not video_url:
         raise HTTPException(status_code=404, detail="Video not found for this movie")
-    
-    # Для MinIO URL
-    if not video_url.startswith(('http://', 'https://')):
-        video_url = f"http://minio:9000/{video_url}"
-    elif "localhost:9000" in video_url:
-        # Заменяем localhost на minio для внутреннего доступа в Docker
-        video_url = video_url.replace("localhost:9000", "minio:9000")
+    video_url = to_internal_url(video_url)
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.head(video_url) as response:
-                if response.status != 200:
-                    raise HTTPException(status_code=404, detail="Video file not found")
-                
-                file_size = int(response.headers.get('Content-Length', 0))
-                content_type = response.headers.get('Content-Type', 'video/mp4')
-                
-                return {
-                    "movie_id": movie_id,
-                    "video_url": video_url,
-                    "file_size": file_size,
-                    "content_type": content_type,
-                    "supports_range": "bytes" in response.headers.get('Accept-Ranges', '')
-                }
-    except Exception as e:
+        meta = await streaming_service.get_object_meta(video_url)
+    except aiohttp.ClientError as e:
         logger.error(f"Error getting video info for {video_url}: {e}")
-        raise HTTPException(status_code=500, detail="Error accessing video file") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Error accessing video file")
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Video file not found")
+    
+    return {
+        "movie_id": movie_id,
+        "video_url": video_url,
+        "file_size": meta.size,
+        "content_type": meta.content_type,
+        "supports_range": meta.accept_ranges
+    }
+
+@router.post("/{movie_id}/package", summary="Упаковать фильм в HLS")
+async def package_movie(movie_id: int, user_data: Principal = Depends(get_current_user)):
+    """Ставит фильм в очередь на перекодирование в HLS с несколькими качествами (только администратор)"""
+    if not user_data.is_admin:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    status = await packaging_service.enqueue(movie_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Video not found for this movie")
+    return status
+
+@router.get("/{movie_id}/package", summary="Статус упаковки фильма в HLS")
+async def get_packaging_status(movie_id: int):
+    status = await packaging_service.get_status(movie_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Movie has not been packaged")
+    return status
+
+def with_token(playlist: str, token: Optional[str]) -> str:
+    """Добавляет ?token=... к относительным ссылкам плейлиста: относительный адрес query не наследует"""
+    if not token:
+        return playlist
+    lines = []
+    for line in playlist.splitlines():
+        if line and not line.startswith("#") and "://" not in line:
+            line = f"{line}?token={quote(token)}"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+def playlist_response(playlist: Optional[str], token: Optional[str] = None) -> Response:
+    if playlist is None:
+        raise HTTPException(status_code=404, detail="HLS stream is not ready for this movie")
+    playlist = with_token(playlist, token)
+    return Response(
+        content=playlist,
+        media_type=HLS_CONTENT_TYPES[".m3u8"],
+        headers={"Cache-Control": "max-age=60"}
+    )
+
+@router.get("/{movie_id}/master.m3u8", summary="HLS мастер-плейлист фильма")
+async def get_master_playlist(movie_id: int, token: Optional[str] = Query(default=None),
+                              user_id: int = Depends(authorize_movie_playback)):
+    """Мастер-плейлист со всеми качествами; адреса качеств относительные (/streaming/{movie_id}/v0.m3u8)"""
+    return playlist_response(await packaging_service.get_playlist(movie_id, MASTER_PLAYLIST), token)
+
+@router.get("/{movie_id}/{file_name}", summary="HLS плейлист качества или сегмент")
+async def get_hls_file(movie_id: int, file_name: str = Path(pattern=r"^v\d+(_\d+\.ts|\.m3u8)$"),
+                       token: Optional[str] = Query(default=None),
+                       user_id: int = Depends(authorize_movie_playback)):
+    """Плейлист качества (vN.m3u8) или сегмент (vN_00000.ts)"""
+    if file_name.endswith(".m3u8"):
+        # В режиме redirect сегменты в плейлисте заменяются presigned URL и идут мимо воркера
+        return playlist_response(
+            await packaging_service.get_playlist(movie_id, file_name, presign=file_service.redirect_mode),
+            token
+        )
+    
+    segment_path = await packaging_service.get_segment_path(movie_id, file_name)
+    if segment_path is None:
+        raise HTTPException(status_code=404, detail="HLS stream is not ready for this movie")
+    if file_service.redirect_mode:
+        return RedirectResponse(await file_service.get_presigned_url(segment_path), status_code=302)
+    
+    segment_url = to_internal_url(f"{file_service.bucket_name}/{segment_path}")
+    try:
+        meta = await streaming_service.get_object_meta(segment_url)
+    except aiohttp.ClientError as e:
+        logger.error(f"Error getting segment {segment_url}: {e}")
+        raise HTTPException(status_code=500, detail="Error accessing video file")
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    upstream = await open_range(segment_url, meta, 0, meta.size - 1)
+    return StreamingResponse(
+        streaming_service.iter_response(upstream),
+        headers={"Content-Length": str(meta.size), "Cache-Control": "max-age=3600"},
+        media_type=HLS_CONTENT_TYPES[".ts"]
+    )
@@ -0,0 +1,108 @@
+from sqlalchemy import text
+from main_service.database import async_session_maker
+from main_service.services.cache_service import cache_service
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def movie_actors_cache_key(movie_id: int) -> str:
+    return f"movie_actors_{movie_id}"
+
+
+def actor_cache_key(actor_id: int) -> str:
+    return f"actor_{actor_id}"
+
+
+class ActorService:
+
+    @classmethod
+    async def get_movie_actors(cls, movie_id: int) -> list:
+        """Список актеров фильма (через кэш)"""
+        return await cache_service.get_or_load(
+            movie_actors_cache_key(movie_id),
+            lambda: cls._load_movie_actors(movie_id),
+            ttl=cache_service.settings["catalog_ttl"],
+            negative_ttl=cache_service.settings["movie_negative_ttl"],
+        )
+
+    @classmethod
+    async def get_actor_details(cls, actor_id: int) -> dict | None:
+        """Актер с фильмографией (через кэш), None - если актера нет"""
+        return await cache_service.get_or_load(
+            actor_cache_key(actor_id),
+            lambda: cls._load_actor_details(actor_id),
+            ttl=cache_service.settings["catalog_ttl"],
+            negative_ttl=cache_service.settings["movie_negative_ttl"],
+        )
+
+    @classmethod
+    async def _load_movie_actors(cls, movie_id: int) -> list:
+        async with async_session_maker() as session:
+            query = text("""
+                SELECT a.id, a.name, a.photo_url, a.birth_date, a.biography, ma.role_name as character
+                FROM actors a
+                JOIN movie_actors ma ON a.id = ma.actor_id
+                WHERE ma.movie_id = :movie_id
+                ORDER BY a.id
+            """)
+            result = await session.execute(query, {"movie_id": movie_id})
+            rows = result.fetchall()
+
+        return [
+            {
+                "id": row[0],
+                "name": row[1],
+                "photo_url": row[2],
+                "birth_date": row[3].isoformat() if row[3] else None,
+                "biography": row[4],
+                "character": row[5]
+            }
+            for row in rows
+        ]
+
+    @classmethod
+    async def _load_actor_details(cls, actor_id: int) -> dict | None:
+        async with async_session_maker() as session:
+            actor_query = text("""
+                SELECT id, name, photo_url, birth_date, biography
+                FROM actors
+                WHERE id = :actor_id
+            """)
+            actor_result = await session.execute(actor_query, {"actor_id": actor_id})
+            actor_row = actor_result.fetchone()
+
+            if not actor_row:
+                return None
+
+            movies_query = text("""
+                SELECT m.id, m.title, m.poster_url, m.release_date, ma.role_name as character
+                FROM movies m
+                JOIN movie_actors ma ON m.id = ma.movie_id
+                WHERE ma.actor_id = :actor_id
+                ORDER BY m.release_date DESC
+            """)
+            movies_result = await session.execute(movies_query, {"actor_id": actor_id})
+            movies_rows = movies_result.fetchall()
+
+        movies_list = [
+            {
+                "id": movie_row[0],
+                "title": movie_row[1],
+                "poster_url": movie_row[2],
+                "release_date": movie_row[3].isoformat() if movie_row[3] else None,
+                "character": movie_row[4]
+            }
+            for movie_row in movies_rows
+        ]
+
+        return {
+            "id": actor_row[0],
+            "name": actor_row[1],
+            "photo_url": actor_row[2],
+            "birth_date": actor_row[3].isoformat() if actor_row[3] else None,
+            "biography": actor_row[4],
+            "movies": movies_list
+        }
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import random
+import uuid
+from typing import Any, Awaitable, Callable, Dict
+
+from redis.exceptions import RedisError
+
+from main_service.cache_redis import redis_client
+from main_service.config import get_cache_settings
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Снимает блокировку, только если она все еще принадлежит нам
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_MISS = object()
+
+
+class CacheService:
+    """
+    Read-through кэш в Redis с защитой от cache stampede:
+    - внутри процесса одновременные промахи по одному ключу ждут одну загрузку (single-flight);
+    - между процессами загрузку выполняет только владелец блокировки lock:<key>, остальные ждут заполнения кэша;
+    - TTL случайно растягивается/сжимается на долю ttl_jitter, отсутствующие значения кэшируются на короткий срок.
+    """
+
+    def __init__(self):
+        self.settings = get_cache_settings()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._release_lock = redis_client.register_script(RELEASE_LOCK_SCRIPT)
+
+    def jittered_ttl(self, ttl: int) -> int:
+        """TTL со случайным разбросом"""
+        jitter = ttl * self.settings["ttl_jitter"]
+        return max(1, int(ttl + random.uniform(-jitter, jitter)))
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]],
+                          ttl: int, negative_ttl: int) -> Any:
+        """Возвращает значение из кэша или загружает его через loader и кладет в кэш"""
+        cached = await self._get(key)
+        if cached is not _MISS:
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Загрузка-владелец отменена вместе со своим запросом - грузим сами
+                if not inflight.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load_with_lock(key, loader, ttl, negative_ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение полученным, даже если ожидающих не было
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def invalidate(self, *keys: str) -> None:
+        """Удаляет ключи из кэша"""
+        if not keys:
+            return
+        try:
+            await redis_client.delete(*keys)
+        except RedisError as e:
+            logger.warning(f"Cache invalidate failed for {keys}: {e}")
+
+    async def get_version(self, name: str) -> int:
+        """Текущая версия пространства ключей (например, страниц каталога)"""
+        try:
+            version = await redis_client.get(f"version:{name}")
+        except RedisError as e:
+            logger.warning(f"Cache version read failed for {name}: {e}")
+            return 0
+        return int(version or 0)
+
+    async def bump_version(self, name: str) -> None:
+        """Инвалидирует все ключи пространства разом: старые ключи больше не читаются и истекают по TTL"""
+        try:
+            await redis_client.incr(f"version:{name}")
+        except RedisError as e:
+            logger.warning(f"Cache version bump failed for {name}: {e}")
+
+    async def _load_with_lock(self, key: str, loader: Callable[[], Awaitable[Any]],
+                              ttl: int, negative_ttl: int) -> Any:
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await redis_client.set(
+                lock_key, token, nx=True, px=int(self.settings["lock_timeout"] * 1000)
+            )
+        except RedisError as e:
+            logger.warning(f"Cache lock failed for {key}: {e}")
+            acquired = None
+
+        if not acquired:
+            # Ключ уже загружает другой процесс - ждем, пока он положит значение в кэш
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.settings["lock_wait"]
+            while loop.time() < deadline:
+                await asyncio.sleep(0.05)
+                cached = await self._get(key)
+                if cached is not _MISS:
+                    return cached
+
+        try:
+            value = await loader()
+            await self._set(key, value, ttl if value is not None else negative_ttl)
+            return value
+        finally:
+            if acquired:
+                try:
+                    await self._release_lock(keys=[lock_key], args=[token])
+                except RedisError as e:
+                    logger.warning(f"Cache unlock failed for {key}: {e}")
+
+    async def _get(self, key: str) -> Any:
+        try:
+            data = await redis_client.get(key)
+        except RedisError as e:
+            logger.warning(f"Cache read failed for {key}: {e}")
+            return _MISS
+        if data is None:
+            return _MISS
+        return json.loads(data)
+
+    async def _set(self, key: str, value: Any, ttl: int) -> None:
+        try:
+            await redis_client.set(key, json.dumps(value), ex=self.jittered_ttl(ttl))
+        except RedisError as e:
+            logger.warning(f"Cache write failed for {key}: {e}")
+
+
+cache_service = CacheService()
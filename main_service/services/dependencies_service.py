@@ -1,21 +1,14 @@
-from jose import jwt
-from datetime import datetime, timedelta, timezone
-from main_service.config import get_auth_data
-from fastapi import Request, HTTPException, status, Depends, Response
-from jose import jwt, JWTError
-from datetime import datetime, timezone
-from main_service.config import get_auth_data
-from main_service.services.users_service import UserService
-from main_service.cache_redis import redis_client
+import time
+from typing import Optional
 
+from fastapi import Request, HTTPException, status, Depends, Query
+from jose import jwt, JWTError, ExpiredSignatureError
+from main_service.config import get_auth_data, get_revocation_settings, get_media_token_ttl
+from main_service.cache_redis import redis_client
+from shared.auth.principal_cache import Principal
+from shared.auth.token_revocation import TokenRevocationList, RevocationCheckError, get_token_id
 
-def refresh_token(data: dict) -> str:
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=3)
-    to_encode.update({"exp": expire})
-    auth_data = get_auth_data()
-    encode_jwt = jwt.encode(to_encode, auth_data['secret_key'], algorithm=auth_data['algorithm'])
-    return encode_jwt
+revocation_list = TokenRevocationList(redis_client, **get_revocation_settings())
 
 
 def get_token(request: Request):
@@ -24,51 +17,80 @@ def get_token(request: Request):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Token not found')
     return token
 
-async def add_expired_token_to_cache(user_id: int, token: str) -> None:
-    try:
-        await redis_client.set(f"expired_{user_id}", f"{token}")
-        await redis_client.expire(f"expired_{user_id}", 3600)
-        
-        print(f"Expired token for user {user_id} added to cache")
-        
-    except Exception as e:
-        raise e
-
-
-async def get_current_user(token: str = Depends(get_token), response: Response = Response):
+async def get_current_user(token: str = Depends(get_token)) -> Principal:
+    """
+    Пользователь из access-токена: проверяются только подпись и срок, без обращения к БД и Redis.
+    Истекший токен клиент обменивает на новый через POST /auth/refresh в auth_service.
+    """
     try:
         auth_data = get_auth_data()
-        payload = jwt.decode(token, auth_data['secret_key'], algorithms=[auth_data['algorithm']], options={"verify_exp": False})
+        payload = jwt.decode(token, auth_data['secret_key'], algorithms=[auth_data['algorithm']])
+    except ExpiredSignatureError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Срок действия токена истек')
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Токен не валидный!')
-    
-    user_id = payload.get('sub')
-    if not user_id:
+
+    user = Principal.from_claims(payload)
+    if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Не найден ID пользователя')
-    
-    if await redis_client.get(f"expired_{user_id}") == token:
+
+    try:
+        revoked = await revocation_list.is_revoked(get_token_id(payload, token))
+    except RevocationCheckError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail='Не удалось проверить токен, повторите позже')
+    if revoked:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Вы не авторизованы или сессия истекла')
-    
-    user = await UserService.get_user_or_none_by_id(int(user_id))
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='User not found')
-
-    expire = payload.get('exp')
-    if (not expire):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Срока истечения нет')
-    
-    expire_time = datetime.fromtimestamp(int(expire), tz=timezone.utc)
-    if (expire_time < datetime.now(timezone.utc)):
-        print("Token expired")
-        
-        if await redis_client.exists(f"user_{user_id}"):
-            await add_expired_token_to_cache(user_id, token)
-
-            access_token = refresh_token({"sub": str(user.id)})
-            response.set_cookie(key="users_access_token", value=access_token, httponly=False)
-            print(f"Token for user {user_id} refreshed")
-        
-        else:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Вы не авторизованы или сессия истекла')
-
-    return user
\ No newline at end of file
+
+    return user
+
+
+def movie_resource(movie_id: int) -> str:
+    return f"movie:{movie_id}"
+
+
+def file_resource(file_path: str) -> str:
+    return f"file:{file_path}"
+
+
+def create_media_token(user_id: int, resource: str) -> str:
+    """
+    Подписанный токен доступа к одному ресурсу (фильм или файл) на MEDIA_TOKEN_TTL.
+    Передается в ?token=...: <video> и ссылки на скачивание шлют только cookie, а access-токен
+    живет минуты - без такого токена перемотка в середине фильма получала бы 401
+    """
+    auth_data = get_auth_data()
+    payload = {"sub": str(user_id), "typ": "media", "res": resource, "exp": int(time.time()) + get_media_token_ttl()}
+    return jwt.encode(payload, auth_data['secret_key'], algorithm=auth_data['algorithm'])
+
+
+def verify_media_token(token: str, resource: str) -> Optional[int]:
+    """id пользователя, если токен выдан на resource и не истек; иначе None"""
+    try:
+        auth_data = get_auth_data()
+        payload = jwt.decode(token, auth_data['secret_key'], algorithms=[auth_data['algorithm']])
+    except JWTError:
+        return None
+    if payload.get("typ") != "media" or payload.get("res") != resource:
+        return None
+    return int(payload["sub"])
+
+
+async def authorize_media(request: Request, resource: str, token: Optional[str]) -> int:
+    """Доступ по токену ресурса из ?token=..., иначе - по access-токену из cookie"""
+    if token is not None:
+        user_id = verify_media_token(token, resource)
+        if user_id is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Ссылка недействительна или истекла')
+        return user_id
+    user = await get_current_user(get_token(request))
+    return user.id
+
+
+async def authorize_movie_playback(movie_id: int, request: Request,
+                                   token: Optional[str] = Query(default=None)) -> int:
+    return await authorize_media(request, movie_resource(movie_id), token)
+
+
+async def authorize_file_download(file_path: str, request: Request,
+                                  token: Optional[str] = Query(default=None)) -> int:
+    return await authorize_media(request, file_resource(file_path), token)
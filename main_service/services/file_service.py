@@ -1,126 +1,453 @@
 import asyncio
+import base64
+import hashlib
 import io
 import logging
-from typing import Optional, BinaryIO
-from minio import Minio
-from minio.error import S3Error
+import time
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, unquote
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from botocore.exceptions import ClientError
 from PIL import Image
-import requests
+import aiohttp
 
-from main_service.config import get_minio_settings
+from main_service.config import get_minio_settings, get_delivery_settings, get_upload_settings, get_image_settings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Коды ошибок S3 для отсутствующего объекта
+NOT_FOUND_CODES = {"NoSuchKey", "404", "NotFound"}
+
+
+def is_not_found(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in NOT_FOUND_CODES
+
+
+def convert_to_jpeg(content: bytes) -> bytes:
+    """Проверяет, что данные - изображение, и при необходимости перекодирует его в JPEG"""
+    image = Image.open(io.BytesIO(content))
+    if image.format == 'JPEG':
+        return content
+    
+    output = io.BytesIO()
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGB')
+    image.save(output, format='JPEG', quality=85)
+    return output.getvalue()
+
+
 class FileService:
+    """
+    Работа с объектами в MinIO через асинхронный S3-клиент (aiobotocore).
+
+    Клиент с пулом соединений создается один раз на воркер (start), bucket проверяется
+    при старте, а не на каждую загрузку. Скачивание возвращает асинхронный итератор
+    кусков вместо целого файла в памяти. Отдельный клиент с публичным адресом MinIO
+    только подписывает URL и в сеть не ходит.
+    """
+
     def __init__(self):
         self.minio_settings = get_minio_settings()
-        self.client = Minio(
-            self.minio_settings["endpoint"],
-            access_key=self.minio_settings["access_key"],
-            secret_key=self.minio_settings["secret_key"],
-            secure=False  # Для локального использования
-        )
         self.bucket_name = self.minio_settings["bucket"]
-        
+        self.delivery_settings = get_delivery_settings()
+        self.upload_settings = get_upload_settings()
+        self.image_settings = get_image_settings()
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._presigned: Dict[tuple, Tuple[float, str]] = {}
+        self._exit_stack: Optional[AsyncExitStack] = None
+        self._start_lock = asyncio.Lock()
+        self.client = None
+        self.public_client = None
+
+    async def start(self):
+        """Создает S3-клиентов и проверяет bucket"""
+        async with self._start_lock:
+            if self.client is not None:
+                return
+            session = get_session()
+            exit_stack = AsyncExitStack()
+            credentials = {
+                "aws_access_key_id": self.minio_settings["access_key"],
+                "aws_secret_access_key": self.minio_settings["secret_key"],
+                "region_name": self.minio_settings["region"],
+            }
+            config = AioConfig(
+                max_pool_connections=self.minio_settings["pool_size"],
+                signature_version="s3v4",
+                s3={"addressing_style": "path"}
+            )
+            client = await exit_stack.enter_async_context(session.create_client(
+                "s3", endpoint_url=f"http://{self.minio_settings['endpoint']}", config=config, **credentials
+            ))
+            # Хост входит в подпись, поэтому URL для клиентов подписываются публичным адресом MinIO
+            self.public_client = await exit_stack.enter_async_context(session.create_client(
+                "s3", endpoint_url=f"http://{self.minio_settings['public_endpoint']}", config=config, **credentials
+            ))
+            try:
+                await self._ensure_bucket(client)
+            except Exception:
+                await exit_stack.aclose()
+                raise
+            self.client = client
+            self._exit_stack = exit_stack
+
+    async def close(self):
+        """Закрывает пул соединений"""
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+        self._exit_stack = None
+        self.client = None
+        self.public_client = None
+
+    async def _get_client(self):
+        if self.client is None:
+            await self.start()
+        return self.client
+
     async def ensure_bucket_exists(self):
         """Создает bucket если он не существует"""
+        await self._ensure_bucket(await self._get_client())
+
+    async def _ensure_bucket(self, client):
         try:
-            if not self.client.bucket_exists(self.bucket_name):
-                self.client.make_bucket(self.bucket_name)
-                logger.info(f"Bucket {self.bucket_name} created")
-            else:
-                logger.info(f"Bucket {self.bucket_name} already exists")
-        except S3Error as e:
-            logger.error(f"Error creating bucket: {e}")
-            raise
+            await client.head_bucket(Bucket=self.bucket_name)
+            logger.info(f"Bucket {self.bucket_name} already exists")
+        except ClientError as e:
+            if not is_not_found(e):
+                logger.error(f"Error checking bucket: {e}")
+                raise
+            await client.create_bucket(Bucket=self.bucket_name)
+            logger.info(f"Bucket {self.bucket_name} created")
 
     async def upload_file(self, file_path: str, file_data: bytes, content_type: str = "application/octet-stream") -> str:
         """Загружает файл в MinIO"""
+        client = await self._get_client()
         try:
-            await self.ensure_bucket_exists()
-            
-            file_stream = io.BytesIO(file_data)
-            
-            # Загружаем файл
-            self.client.put_object(
-                self.bucket_name,
-                file_path,
-                file_stream,
-                length=len(file_data),
-                content_type=content_type
+            await client.put_object(
+                Bucket=self.bucket_name,
+                Key=file_path,
+                Body=file_data,
+                ContentType=content_type
             )
             
             # Возвращаем URL для доступа к файлу
-            file_url = f"http://localhost:9000/{self.bucket_name}/{file_path}"
+            file_url = await self.get_file_url(file_path)
             logger.info(f"File uploaded successfully: {file_url}")
             return file_url
             
-        except S3Error as e:
+        except ClientError as e:
             logger.error(f"Error uploading file: {e}")
             raise
 
-    async def download_file(self, file_path: str) -> Optional[bytes]:
-        """Скачивает файл из MinIO"""
+    async def upload_stream(self, file_path: str, chunks: AsyncIterator[bytes],
+                            content_type: str = "application/octet-stream") -> str:
+        """
+        Загружает поток кусков в MinIO, не собирая файл в памяти.
+        Данные режутся на части по part_size и загружаются multipart-загрузкой,
+        до part_concurrency частей параллельно; пока все слоты заняты, чтение потока
+        приостанавливается, поэтому в памяти не больше (part_concurrency + 1) частей.
+        Файл меньше одной части загружается обычным put_object.
+        """
+        part_size = self.upload_settings["part_size"]
+        slots = asyncio.Semaphore(self.upload_settings["part_concurrency"])
+        buffer = bytearray()
+        upload_id = None
+        tasks: List[asyncio.Task] = []
+        parts: Dict[int, str] = {}
+
+        async def send_part(number: int, data: bytes):
+            try:
+                parts[number] = await self.upload_part(file_path, upload_id, number, data)
+            finally:
+                slots.release()
+
         try:
-            response = self.client.get_object(self.bucket_name, file_path)
-            data = response.read()
-            response.close()
-            response.release_conn()
-            return data
-        except S3Error as e:
-            logger.error(f"Error downloading file: {e}")
+            async for chunk in chunks:
+                buffer += chunk
+                while len(buffer) >= part_size:
+                    if upload_id is None:
+                        upload_id = await self.create_multipart_upload(file_path, content_type)
+                    data = bytes(buffer[:part_size])
+                    del buffer[:part_size]
+                    await slots.acquire()
+                    # Ошибка любой части прерывает загрузку, не дочитывая поток
+                    for task in tasks:
+                        if task.done() and task.exception():
+                            raise task.exception()
+                    tasks.append(asyncio.create_task(send_part(len(tasks) + 1, data)))
+
+            if upload_id is None:
+                return await self.upload_file(file_path, bytes(buffer), content_type)
+            if buffer:
+                await slots.acquire()
+                tasks.append(asyncio.create_task(send_part(len(tasks) + 1, bytes(buffer))))
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if upload_id is not None:
+                await asyncio.shield(self.abort_multipart_upload(file_path, upload_id))
+            raise
+
+        await self.complete_multipart_upload(file_path, upload_id, sorted(parts.items()))
+        file_url = await self.get_file_url(file_path)
+        logger.info(f"File uploaded successfully in {len(parts)} parts: {file_url}")
+        return file_url
+
+    async def create_multipart_upload(self, file_path: str, content_type: str) -> str:
+        """Начинает multipart-загрузку и возвращает ее UploadId"""
+        client = await self._get_client()
+        response = await client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=file_path, ContentType=content_type
+        )
+        return response["UploadId"]
+
+    async def upload_part(self, file_path: str, upload_id: str, part_number: int, data: bytes,
+                          digest: Optional[bytes] = None) -> str:
+        """
+        Загружает часть multipart-загрузки с Content-MD5: MinIO сверяет контрольную сумму
+        и отклоняет поврежденную часть. digest - уже посчитанный MD5 части. Возвращает ETag части.
+        """
+        client = await self._get_client()
+        if digest is None:
+            # hashlib отпускает GIL на больших буферах - считаем MD5 вне event loop
+            digest = await asyncio.to_thread(lambda: hashlib.md5(data).digest())
+        response = await client.upload_part(
+            Bucket=self.bucket_name, Key=file_path, UploadId=upload_id,
+            PartNumber=part_number, Body=data, ContentMD5=base64.b64encode(digest).decode()
+        )
+        return response["ETag"]
+
+    async def list_parts(self, file_path: str, upload_id: str) -> List[dict]:
+        """Уже загруженные части multipart-загрузки: номер, размер и ETag (MD5 части)"""
+        client = await self._get_client()
+        paginator = client.get_paginator("list_parts")
+        parts = []
+        async for page in paginator.paginate(Bucket=self.bucket_name, Key=file_path, UploadId=upload_id):
+            parts.extend(
+                {"part_number": part["PartNumber"], "size": part["Size"], "etag": part["ETag"]}
+                for part in page.get("Parts", [])
+            )
+        return parts
+
+    async def complete_multipart_upload(self, file_path: str, upload_id: str, parts: List[Tuple[int, str]]):
+        """Собирает объект из частей [(номер, ETag), ...]"""
+        client = await self._get_client()
+        await client.complete_multipart_upload(
+            Bucket=self.bucket_name, Key=file_path, UploadId=upload_id,
+            MultipartUpload={"Parts": [{"PartNumber": number, "ETag": etag} for number, etag in parts]}
+        )
+
+    async def abort_multipart_upload(self, file_path: str, upload_id: str):
+        """Отменяет multipart-загрузку и освобождает загруженные части"""
+        client = await self._get_client()
+        try:
+            await client.abort_multipart_upload(Bucket=self.bucket_name, Key=file_path, UploadId=upload_id)
+        except ClientError as e:
+            logger.warning(f"Error aborting multipart upload {upload_id} for {file_path}: {e}")
+
+    async def upload_local_file(self, file_path: str, local_path: str,
+                                content_type: str = "application/octet-stream") -> None:
+        """Загружает небольшой файл с диска (например, HLS-сегмент) в MinIO"""
+        file_data = await asyncio.to_thread(self._read_local_file, local_path)
+        await self.upload_file(file_path, file_data, content_type)
+
+    async def stat_file(self, file_path: str) -> Optional[dict]:
+        """Размер, ETag, дата изменения и тип объекта; None, если объекта нет"""
+        client = await self._get_client()
+        try:
+            response = await client.head_object(Bucket=self.bucket_name, Key=file_path)
+        except ClientError as e:
+            if not is_not_found(e):
+                logger.error(f"Error getting file info: {e}")
+                raise
             return None
+        return {
+            "size": response["ContentLength"],
+            "etag": response.get("ETag"),
+            "last_modified": response.get("LastModified"),
+            "content_type": response.get("ContentType", "application/octet-stream"),
+        }
+
+    async def download_file(self, file_path: str, chunk_size: int = 256 * 1024,
+                            byte_range: Optional[Tuple[int, int]] = None) -> Optional[AsyncIterator[bytes]]:
+        """
+        Открывает объект (или диапазон байт [start, end]) в MinIO и возвращает итератор
+        его кусков; None, если объекта нет
+        """
+        client = await self._get_client()
+        params = {"Bucket": self.bucket_name, "Key": file_path}
+        if byte_range is not None:
+            params["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        try:
+            response = await client.get_object(**params)
+        except ClientError as e:
+            if not is_not_found(e):
+                logger.error(f"Error downloading file: {e}")
+            return None
+        return self._iter_body(response["Body"], chunk_size)
+
+    async def read_file(self, file_path: str) -> Optional[bytes]:
+        """Читает небольшой объект (плейлист, метаданные) целиком; None, если объекта нет"""
+        chunks = await self.download_file(file_path)
+        if chunks is None:
+            return None
+        return b"".join([chunk async for chunk in chunks])
 
     async def delete_file(self, file_path: str) -> bool:
         """Удаляет файл из MinIO"""
+        client = await self._get_client()
         try:
-            self.client.remove_object(self.bucket_name, file_path)
+            await client.delete_object(Bucket=self.bucket_name, Key=file_path)
             logger.info(f"File deleted: {file_path}")
             return True
-        except S3Error as e:
+        except ClientError as e:
             logger.error(f"Error deleting file: {e}")
             return False
 
-    async def upload_image_from_url(self, image_url: str, file_path: str) -> str:
-        """Скачивает изображение по URL и загружает в MinIO"""
+    async def delete_prefix(self, prefix: str) -> int:
+        """Удаляет все объекты под prefix пакетами по 1000; возвращает количество удаленных"""
+        keys = await self.list_files(prefix)
+        client = await self._get_client()
+        deleted = 0
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            response = await client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+            )
+            errors = response.get("Errors", [])
+            for error in errors:
+                logger.error(f"Error deleting {error.get('Key')}: {error.get('Message')}")
+            deleted += len(batch) - len(errors)
+        logger.info(f"Deleted {deleted} files under {prefix}")
+        return deleted
+
+    def _get_http(self) -> aiohttp.ClientSession:
+        """HTTP-клиент с пулом соединений для скачивания изображений, один на воркер"""
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.image_settings["ingest_concurrency"] * 2),
+                timeout=aiohttp.ClientTimeout(total=self.image_settings["fetch_timeout"])
+            )
+        return self._http
+
+    async def upload_image_from_url(self, image_url: str, file_path: str,
+                                    variants: Optional[List[Tuple[int, str]]] = None) -> str:
+        """
+        Скачивает изображение по URL и загружает в MinIO.
+        variants - [(ширина, формат)]: копии для /images строятся сразу, из уже скачанных данных
+        """
+        # Модуль изображений сам импортирует file_service
+        from main_service.services.image_service import image_service
         try:
-            # Скачиваем изображение
-            response = requests.get(image_url, timeout=30)
-            response.raise_for_status()
+            async with self._get_http().get(image_url) as response:
+                response.raise_for_status()
+                content = await response.read()
             
-            # Проверяем, что это изображение
-            image = Image.open(io.BytesIO(response.content))
+            # Декодирование и перекодирование - в пуле процессов image_service, не в event loop
+            image_data = await image_service.run_in_pool(convert_to_jpeg, content)
             
-            # Конвертируем в JPEG если нужно
-            if image.format != 'JPEG':
-                output = io.BytesIO()
-                if image.mode in ('RGBA', 'LA', 'P'):
-                    image = image.convert('RGB')
-                image.save(output, format='JPEG', quality=85)
-                image_data = output.getvalue()
-            else:
-                image_data = response.content
-            
-            # Загружаем в MinIO
-            return await self.upload_file(file_path, image_data, "image/jpeg")
+            file_url = await self.upload_file(file_path, image_data, "image/jpeg")
+            if variants:
+                # ETag объекта, загруженного одним PUT, - MD5 содержимого
+                etag = await asyncio.to_thread(lambda: hashlib.md5(image_data).hexdigest())
+                await image_service.store_variants(file_path, image_data, etag, variants)
+            return file_url
             
         except Exception as e:
             logger.error(f"Error uploading image from URL: {e}")
             raise
 
+    async def ingest_images(self, images: List[Tuple[str, str]], concurrency: Optional[int] = None,
+                            variants: Optional[List[Tuple[int, str]]] = None) -> List[dict]:
+        """
+        Параллельная загрузка изображений [(URL, путь в MinIO)], не больше concurrency одновременно.
+        Ошибка одного изображения не прерывает остальные: она возвращается в его результате
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.image_settings["ingest_concurrency"])
+
+        async def ingest(image_url: str, file_path: str) -> dict:
+            async with semaphore:
+                try:
+                    file_url = await self.upload_image_from_url(image_url, file_path, variants)
+                    return {"url": image_url, "file_path": file_path, "file_url": file_url}
+                except Exception as e:
+                    return {"url": image_url, "file_path": file_path, "error": str(e)}
+
+        return await asyncio.gather(*(ingest(image_url, file_path) for image_url, file_path in images))
+
     async def get_file_url(self, file_path: str) -> str:
         """Возвращает URL для доступа к файлу"""
-        return f"http://localhost:9000/{self.bucket_name}/{file_path}"
+        return f"http://{self.minio_settings['public_endpoint']}/{self.bucket_name}/{file_path}"
 
-    def list_files(self, prefix: str = "") -> list:
+    @property
+    def redirect_mode(self) -> bool:
+        """Отдавать объекты редиректом на presigned URL вместо проксирования через воркер"""
+        return self.delivery_settings["mode"] == "redirect"
+
+    async def get_presigned_url(self, file_path: str, bucket: Optional[str] = None,
+                                download_name: Optional[str] = None) -> str:
+        """
+        Короткоживущий presigned URL на чтение объекта.
+        URL кэшируется и переиспользуется, пока до его истечения больше presigned_refresh_margin секунд.
+        """
+        bucket = bucket or self.bucket_name
+        key = (bucket, file_path, download_name)
+        now = time.monotonic()
+        cached = self._presigned.get(key)
+        if cached is not None and cached[0] - self.delivery_settings["presigned_refresh_margin"] > now:
+            return cached[1]
+
+        ttl = self.delivery_settings["presigned_ttl"]
+        params = {"Bucket": bucket, "Key": file_path}
+        if download_name:
+            params["ResponseContentDisposition"] = f'attachment; filename="{download_name.replace(chr(34), "")}"'
+        await self._get_client()
+        url = await self.public_client.generate_presigned_url("get_object", Params=params, ExpiresIn=ttl)
+        # Истекшие записи вычищаем заодно с добавлением новой
+        self._presigned = {k: v for k, v in self._presigned.items() if v[0] > now}
+        self._presigned[key] = (now + ttl, url)
+        return url
+
+    def parse_object_url(self, url: str) -> Tuple[str, str]:
+        """Возвращает (bucket, путь объекта) по URL вида http://host:9000/bucket/path или по пути bucket/path"""
+        path = urlsplit(url).path if url.startswith(('http://', 'https://')) else url
+        bucket, _, file_path = unquote(path).lstrip('/').partition('/')
+        return bucket, file_path
+
+    async def list_files(self, prefix: str = "") -> list:
         """Возвращает список файлов в bucket"""
+        client = await self._get_client()
         try:
-            objects = self.client.list_objects(self.bucket_name, prefix=prefix, recursive=True)
-            return [obj.object_name for obj in objects]
-        except S3Error as e:
+            paginator = client.get_paginator("list_objects_v2")
+            files = []
+            async for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                files.extend(obj["Key"] for obj in page.get("Contents", []))
+            return files
+        except ClientError as e:
             logger.error(f"Error listing files: {e}")
             return []
 
+    @staticmethod
+    def _read_local_file(local_path: str) -> bytes:
+        with open(local_path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    async def _iter_body(body, chunk_size: int) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
 file_service = FileService() 
\ No newline at end of file
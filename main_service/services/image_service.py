@@ -0,0 +1,279 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from PIL import Image, ImageOps, features
+
+from main_service.config import get_image_settings
+from main_service.services.cache_service import cache_service
+from main_service.services.file_service import file_service
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IMAGE_CONTENT_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+DERIVATIVES_PREFIX = "derivatives"
+
+
+def pillow_supports(image_format: str) -> bool:
+    """Собран ли Pillow с кодеком формата (AVIF есть только в новых версиях)"""
+    try:
+        return features.check_module(image_format)
+    except ValueError:
+        return False
+
+
+def image_source_cache_key(file_path: str) -> str:
+    return f"image_source:{file_path}"
+
+
+def render_derivative(data: bytes, width: int, image_format: str, quality: int) -> bytes:
+    """Уменьшает изображение до ширины width (без увеличения) и кодирует в image_format. Выполняется в пуле процессов"""
+    image = Image.open(io.BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+
+    if image_format == "jpeg":
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB")
+
+    output = io.BytesIO()
+    options = {"quality": quality}
+    if image_format == "jpeg":
+        options.update(optimize=True, progressive=True)
+    elif image_format == "webp":
+        options.update(method=4)
+    image.save(output, format=image_format.upper(), **options)
+    return output.getvalue()
+
+
+class DiskCache:
+    """LRU-кэш файлов на локальном диске, ограниченный суммарным объемом"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+
+    def get(self, name: str) -> Optional[bytes]:
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Время изменения служит меткой последнего обращения для вытеснения
+        os.utime(path)
+        return data
+
+    def put(self, name: str, data: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._size is None:
+            self._size = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._size += len(data)
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        size = sum(entry.stat().st_size for entry in entries)
+        # Освобождаем с запасом, чтобы не вытеснять на каждой записи
+        target = self.max_bytes * 0.9
+        for entry in entries:
+            if size <= target:
+                break
+            try:
+                entry_size = entry.stat().st_size
+                os.remove(entry.path)
+                size -= entry_size
+            except FileNotFoundError:
+                pass
+        self._size = size
+
+
+class ImageService:
+    """
+    Уменьшенные копии постеров, фонов и фото актеров.
+
+    Ширина округляется вверх до одной из IMAGE_WIDTHS, формат (AVIF/WebP/JPEG) берется
+    из запроса или из заголовка Accept. Копия ищется по очереди в памяти воркера (LRU),
+    в дисковом кэше, в MinIO под derivatives/; если ее нигде нет, она строится Pillow
+    в пуле процессов и сохраняется во все три места. Имя копии включает ETag оригинала,
+    поэтому замена оригинала порождает новую копию и новый ETag ответа.
+    """
+
+    def __init__(self):
+        self.settings = get_image_settings()
+        self.formats = [fmt for fmt in ("avif", "webp", "jpeg") if fmt == "jpeg" or pillow_supports(fmt)]
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = DiskCache(self.settings["disk_cache_dir"], self.settings["disk_cache_bytes"])
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def close(self):
+        """Останавливает пул процессов"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def choose_width(self, width: Optional[int]) -> int:
+        """Ближайшая разрешенная ширина не меньше запрошенной"""
+        widths = self.settings["widths"]
+        if width is None:
+            return widths[-1]
+        return next((allowed for allowed in widths if allowed >= width), widths[-1])
+
+    def choose_format(self, requested: Optional[str], accept: str) -> Optional[str]:
+        """Формат из запроса, иначе лучший из поддерживаемых клиентом (по Accept); None - формат не поддерживается"""
+        if requested:
+            requested = "jpeg" if requested.lower() == "jpg" else requested.lower()
+            return requested if requested in self.formats else None
+        for fmt in self.formats:
+            if IMAGE_CONTENT_TYPES[fmt] in accept:
+                return fmt
+        return "jpeg"
+
+    async def get_source_etag(self, file_path: str) -> Optional[str]:
+        """ETag оригинала (кэшируется в Redis); None, если оригинала нет"""
+        async def load():
+            info = await file_service.stat_file(file_path)
+            return info["etag"].strip('"') if info else None
+
+        cache_settings = cache_service.settings
+        return await cache_service.get_or_load(
+            image_source_cache_key(file_path), load,
+            ttl=cache_settings["catalog_ttl"],
+            negative_ttl=cache_settings["movie_negative_ttl"],
+        )
+
+    def derivative_path(self, file_path: str, source_etag: str, width: int, image_format: str) -> str:
+        base = os.path.splitext(file_path)[0]
+        return f"{DERIVATIVES_PREFIX}/{base}/{source_etag}/w{width}.{image_format}"
+
+    @staticmethod
+    def etag_for(derivative_path: str) -> str:
+        return '"' + hashlib.sha1(derivative_path.encode()).hexdigest() + '"'
+
+    async def get_derivative(self, file_path: str, derivative_path: str,
+                             width: int, image_format: str) -> bytes:
+        """Содержимое копии из кэшей или свежесгенерированное"""
+        data = self._memory_get(derivative_path)
+        if data is not None:
+            return data
+
+        inflight = self._inflight.get(derivative_path)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[derivative_path] = future
+        try:
+            data = await self._load_derivative(file_path, derivative_path, width, image_format)
+            self._memory_put(derivative_path, data)
+            future.set_result(data)
+            return data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение полученным, даже если ожидающих не было
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(derivative_path, None)
+
+    async def _load_derivative(self, file_path: str, derivative_path: str,
+                               width: int, image_format: str) -> bytes:
+        disk_name = hashlib.sha1(derivative_path.encode()).hexdigest()
+        data = await asyncio.to_thread(self._disk.get, disk_name)
+        if data is not None:
+            return data
+
+        data = await file_service.read_file(derivative_path)
+        if data is None:
+            source = await file_service.read_file(file_path)
+            if source is None:
+                raise FileNotFoundError(file_path)
+            started = time.monotonic()
+            data = await self.run_in_pool(render_derivative, source, width, image_format, self.settings["quality"])
+            logger.info(f"Rendered {derivative_path} ({len(source)} -> {len(data)} bytes) "
+                        f"in {(time.monotonic() - started) * 1000:.0f} ms")
+            try:
+                await file_service.upload_file(derivative_path, data, IMAGE_CONTENT_TYPES[image_format])
+            except Exception as e:
+                logger.warning(f"Failed to store derivative {derivative_path}: {e}")
+
+        try:
+            await asyncio.to_thread(self._disk.put, disk_name, data)
+        except OSError as e:
+            logger.warning(f"Failed to write disk cache for {derivative_path}: {e}")
+        return data
+
+    async def run_in_pool(self, func: Callable, *args) -> Any:
+        """Выполняет CPU-тяжелую функцию (декодирование, ресайз) в ограниченном пуле процессов"""
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+
+    async def store_variants(self, file_path: str, source: bytes, source_etag: str,
+                             variants: Iterable[Tuple[int, str]]):
+        """
+        Строит копии только что загруженного оригинала и сохраняет их в MinIO под теми же
+        именами, под которыми их будет искать get_derivative, чтобы первый запрос не ждал ресайза
+        """
+        for width, image_format in variants:
+            width = self.choose_width(width)
+            path = self.derivative_path(file_path, source_etag, width, image_format)
+            data = await self.run_in_pool(render_derivative, source, width, image_format, self.settings["quality"])
+            await file_service.upload_file(path, data, IMAGE_CONTENT_TYPES[image_format])
+        # Оригинал мог быть перезаписан: сбрасываем закэшированный ETag, чтобы отдавались новые копии
+        await cache_service.invalidate(image_source_cache_key(file_path))
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.settings["workers"])
+        return self._executor
+
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+        return data
+
+    def _memory_put(self, key: str, data: bytes):
+        if len(data) > self.settings["memory_cache_bytes"]:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.settings["memory_cache_bytes"]:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+
+image_service = ImageService()
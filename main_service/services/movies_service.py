@@ -6,6 +6,13 @@ from main_service.models.Genre import Genre
 from main_service.models.Movie import Movie
 
 from main_service.cache_redis import redis_client
+from main_service.config import get_log_transport_settings
+from main_service.services.cache_service import cache_service
+from main_service.services.actors_service import movie_actors_cache_key, actor_cache_key
+from shared.messaging.log_transport import publish_log
+from datetime import date
+import base64
+import hashlib
 import json
 import logging
 
@@ -13,50 +20,261 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+MOVIE_COLUMNS = """id, title, description, release_date, duration, rating,
+                   movie_url, poster_url, backdrop_url, trailer_url, created_at, updated_at"""
+
+# Поля, по которым разрешена keyset-сортировка каталога (для каждого есть составной индекс с id)
+CATALOG_SORT_FIELDS = ("id", "rating", "release_date")
+CATALOG_DEFAULT_LIMIT = 50
+CATALOG_MAX_LIMIT = 100
+# Сколько похожих фильмов хранится в кэше (эндпоинт отдает срез этого списка)
+SIMILAR_CACHE_SIZE = 50
+CATALOG_CACHE_NAMESPACE = "catalog"
+# Версия списков похожих фильмов: повышается после полного перестроения индекса в ETL
+SIMILAR_CACHE_NAMESPACE = "similar"
+
+
+def movie_cache_key(movie_id: int) -> str:
+    return f"movie_{movie_id}"
+
+
+def movie_similar_cache_key(movie_id: int, version: int) -> str:
+    return f"movie_similar_v{version}_{movie_id}"
+
+
+def movie_row_to_dict(row) -> dict:
+    """Преобразует строку выборки MOVIE_COLUMNS в словарь для ответа API"""
+    return {
+        "id": row[0],
+        "title": row[1],
+        "description": row[2],
+        "release_date": row[3].isoformat() if row[3] else None,
+        "duration": row[4],
+        "rating": row[5],
+        "movie_url": row[6],
+        "poster_url": row[7],
+        "backdrop_url": row[8],
+        "trailer_url": row[9],
+        "created_at": row[10].isoformat() if row[10] else None,
+        "updated_at": row[11].isoformat() if row[11] else None,
+    }
+
+
+def encode_cursor(sort_value, movie_id: int) -> str:
+    """Кодирует позицию последней отданной строки в непрозрачный курсор"""
+    if isinstance(sort_value, date):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, movie_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, order_by: str) -> tuple:
+    """Раскодирует курсор в пару (значение поля сортировки, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, movie_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if order_by == "release_date":
+            sort_value = date.fromisoformat(sort_value)
+        elif order_by in ("id", "rating"):
+            sort_value = int(sort_value)
+        return sort_value, int(movie_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
+
+
 class MovieService:
 
     @classmethod
-    async def get_all_movies_simple(cls):
-        """Простой метод для получения всех фильмов без relationships"""
+    async def get_movies_page(cls, **params) -> tuple[list, str | None]:
+        """
+        Страница каталога через кэш. Ключ зависит от версии пространства catalog,
+        которая увеличивается при каждом обновлении фильмов из ETL.
+        """
+        version = await cache_service.get_version(CATALOG_CACHE_NAMESPACE)
+        params_hash = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        movies, next_cursor = await cache_service.get_or_load(
+            f"{CATALOG_CACHE_NAMESPACE}:v{version}:{params_hash}",
+            lambda: cls._load_movies_page(**params),
+            ttl=cache_service.settings["catalog_ttl"],
+            negative_ttl=cache_service.settings["catalog_ttl"],
+        )
+        return movies, next_cursor
+
+    @classmethod
+    async def _load_movies_page(cls, limit: int = CATALOG_DEFAULT_LIMIT, cursor: str | None = None,
+                                order_by: str = "id", desc: bool = False, movie_id: int | None = None,
+                                title_prefix: str | None = None, genre_id: int | None = None,
+                                year_from: int | None = None, year_to: int | None = None,
+                                rating_from: int | None = None, rating_to: int | None = None) -> list:
+        """
+        Возвращает страницу каталога с keyset-пагинацией.
+        Вместо OFFSET используется условие (поле сортировки, id) > (значения из курсора),
+        поэтому стоимость запроса не зависит от номера страницы.
+        :return: [список фильмов, курсор следующей страницы или None]
+        """
+        if order_by not in CATALOG_SORT_FIELDS:
+            raise ValueError(f"Недопустимое поле сортировки: {order_by}")
+        limit = max(1, min(limit, CATALOG_MAX_LIMIT))
+
+        conditions = []
+        params = {"limit": limit + 1}
+
+        if movie_id is not None:
+            conditions.append("id = :movie_id")
+            params["movie_id"] = movie_id
+        if title_prefix:
+            # Экранируем спецсимволы LIKE, чтобы префикс искался буквально
+            escaped = title_prefix.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("lower(title) LIKE :title_prefix")
+            params["title_prefix"] = f"{escaped}%"
+        if genre_id is not None:
+            conditions.append("""EXISTS (
+                SELECT 1 FROM movie_genres mg
+                WHERE mg.movie_id = movies.id AND mg.genre_id = :genre_id
+            )""")
+            params["genre_id"] = genre_id
+        if year_from is not None:
+            conditions.append("release_date >= :date_from")
+            params["date_from"] = date(year_from, 1, 1)
+        if year_to is not None:
+            conditions.append("release_date < :date_to")
+            params["date_to"] = date(year_to + 1, 1, 1)
+        if rating_from is not None:
+            conditions.append("rating >= :rating_from")
+            params["rating_from"] = rating_from
+        if rating_to is not None:
+            conditions.append("rating <= :rating_to")
+            params["rating_to"] = rating_to
+
+        comparison = "<" if desc else ">"
+        if cursor:
+            cursor_value, cursor_id = decode_cursor(cursor, order_by)
+            if order_by == "id":
+                conditions.append(f"id {comparison} :cursor_id")
+            else:
+                conditions.append(f"({order_by}, id) {comparison} (:cursor_value, :cursor_id)")
+                params["cursor_value"] = cursor_value
+            params["cursor_id"] = cursor_id
+
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        direction = "DESC" if desc else "ASC"
+        order_clause = "id" if order_by == "id" else f"{order_by} {direction}, id"
+
+        query = text(f"""
+            SELECT {MOVIE_COLUMNS}
+            FROM movies
+            {where_clause}
+            ORDER BY {order_clause} {direction}
+            LIMIT :limit
+        """)
+
+        async with async_session_maker() as session:
+            result = await session.execute(query, params)
+            rows = result.fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            sort_index = {"id": 0, "rating": 5, "release_date": 3}[order_by]
+            next_cursor = encode_cursor(last[sort_index], last[0])
+
+        return [[movie_row_to_dict(row) for row in rows], next_cursor]
+
+    @classmethod
+    async def get_similar_movies(cls, movie_id: int, limit: int = 20) -> list:
+        """Похожие фильмы (через кэш, хранится SIMILAR_CACHE_SIZE лучших)"""
+        version = await cache_service.get_version(SIMILAR_CACHE_NAMESPACE)
+        movies = await cache_service.get_or_load(
+            movie_similar_cache_key(movie_id, version),
+            lambda: cls._load_similar_movies(movie_id, SIMILAR_CACHE_SIZE),
+            ttl=cache_service.settings["catalog_ttl"],
+            negative_ttl=cache_service.settings["movie_negative_ttl"],
+        )
+        return movies[:limit]
+
+    @classmethod
+    async def _load_similar_movies(cls, movie_id: int, limit: int) -> list:
+        """
+        Похожие фильмы из индекса movie_similarities (строится ETL сервисом).
+        Пока для фильма нет записей в индексе, отдаются фильмы с самым высоким рейтингом;
+        для несуществующего фильма - пустой список.
+        """
+        movie_columns = ", ".join(f"m.{column.strip()}" for column in MOVIE_COLUMNS.split(","))
         async with async_session_maker() as session:
-            query = text("""
-                SELECT id, title, description, release_date, duration, rating, 
-                       movie_url, poster_url, backdrop_url, trailer_url, created_at, updated_at
-                FROM movies 
-                ORDER BY id
+            query = text(f"""
+                SELECT {movie_columns}
+                FROM movie_similarities s
+                JOIN movies m ON m.id = s.similar_movie_id
+                WHERE s.movie_id = :movie_id
+                ORDER BY s.score DESC
+                LIMIT :limit
             """)
-            result = await session.execute(query)
+            result = await session.execute(query, {"movie_id": movie_id, "limit": limit})
             rows = result.fetchall()
-            
-            logger.info(f"DEBUG: Found {len(rows)} movies")
-            if rows:
-                first_row = rows[0]
-                logger.info(f"DEBUG: First movie - ID: {first_row[0]}, Title: {first_row[1]}, Backdrop: {first_row[8]}, Trailer: {first_row[9]}")
-            
-            # Преобразуем результаты в словари
-            movies = []
-            for row in rows:
-                movie_dict = {
-                    "id": row[0],
-                    "title": row[1],
-                    "description": row[2],
-                    "release_date": row[3].isoformat() if row[3] else None,
-                    "duration": row[4],
-                    "rating": row[5],
-                    "movie_url": row[6],
-                    "poster_url": row[7],
-                    "backdrop_url": row[8],
-                    "trailer_url": row[9],
-                    "created_at": row[10].isoformat() if row[10] else None,
-                    "updated_at": row[11].isoformat() if row[11] else None,
-                }
-                movies.append(movie_dict)
-            
-            logger.info(f"DEBUG: Returning {len(movies)} movies")
-            if movies:
-                logger.info(f"DEBUG: First movie dict - backdrop_url: {movies[0].get('backdrop_url')}, trailer_url: {movies[0].get('trailer_url')}")
-            
-            return movies
+
+            if not rows:
+                fallback_query = text(f"""
+                    SELECT {MOVIE_COLUMNS}
+                    FROM movies
+                    WHERE id != :movie_id
+                      AND EXISTS (SELECT 1 FROM movies WHERE id = :movie_id)
+                    ORDER BY rating DESC, id DESC
+                    LIMIT :limit
+                """)
+                result = await session.execute(fallback_query, {"movie_id": movie_id, "limit": limit})
+                rows = result.fetchall()
+
+        return [movie_row_to_dict(row) for row in rows]
+
+    @classmethod
+    async def invalidate_by_tmdb_ids(cls, tmdb_ids: list[int]) -> int:
+        """
+        Сбрасывает все кэши, зависящие от фильмов с указанными TMDB id:
+        карточки, списки актеров и похожих фильмов (свои и соседей), страницы актеров
+        и все страницы каталога. Возвращает количество найденных фильмов.
+        """
+        async with async_session_maker() as session:
+            result = await session.execute(
+                text("SELECT id FROM movies WHERE tmdb_id = ANY(CAST(:tmdb_ids AS int[]))"),
+                {"tmdb_ids": list(tmdb_ids)}
+            )
+            movie_ids = [row[0] for row in result.fetchall()]
+
+            neighbor_ids, actor_ids = [], []
+            if movie_ids:
+                # Списки похожих фильмов, в которые входят обновленные фильмы
+                result = await session.execute(
+                    text("SELECT DISTINCT movie_id FROM movie_similarities WHERE similar_movie_id = ANY(CAST(:movie_ids AS int[]))"),
+                    {"movie_ids": movie_ids}
+                )
+                neighbor_ids = [row[0] for row in result.fetchall()]
+                result = await session.execute(
+                    text("SELECT DISTINCT actor_id FROM movie_actors WHERE movie_id = ANY(CAST(:movie_ids AS int[]))"),
+                    {"movie_ids": movie_ids}
+                )
+                actor_ids = [row[0] for row in result.fetchall()]
+
+        similar_version = await cache_service.get_version(SIMILAR_CACHE_NAMESPACE)
+        keys = []
+        for movie_id in movie_ids:
+            keys += [movie_cache_key(movie_id), movie_similar_cache_key(movie_id, similar_version),
+                     movie_actors_cache_key(movie_id)]
+        keys += [movie_similar_cache_key(movie_id, similar_version) for movie_id in neighbor_ids]
+        keys += [actor_cache_key(actor_id) for actor_id in actor_ids]
+
+        for start in range(0, len(keys), 1000):
+            await cache_service.invalidate(*keys[start:start + 1000])
+        await cache_service.bump_version(CATALOG_CACHE_NAMESPACE)
+
+        logger.info(f"Cache invalidated for {len(movie_ids)} movies ({len(keys)} keys)")
+        return len(movie_ids)
+
+    @classmethod
+    async def invalidate_similar(cls):
+        """Сбрасывает списки похожих фильмов всех фильмов (после перестроения индекса)"""
+        await cache_service.bump_version(SIMILAR_CACHE_NAMESPACE)
+        logger.info("Similar movies cache invalidated")
 
     @classmethod
     async def get_movies_by_parameters(cls, **filter_by):
@@ -66,38 +284,37 @@ class MovieService:
             return result.scalars().all()
 
     @classmethod
-    async def get_movie_or_none_by_id(cls, data_id: int):
-        cache_key = f"movie_{data_id}"
-        
-        # ?????????? ????????? ? ?????? ?????
+    async def get_movie_or_none_by_id(cls, data_id: int) -> dict | None:
+        """Карточка фильма через read-through кэш (ключ movie_{id}), None - если фильма нет"""
+        cache_settings = cache_service.settings
+        return await cache_service.get_or_load(
+            movie_cache_key(data_id),
+            lambda: cls._load_movie_by_id(data_id),
+            ttl=cache_settings["movie_ttl"],
+            negative_ttl=cache_settings["movie_negative_ttl"],
+        )
+
+    @classmethod
+    async def _load_movie_by_id(cls, data_id: int) -> dict | None:
+        async with async_session_maker() as session:
+            query = text(f"SELECT {MOVIE_COLUMNS} FROM movies WHERE id = :movie_id")
+            result = await session.execute(query, {"movie_id": data_id})
+            row = result.fetchone()
+
+        # Лог пишется только при заполнении кэша из БД, а не на каждое обращение
         log_message = {
             "service": "main_service",
             "level": "info",
             "message": f"Movie cache update for movie_id: {data_id}",
             "metadata": {
                 "movie_id": data_id,
-                "action": "cache_update"
+                "action": "cache_update",
+                "found": row is not None
             }
         }
-        await redis_client.publish("logs", json.dumps(log_message))
-        
-        cached_data = await redis_client.get(cache_key)
-        if cached_data:
-            # Возвращаем словарь напрямую, так как роутер ожидает объект Movie или dict
-            cached_dict = json.loads(cached_data)
-            return cached_dict
+        try:
+            await publish_log(redis_client, log_message, **get_log_transport_settings())
+        except Exception as e:
+            logger.warning(f"Failed to publish log message: {e}")
 
-        async with async_session_maker() as session:
-            query = select(Movie).filter_by(id=data_id)
-            result = await session.execute(query)
-            movie = result.unique().scalar_one_or_none()
-            
-            if movie:
-                await redis_client.set(
-                    cache_key,
-                    json.dumps(movie.to_dict()),
-                    ex=3600
-                )
-                logger.info(f"Movie {data_id} cached")
-            
-            return movie
\ No newline at end of file
+        return movie_row_to_dict(row) if row else None
@@ -0,0 +1,405 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from main_service.config import get_packaging_settings
+from main_service.database import async_session_maker
+from main_service.services.cache_service import cache_service
+from main_service.services.file_service import file_service
+from main_service.services.streaming_service import to_internal_url
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MASTER_PLAYLIST = "master.m3u8"
+HLS_CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+}
+
+
+def packaging_cache_key(movie_id: int) -> str:
+    return f"packaging:{movie_id}"
+
+
+class PackagingService:
+    """
+    Упаковка фильмов в HLS с несколькими качествами.
+
+    Исходный MP4 (movies.movie_url) читается ffmpeg напрямую из MinIO, перекодируется
+    в лестницу качеств PACKAGING_LADDER (не выше исходного разрешения) с выровненными
+    по PACKAGING_SEGMENT_SECONDS ключевыми кадрами и выгружается в MinIO под
+    movies/{movie_id}/hls/{версия}/. Статус хранится в таблице movie_packaging;
+    новая версия становится доступной только после полной выгрузки, поэтому
+    повторная упаковка не ломает текущие просмотры. Предыдущая версия попадает в
+    superseded_hls_versions и удаляется фоновой очисткой через PACKAGING_SUPERSEDED_RETENTION:
+    у зрителей остаются плейлисты и presigned URL, указывающие на нее.
+    Идущая упаковка раз в PACKAGING_HEARTBEAT_INTERVAL обновляет updated_at; упаковка
+    без обновлений дольше PACKAGING_STALE_AFTER брошена упавшим воркером и ставится в очередь заново.
+    """
+
+    def __init__(self):
+        self.settings = get_packaging_settings()
+        self._semaphore = asyncio.Semaphore(self.settings["concurrency"])
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._cleanup: Optional[asyncio.Task] = None
+
+    async def enqueue(self, movie_id: int) -> Optional[dict]:
+        """Ставит фильм в очередь на упаковку; None, если у фильма нет исходного видео"""
+        if movie_id in self._tasks:
+            return await self.get_status(movie_id)
+        if await self._get_source_url(movie_id) is None:
+            return None
+
+        async with async_session_maker() as session:
+            await session.execute(text("""
+                INSERT INTO movie_packaging (movie_id, status, error, updated_at)
+                VALUES (:movie_id, 'pending', NULL, now())
+                ON CONFLICT (movie_id) DO UPDATE
+                SET status = 'pending', error = NULL, updated_at = now()
+                -- Упаковку другого воркера не перезапускаем, если она не зависла после падения
+                WHERE movie_packaging.status <> 'processing'
+                   OR movie_packaging.updated_at < now() - make_interval(secs => :stale_after)
+            """), {"movie_id": movie_id, "stale_after": self.settings["stale_after"]})
+            await session.commit()
+        self._start(movie_id)
+        return await self.get_status(movie_id)
+
+    async def resume(self):
+        """
+        Запускает упаковки, которые остались в очереди после перезапуска, и брошенные
+        упавшими воркерами (processing без обновлений дольше stale_after)
+        """
+        try:
+            async with async_session_maker() as session:
+                await session.execute(text("""
+                    UPDATE movie_packaging SET status = 'pending', updated_at = now()
+                    WHERE status = 'processing'
+                      AND updated_at < now() - make_interval(secs => :stale_after)
+                """), {"stale_after": self.settings["stale_after"]})
+                await session.commit()
+                result = await session.execute(
+                    text("SELECT movie_id FROM movie_packaging WHERE status = 'pending'")
+                )
+                movie_ids = [row[0] for row in result.fetchall()]
+        except Exception as e:
+            logger.error(f"Failed to resume packaging jobs: {e}")
+            return
+        for movie_id in movie_ids:
+            self._start(movie_id)
+        if movie_ids:
+            logger.info(f"Resumed packaging for movies: {movie_ids}")
+
+    async def start(self):
+        """Возобновляет упаковки и запускает очистку замененных версий"""
+        if self._cleanup is None:
+            self._cleanup = asyncio.create_task(self.run_cleanup())
+        await self.resume()
+
+    async def shutdown(self):
+        """Прерывает упаковки; они вернутся в очередь и продолжатся после перезапуска"""
+        tasks = list(self._tasks.values())
+        if self._cleanup is not None:
+            tasks.append(self._cleanup)
+            self._cleanup = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def get_status(self, movie_id: int) -> Optional[dict]:
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+                SELECT movie_id, status, hls_prefix, renditions, error, updated_at
+                FROM movie_packaging WHERE movie_id = :movie_id
+            """), {"movie_id": movie_id})
+            row = result.fetchone()
+        if row is None:
+            return None
+        return {
+            "movie_id": row.movie_id,
+            "status": row.status,
+            "renditions": [int(height) for height in row.renditions.split(",")] if row.renditions else [],
+            "error": row.error,
+            "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+        }
+
+    async def get_ready_prefix(self, movie_id: int) -> Optional[str]:
+        """Префикс готовой HLS-упаковки в MinIO (кэшируется в Redis)"""
+        cache_settings = cache_service.settings
+        return await cache_service.get_or_load(
+            packaging_cache_key(movie_id),
+            lambda: self._load_ready_prefix(movie_id),
+            ttl=cache_settings["catalog_ttl"],
+            negative_ttl=cache_settings["movie_negative_ttl"],
+        )
+
+    async def get_playlist(self, movie_id: int, name: str, presign: bool = False) -> Optional[str]:
+        """
+        Текст плейлиста из готовой упаковки. При presign=True ссылки на сегменты
+        заменяются presigned URL, и сегменты клиент забирает напрямую из MinIO.
+        """
+        prefix = await self.get_ready_prefix(movie_id)
+        if prefix is None:
+            return None
+        data = await file_service.read_file(f"{prefix}/{name}")
+        if data is None:
+            return None
+        playlist = data.decode()
+        if not presign:
+            return playlist
+
+        lines = []
+        for line in playlist.splitlines():
+            if line and not line.startswith("#") and line.endswith(".ts"):
+                line = await file_service.get_presigned_url(f"{prefix}/{line}")
+            lines.append(line)
+        return "\n".join(lines) + "\n"
+
+    async def get_segment_path(self, movie_id: int, name: str) -> Optional[str]:
+        """Путь сегмента в MinIO"""
+        prefix = await self.get_ready_prefix(movie_id)
+        return f"{prefix}/{name}" if prefix else None
+
+    def _start(self, movie_id: int):
+        if movie_id not in self._tasks:
+            self._tasks[movie_id] = asyncio.create_task(self._run(movie_id))
+
+    async def _run(self, movie_id: int):
+        try:
+            async with self._semaphore:
+                if not await self._claim(movie_id):
+                    return
+                previous_prefix = await self._load_ready_prefix(movie_id)
+                heartbeat = asyncio.create_task(self._heartbeat(movie_id))
+                try:
+                    prefix, heights = await self._package(movie_id)
+                except asyncio.CancelledError:
+                    await asyncio.shield(self._set_status(movie_id, "pending"))
+                    raise
+                except Exception as e:
+                    logger.error(f"Packaging failed for movie {movie_id}: {e}")
+                    await self._set_status(movie_id, "failed", error=str(e)[-2000:])
+                    return
+                finally:
+                    heartbeat.cancel()
+                await self._set_status(
+                    movie_id, "ready", hls_prefix=prefix, renditions=",".join(str(h) for h in heights)
+                )
+                await cache_service.invalidate(packaging_cache_key(movie_id))
+                logger.info(f"Movie {movie_id} packaged to HLS: {prefix}, renditions: {heights}")
+                if previous_prefix and previous_prefix != prefix:
+                    await self._supersede(movie_id, previous_prefix)
+        finally:
+            self._tasks.pop(movie_id, None)
+
+    async def _supersede(self, movie_id: int, prefix: str):
+        """Откладывает удаление предыдущей версии: ее плейлисты и presigned URL еще у зрителей"""
+        try:
+            async with async_session_maker() as session:
+                await session.execute(text("""
+                    INSERT INTO superseded_hls_versions (hls_prefix, movie_id, superseded_at)
+                    VALUES (:prefix, :movie_id, now())
+                    ON CONFLICT (hls_prefix) DO NOTHING
+                """), {"prefix": prefix, "movie_id": movie_id})
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Failed to schedule cleanup of HLS version {prefix}: {e}")
+
+    async def run_cleanup(self):
+        while True:
+            try:
+                await self.cleanup_superseded()
+            except Exception as e:
+                logger.error(f"Failed to clean up superseded HLS versions: {e}")
+            await asyncio.sleep(self.settings["cleanup_interval"])
+
+    async def cleanup_superseded(self) -> int:
+        """Удаляет из MinIO замененные версии старше superseded_retention. Возвращает их количество"""
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+                SELECT hls_prefix FROM superseded_hls_versions
+                WHERE superseded_at < now() - make_interval(secs => :retention)
+            """), {"retention": self.settings["superseded_retention"]})
+            prefixes = [row[0] for row in result.fetchall()]
+        for prefix in prefixes:
+            await file_service.delete_prefix(f"{prefix}/")
+            async with async_session_maker() as session:
+                await session.execute(
+                    text("DELETE FROM superseded_hls_versions WHERE hls_prefix = :prefix"), {"prefix": prefix}
+                )
+                await session.commit()
+            logger.info(f"Deleted superseded HLS version {prefix}")
+        return len(prefixes)
+
+    async def _heartbeat(self, movie_id: int):
+        """Обновляет updated_at идущей упаковки, чтобы ее не сочли брошенной"""
+        while True:
+            await asyncio.sleep(self.settings["heartbeat_interval"])
+            try:
+                async with async_session_maker() as session:
+                    await session.execute(text("""
+                        UPDATE movie_packaging SET updated_at = now()
+                        WHERE movie_id = :movie_id AND status = 'processing'
+                    """), {"movie_id": movie_id})
+                    await session.commit()
+            except Exception as e:
+                logger.warning(f"Packaging heartbeat failed for movie {movie_id}: {e}")
+
+    async def _claim(self, movie_id: int) -> bool:
+        """Забирает задачу (pending -> processing), чтобы ее не выполнили два воркера"""
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+                UPDATE movie_packaging SET status = 'processing', updated_at = now()
+                WHERE movie_id = :movie_id AND status = 'pending'
+                RETURNING movie_id
+            """), {"movie_id": movie_id})
+            claimed = result.fetchone() is not None
+            await session.commit()
+        return claimed
+
+    async def _set_status(self, movie_id: int, status: str, hls_prefix: Optional[str] = None,
+                          renditions: Optional[str] = None, error: Optional[str] = None):
+        async with async_session_maker() as session:
+            await session.execute(text("""
+                UPDATE movie_packaging
+                SET status = :status,
+                    hls_prefix = COALESCE(:hls_prefix, hls_prefix),
+                    renditions = COALESCE(:renditions, renditions),
+                    error = :error,
+                    updated_at = now()
+                WHERE movie_id = :movie_id
+            """), {"movie_id": movie_id, "status": status, "hls_prefix": hls_prefix,
+                   "renditions": renditions, "error": error})
+            await session.commit()
+
+    async def _load_ready_prefix(self, movie_id: int) -> Optional[str]:
+        async with async_session_maker() as session:
+            result = await session.execute(text("""
+                SELECT hls_prefix FROM movie_packaging
+                WHERE movie_id = :movie_id AND hls_prefix IS NOT NULL
+            """), {"movie_id": movie_id})
+            row = result.fetchone()
+        # Предыдущая готовая версия продолжает отдаваться, пока идет повторная упаковка
+        return row[0] if row else None
+
+    async def _get_source_url(self, movie_id: int) -> Optional[str]:
+        async with async_session_maker() as session:
+            result = await session.execute(
+                text("SELECT movie_url FROM movies WHERE id = :movie_id"), {"movie_id": movie_id}
+            )
+            row = result.fetchone()
+        return row[0] if row and row[0] else None
+
+    async def _package(self, movie_id: int) -> Tuple[str, List[int]]:
+        source_url = await self._get_source_url(movie_id)
+        if source_url is None:
+            raise RuntimeError("Movie has no source video")
+        source_url = to_internal_url(source_url)
+
+        source_height, has_audio = await self._probe(source_url)
+        ladder = [rung for rung in self.settings["ladder"] if rung[0] <= source_height]
+        if not ladder:
+            # Исходник меньше самого низкого качества - оставляем одно, без апскейла
+            ladder = [(source_height, self.settings["ladder"][-1][1])]
+
+        os.makedirs(self.settings["work_dir"], exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix=f"movie_{movie_id}_", dir=self.settings["work_dir"])
+        try:
+            await self._run_process(self._ffmpeg_command(source_url, work_dir, ladder, has_audio))
+            prefix = f"movies/{movie_id}/hls/{int(time.time())}"
+            await self._upload_dir(work_dir, prefix)
+        finally:
+            await asyncio.to_thread(shutil.rmtree, work_dir, True)
+        return prefix, [height for height, _ in ladder]
+
+    async def _probe(self, source_url: str) -> Tuple[int, bool]:
+        """Высота видео и наличие аудиодорожки в исходнике"""
+        output = await self._run_process([
+            self.settings["ffprobe"], "-v", "error",
+            "-show_entries", "stream=codec_type,height", "-of", "json", source_url
+        ])
+        streams = json.loads(output or "{}").get("streams", [])
+        heights = [s.get("height") or 0 for s in streams if s.get("codec_type") == "video"]
+        if not heights:
+            raise RuntimeError("Source has no video stream")
+        has_audio = any(s.get("codec_type") == "audio" for s in streams)
+        return heights[0], has_audio
+
+    def _ffmpeg_command(self, source_url: str, work_dir: str,
+                        ladder: List[Tuple[int, int]], has_audio: bool) -> List[str]:
+        segment = self.settings["segment_seconds"]
+        command = [self.settings["ffmpeg"], "-hide_banner", "-loglevel", "error", "-y", "-i", source_url]
+        for _ in ladder:
+            command += ["-map", "0:v:0"]
+            if has_audio:
+                command += ["-map", "0:a:0"]
+        for index, (height, bitrate) in enumerate(ladder):
+            command += [
+                f"-filter:v:{index}", f"scale=-2:{height}",
+                f"-b:v:{index}", f"{bitrate}k",
+                f"-maxrate:v:{index}", f"{int(bitrate * 1.07)}k",
+                f"-bufsize:v:{index}", f"{bitrate * 2}k",
+            ]
+        # Ключевые кадры на границах сегментов во всех качествах - иначе плеер не сможет переключаться
+        command += [
+            "-c:v", "libx264", "-preset", self.settings["preset"], "-pix_fmt", "yuv420p",
+            "-force_key_frames", f"expr:gte(t,n_forced*{segment})", "-sc_threshold", "0",
+        ]
+        if has_audio:
+            command += ["-c:a", "aac", "-b:a", f"{self.settings['audio_bitrate']}k", "-ac", "2"]
+        stream_map = " ".join(
+            f"v:{index},a:{index}" if has_audio else f"v:{index}" for index in range(len(ladder))
+        )
+        command += [
+            "-f", "hls", "-hls_time", str(segment), "-hls_playlist_type", "vod",
+            "-hls_flags", "independent_segments",
+            "-hls_segment_filename", os.path.join(work_dir, "v%v_%05d.ts"),
+            "-master_pl_name", MASTER_PLAYLIST,
+            "-var_stream_map", stream_map,
+            os.path.join(work_dir, "v%v.m3u8"),
+        ]
+        return command
+
+    async def _run_process(self, command: List[str]) -> str:
+        process = await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            raise RuntimeError(f"{os.path.basename(command[0])} exited with {process.returncode}: "
+                               f"{stderr.decode(errors='replace').strip()[-1000:]}")
+        return stdout.decode(errors="replace")
+
+    async def _upload_dir(self, work_dir: str, prefix: str):
+        """Выгружает сегменты и плейлисты; мастер-плейлист - последним"""
+        names = sorted(os.listdir(work_dir), key=lambda name: (name.endswith(".m3u8"), name))
+        if MASTER_PLAYLIST not in names:
+            raise RuntimeError("ffmpeg did not produce a master playlist")
+        names.remove(MASTER_PLAYLIST)
+        semaphore = asyncio.Semaphore(self.settings["upload_concurrency"])
+
+        async def upload(name: str):
+            async with semaphore:
+                await file_service.upload_local_file(
+                    f"{prefix}/{name}", os.path.join(work_dir, name),
+                    HLS_CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+                )
+
+        await asyncio.gather(*(upload(name) for name in names))
+        await upload(MASTER_PLAYLIST)
+
+
+packaging_service = PackagingService()
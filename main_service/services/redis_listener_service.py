@@ -1,5 +1,8 @@
 import asyncio
 from main_service.cache_redis import redis_client
+from main_service.config import get_cache_settings, get_listener_settings
+from main_service.services.movies_service import MovieService
+from shared.messaging.pubsub_consumer import PubSubConsumer
 import json
 import logging
 
@@ -9,43 +12,94 @@ logger = logging.getLogger(__name__)
 
 class RedisListenerService:
     def __init__(self):
-        self.pubsub = redis_client.pubsub()
-        self.running = False
+        self.cache_settings = get_cache_settings()
+        self.listener_settings = get_listener_settings()
+        self.consumer = PubSubConsumer(
+            redis_client,
+            ["movie_cache_update"],
+            self.process_message,
+            workers=self.listener_settings["workers"],
+            queue_size=self.listener_settings["queue_size"],
+            name="main_service"
+        )
+        # TMDB id фильмов, ожидающих инвалидации кэша, задача отложенного сброса пачки
+        # и все запущенные задачи сброса (ссылки не дают сборщику мусора удалить их посреди работы)
+        self._pending_tmdb_ids: set[int] = set()
+        self._flush_task: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
         logger.info("RedisListenerService инициализирован")
 
     async def start_listening(self):
         """Запускает прослушивание Redis каналов"""
         logger.info("Начинаем прослушивание Redis каналов")
-        self.running = True
-        await self.pubsub.subscribe("movie_cache_update")
+        await self.consumer.start()
         logger.info("Подписались на канал movie_cache_update")
-        
-        while self.running:
-            try:
-                message = await self.pubsub.get_message(ignore_subscribe_messages=True)
-                if message:
-                    logger.info(f"Получено сообщение: {message}")
-                    await self.process_message(message)
-            except Exception as e:
-                logger.error(f"Ошибка при получении сообщения: {e}")
-            await asyncio.sleep(0.1)
 
     async def process_message(self, message):
         """Обработка полученного сообщения"""
         try:
             if message["type"] == "message":
-                data = message["data"]
-                logger.info(f"Обработка сообщения: {data}")
-                # Здесь можно добавить логику обработки сообщения
+                data = json.loads(message["data"])
+                if data.get("action") == "movie_updated" and data.get("movie_id") is not None:
+                    # В событиях ETL movie_id - это TMDB id фильма
+                    self._pending_tmdb_ids.add(int(data["movie_id"]))
+                    self._schedule_flush()
+                elif data.get("action") == "similarities_rebuilt":
+                    await MovieService.invalidate_similar()
+                else:
+                    logger.info(f"Пропущено сообщение: {data}")
         except Exception as e:
             logger.error(f"Ошибка при обработке сообщения: {e}")
 
+    def _schedule_flush(self):
+        """События копятся в течение окна, чтобы большой импорт ETL сбрасывал кэш пачками"""
+        if len(self._pending_tmdb_ids) >= self.cache_settings["invalidation_batch_size"]:
+            self._track(asyncio.create_task(self.flush_invalidations()))
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = self._track(asyncio.create_task(self._delayed_flush()))
+
+    def _track(self, task: asyncio.Task) -> asyncio.Task:
+        self._tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+        return task
+
+    def _on_task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Ошибка задачи инвалидации кэша: {task.exception()}")
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.cache_settings["invalidation_window"])
+        await self.flush_invalidations()
+
+    async def flush_invalidations(self):
+        """Инвалидирует кэш для накопленных фильмов"""
+        if not self._pending_tmdb_ids:
+            return
+        tmdb_ids, self._pending_tmdb_ids = list(self._pending_tmdb_ids), set()
+        try:
+            found = await MovieService.invalidate_by_tmdb_ids(tmdb_ids)
+            logger.info(f"Кэш сброшен для {found} из {len(tmdb_ids)} фильмов")
+        except asyncio.CancelledError:
+            # Прерванная при остановке пачка сбрасывается финальным flush_invalidations
+            self._pending_tmdb_ids |= set(tmdb_ids)
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка инвалидации кэша для {tmdb_ids}: {e}")
+
     async def stop_listening(self):
-        """Останавливает прослушивание"""
+        """Останавливает прослушивание, дообрабатывая полученные сообщения"""
         logger.info("Останавливаем прослушивание Redis")
-        self.running = False
-        await self.pubsub.unsubscribe()
-        await self.pubsub.close()
+        await self.consumer.stop(drain_timeout=self.listener_settings["drain_timeout"])
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.flush_invalidations()
         logger.info("Прослушивание Redis остановлено")
 
-redis_listener = RedisListenerService() 
\ No newline at end of file
+    def metrics(self) -> dict:
+        """Метрики очереди и обработчиков"""
+        return {**self.consumer.metrics(), "pending_invalidations": len(self._pending_tmdb_ids)}
+
+redis_listener = RedisListenerService() 
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional
+
+import aiohttp
+
+from main_service.config import get_streaming_settings
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def to_internal_url(video_url: str) -> str:
+    """Приводит URL видео к адресу MinIO внутри Docker-сети"""
+    if not video_url.startswith(('http://', 'https://')):
+        # Предполагаем, что это относительный путь в MinIO
+        return f"http://minio:9000/{video_url}"
+    # Заменяем localhost на minio для внутреннего доступа в Docker
+    return video_url.replace("localhost:9000", "minio:9000")
+
+
+@dataclass
+class ObjectMeta:
+    """Размер и заголовки объекта в хранилище, нужные для ответа на Range-запросы"""
+    size: int
+    content_type: str
+    etag: Optional[str] = None
+    accept_ranges: bool = True
+
+
+class StreamingService:
+    """
+    Проксирование видео из MinIO:
+    - один пул соединений (aiohttp.ClientSession) на воркер вместо новой сессии на каждый запрос;
+    - метаданные объекта (размер, тип, ETag) кэшируются в памяти на meta_ttl секунд,
+      поэтому HEAD не выполняется перед каждым Range-запросом;
+    - ответы хранилища запрашиваются с If-Range по ETag: если объект подменили, кэш сбрасывается;
+    - данные передаются крупными кусками (chunk_size), без промежуточной буферизации.
+    """
+
+    def __init__(self):
+        self.settings = get_streaming_settings()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._meta: Dict[str, tuple] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Общая сессия воркера, создается при первом обращении"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.settings["pool_size"],
+                limit_per_host=self.settings["pool_size"],
+                keepalive_timeout=self.settings["keepalive_timeout"]
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=None,
+                    connect=self.settings["connect_timeout"],
+                    sock_read=self.settings["read_timeout"]
+                ),
+                auto_decompress=False
+            )
+        return self._session
+
+    async def close(self):
+        """Закрывает пул соединений"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def get_object_meta(self, url: str) -> Optional[ObjectMeta]:
+        """Метаданные объекта из кэша или через HEAD; None, если объекта нет"""
+        cached = self._meta.get(url)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        # Одновременные промахи по одному объекту (перемотка) ждут один HEAD
+        inflight = self._inflight.get(url)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[url] = future
+        try:
+            meta = await self._head(url)
+            if meta is not None:
+                self._remember_meta(url, meta)
+            future.set_result(meta)
+            return meta
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение полученным, даже если ожидающих не было
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(url, None)
+
+    def invalidate_meta(self, url: str):
+        """Сбрасывает закэшированные метаданные объекта"""
+        self._meta.pop(url, None)
+
+    async def open_range(self, url: str, meta: ObjectMeta, start: int, end: int) -> Optional[aiohttp.ClientResponse]:
+        """
+        Открывает ответ хранилища на диапазон [start, end].
+        Возвращает None, если объект изменился или пропал (метаданные при этом сбрасываются).
+        Ответ нужно освободить через iter_response или release().
+        """
+        headers = {}
+        full = start == 0 and end == meta.size - 1
+        if not full:
+            headers["Range"] = f"bytes={start}-{end}"
+            if meta.etag:
+                headers["If-Range"] = meta.etag
+
+        response = await self.session.get(url, headers=headers)
+        expected = 200 if full else 206
+        if response.status != expected:
+            # 200 вместо 206 - не сработал If-Range (объект заменен), 404/416 - объект удален или укорочен
+            response.release()
+            self.invalidate_meta(url)
+            logger.warning(f"Unexpected storage status {response.status} for {url}, metadata reset")
+            return None
+        return response
+
+    async def iter_response(self, response: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+        """Отдает тело ответа хранилища кусками по chunk_size и возвращает соединение в пул"""
+        try:
+            async for chunk in response.content.iter_chunked(self.settings["chunk_size"]):
+                yield chunk
+        finally:
+            response.release()
+
+    def _remember_meta(self, url: str, meta: ObjectMeta):
+        now = time.monotonic()
+        if len(self._meta) >= self.settings["meta_max_entries"]:
+            self._meta = {key: value for key, value in self._meta.items() if value[0] > now}
+            while len(self._meta) >= self.settings["meta_max_entries"]:
+                self._meta.pop(next(iter(self._meta)))
+        self._meta[url] = (now + self.settings["meta_ttl"], meta)
+
+    async def _head(self, url: str) -> Optional[ObjectMeta]:
+        async with self.session.head(url) as response:
+            if response.status == 404:
+                return None
+            if response.status != 200:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history,
+                    status=response.status, message="Unexpected storage status"
+                )
+            return ObjectMeta(
+                size=int(response.headers.get("Content-Length", 0)),
+                content_type=response.headers.get("Content-Type", "video/mp4"),
+                etag=response.headers.get("ETag"),
+                accept_ranges="bytes" in response.headers.get("Accept-Ranges", "bytes")
+            )
+
+
+streaming_service = StreamingService()
@@ -0,0 +1,193 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import AsyncIterator, Optional
+
+from botocore.exceptions import ClientError
+
+from main_service.cache_redis import redis_client
+from main_service.config import get_upload_settings
+from main_service.services.file_service import file_service
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_PART_NUMBER = 10000
+# Сроки незавершенных сессий (sorted set, score - момент истечения) и их данные (hash):
+# ключ сессии истекает вместе с данными, а по этим записям истекшую загрузку можно отменить в MinIO
+UPLOAD_DEADLINES_KEY = "upload_sessions:deadlines"
+UPLOAD_SESSIONS_KEY = "upload_sessions:data"
+
+
+def upload_session_key(session_id: str) -> str:
+    return f"upload_session:{session_id}"
+
+
+class UploadSessionService:
+    """
+    Возобновляемые загрузки больших файлов поверх multipart-загрузки MinIO.
+
+    Клиент открывает сессию, отправляет части отдельными запросами (в любом порядке
+    и параллельно) и завершает сессию. Сессия хранится в Redis, а список уже
+    загруженных частей берется из MinIO, поэтому после обрыва соединения клиент
+    запрашивает сессию и дозагружает только недостающие части. Каждая часть
+    проверяется по MD5: переданному клиентом (Content-MD5) и при записи в MinIO.
+    Загрузки сессий, истекших без complete/abort, отменяются в MinIO фоновой задачей
+    (run_reaper), иначе их части занимали бы место в bucket бессрочно.
+    """
+
+    def __init__(self):
+        self.settings = get_upload_settings()
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def create(self, user_id: int, file_path: str, content_type: str) -> dict:
+        """Открывает сессию загрузки"""
+        upload_id = await file_service.create_multipart_upload(file_path, content_type)
+        session = {
+            "session_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "file_path": file_path,
+            "content_type": content_type,
+            "upload_id": upload_id,
+        }
+        await self._save(session)
+        return await self.describe(session)
+
+    async def get(self, session_id: str, user_id: int) -> Optional[dict]:
+        """Сессия загрузки; None, если ее нет, она истекла или принадлежит другому пользователю"""
+        data = await redis_client.get(upload_session_key(session_id))
+        if data is None:
+            return None
+        session = json.loads(data)
+        return session if session["user_id"] == user_id else None
+
+    async def describe(self, session: dict) -> dict:
+        """Состояние сессии с уже загруженными частями"""
+        return {
+            "session_id": session["session_id"],
+            "file_path": session["file_path"],
+            "content_type": session["content_type"],
+            "part_size": self.settings["part_size"],
+            "max_part_size": self.settings["max_part_size"],
+            "parts": await file_service.list_parts(session["file_path"], session["upload_id"]),
+        }
+
+    async def upload_part(self, session: dict, part_number: int, chunks: AsyncIterator[bytes],
+                          content_md5: Optional[str] = None) -> dict:
+        """Принимает часть из потока запроса и загружает ее в MinIO"""
+        if not 1 <= part_number <= MAX_PART_NUMBER:
+            raise ValueError(f"Part number must be between 1 and {MAX_PART_NUMBER}")
+
+        data = bytearray()
+        async for chunk in chunks:
+            data += chunk
+            if len(data) > self.settings["max_part_size"]:
+                raise ValueError(f"Part is larger than {self.settings['max_part_size']} bytes")
+        if not data:
+            raise ValueError("Part is empty")
+
+        data = bytes(data)
+        # MD5 части в десятки мегабайт считаем вне event loop, один раз для проверки и для MinIO
+        digest = await asyncio.to_thread(lambda: hashlib.md5(data).digest())
+        if content_md5 is not None:
+            try:
+                expected = base64.b64decode(content_md5, validate=True)
+            except binascii.Error:
+                raise ValueError("Content-MD5 must be a base64-encoded MD5 digest")
+            if digest != expected:
+                raise ValueError("Part checksum mismatch")
+
+        etag = await file_service.upload_part(session["file_path"], session["upload_id"], part_number, data,
+                                              digest=digest)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.expire(upload_session_key(session["session_id"]), self.settings["session_ttl"])
+            pipe.zadd(UPLOAD_DEADLINES_KEY, {session["session_id"]: time.time() + self.settings["session_ttl"]})
+            await pipe.execute()
+        return {"part_number": part_number, "size": len(data), "etag": etag}
+
+    async def complete(self, session: dict) -> str:
+        """Собирает файл из загруженных частей и закрывает сессию"""
+        parts = await file_service.list_parts(session["file_path"], session["upload_id"])
+        numbers = [part["part_number"] for part in parts]
+        if not numbers or numbers != list(range(1, len(numbers) + 1)):
+            raise ValueError(f"Parts must be numbered 1..N without gaps, uploaded: {numbers}")
+        try:
+            await file_service.complete_multipart_upload(
+                session["file_path"], session["upload_id"],
+                [(part["part_number"], part["etag"]) for part in parts]
+            )
+        except ClientError as e:
+            # Например, EntityTooSmall: все части, кроме последней, должны быть не меньше 5 МБ
+            raise ValueError(f"Could not complete upload: {e}")
+        await self._forget(session["session_id"])
+        file_url = await file_service.get_file_url(session["file_path"])
+        logger.info(f"Resumable upload completed in {len(parts)} parts: {file_url}")
+        return file_url
+
+    async def abort(self, session: dict):
+        """Отменяет загрузку и удаляет загруженные части"""
+        await file_service.abort_multipart_upload(session["file_path"], session["upload_id"])
+        await self._forget(session["session_id"])
+
+    async def abort_expired(self) -> int:
+        """Отменяет в MinIO загрузки истекших сессий; возвращает количество отмененных"""
+        session_ids = await redis_client.zrangebyscore(UPLOAD_DEADLINES_KEY, "-inf", time.time())
+        aborted = 0
+        for session_id in session_ids:
+            # Сессию могли продлить после чтения списка
+            if await redis_client.exists(upload_session_key(session_id)):
+                continue
+            # zrem удаляет запись только у одного воркера - он и отменяет загрузку
+            if not await redis_client.zrem(UPLOAD_DEADLINES_KEY, session_id):
+                continue
+            data = await redis_client.hget(UPLOAD_SESSIONS_KEY, session_id)
+            if data is not None:
+                session = json.loads(data)
+                await file_service.abort_multipart_upload(session["file_path"], session["upload_id"])
+                aborted += 1
+            await redis_client.hdel(UPLOAD_SESSIONS_KEY, session_id)
+        if aborted:
+            logger.info(f"Aborted {aborted} expired multipart uploads")
+        return aborted
+
+    async def start(self):
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self.run_reaper())
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            await asyncio.gather(self._reaper, return_exceptions=True)
+            self._reaper = None
+
+    async def run_reaper(self):
+        while True:
+            await asyncio.sleep(self.settings["reap_interval"])
+            try:
+                await self.abort_expired()
+            except Exception as e:
+                logger.error(f"Failed to abort expired uploads: {e}")
+
+    async def _save(self, session: dict):
+        data = json.dumps(session)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(upload_session_key(session["session_id"]), data, ex=self.settings["session_ttl"])
+            pipe.hset(UPLOAD_SESSIONS_KEY, session["session_id"], data)
+            pipe.zadd(UPLOAD_DEADLINES_KEY, {session["session_id"]: time.time() + self.settings["session_ttl"]})
+            await pipe.execute()
+
+    async def _forget(self, session_id: str):
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(upload_session_key(session_id))
+            pipe.hdel(UPLOAD_SESSIONS_KEY, session_id)
+            pipe.zrem(UPLOAD_DEADLINES_KEY, session_id)
+            await pipe.execute()
+
+
+upload_session_service = UploadSessionService()
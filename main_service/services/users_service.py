@@ -6,6 +6,8 @@ from main_service.models.User import User
 from main_service.models.Genre import Genre
 from main_service.models.Movie import Movie
 
+from main_service.models.user_favorites import user_favorites
+
 from main_service.schemas.User_schema import EmailStr
 from main_service.cache_redis import redis_client
 
@@ -25,3 +27,13 @@ class UserService:
             result = await session.execute(query)
             return result.unique().scalar_one_or_none()
 
+    @classmethod
+    async def get_favorite_movies(cls, user_id: int):
+        async with async_session_maker() as session:
+            query = (
+                select(Movie)
+                .join(user_favorites, user_favorites.c.movie_id == Movie.id)
+                .where(user_favorites.c.user_id == user_id)
+            )
+            result = await session.execute(query)
+            return result.scalars().all()
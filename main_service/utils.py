@@ -1,4 +1,8 @@
 import json
+import re
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import List, Optional, Tuple
 
 
 
@@ -34,3 +38,76 @@ def json_to_dict_list(filename):
     except (TypeError, ValueError, IOError) as e:
         print(f"Ошибка при чтении JSON из файла или преобразовании в список словарей: {e}")
         return None
+
+
+RANGE_SPEC_RE = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+def parse_range_header(range_header: str, file_size: int, max_ranges: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Парсит Range header (RFC 7233): одиночные, открытые (bytes=N-), суффиксные (bytes=-N)
+    и множественные диапазоны. Пересекающиеся и соседние диапазоны склеиваются.
+    Возвращает None, если заголовок нужно проигнорировать и отдать файл целиком,
+    и пустой список, если ни один диапазон не выполним (416).
+    """
+    unit, _, specs = range_header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        match = RANGE_SPEC_RE.match(spec)
+        if not match or not (match.group(1) or match.group(2)):
+            return None
+        first, last = match.group(1), match.group(2)
+        if not first:
+            # bytes=-N - последние N байт
+            suffix = int(last)
+            if suffix > 0 and file_size > 0:
+                ranges.append((max(0, file_size - suffix), file_size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < file_size:
+            end = int(last) if last else file_size - 1
+            ranges.append((start, min(end, file_size - 1)))
+
+    ranges.sort()
+    merged: List[Tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    if len(merged) > max_ranges:
+        # Слишком дробный запрос дешевле отдать целиком
+        return None
+    return merged
+
+
+def is_not_modified(if_none_match: Optional[str], if_modified_since: Optional[str],
+                    etag: Optional[str], last_modified: Optional[datetime]) -> bool:
+    """
+    Проверяет условные заголовки запроса (RFC 7232): можно ли ответить 304.
+    If-None-Match сравнивается по ETag (слабое сравнение) и имеет приоритет над If-Modified-Since.
+    """
+    if if_none_match is not None:
+        if not etag:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return etag.removeprefix('W/') in tags
+
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None or last_modified.tzinfo is None:
+            return False
+        # Last-Modified передается с точностью до секунды
+        return last_modified.replace(microsecond=0) <= since
+    return False
@@ -5,9 +5,12 @@ import { API_URL, AUTH_URL } from '../config/api.config'
 // const POSTER_CACHE_PREFIX = 'movie_poster_'
 // const POSTER_CACHE_EXPIRY = 24 * 60 * 60 * 1000 // 24 часа
 
-// Создаем отдельные экземпляры axios для разных сервисов
+// Создаем отдельные экземпляры axios для разных сервисов.
+// withCredentials: сервисы авторизуют по cookie users_access_token,
+// а POST /auth/refresh - по httponly cookie с refresh-токеном
 const mainApi = axios.create({
   baseURL: API_URL,
+  withCredentials: true,
   headers: {
     'Content-Type': 'application/json',
   },
@@ -15,11 +18,35 @@ const mainApi = axios.create({
 
 const authApi = axios.create({
   baseURL: AUTH_URL,
+  withCredentials: true,
   headers: {
     'Content-Type': 'application/json',
   },
 })
 
+// Запросы, на 401 которых не нужно обновлять токен
+const NO_REFRESH_URLS = ['/auth/login', '/auth/refresh', '/auth/logout']
+
+// Один обмен refresh-токена на все запросы, получившие 401 одновременно:
+// повторное предъявление уже обмененного токена сервер считает кражей
+let refreshPromise: Promise<string> | null = null
+
+const refreshAccessToken = (): Promise<string> => {
+  if (!refreshPromise) {
+    refreshPromise = axios
+      .post(`${AUTH_URL}/auth/refresh`, null, { withCredentials: true })
+      .then((response) => {
+        const token = response.data.access_token
+        localStorage.setItem('token', token)
+        return token
+      })
+      .finally(() => {
+        refreshPromise = null
+      })
+  }
+  return refreshPromise
+}
+
 // Добавляем перехватчик запросов для JWT (для обоих API)
 const addAuthInterceptor = (apiInstance: any) => {
   apiInstance.interceptors.request.use(
@@ -44,17 +71,32 @@ const addAuthInterceptor = (apiInstance: any) => {
       })
       return response
     },
-    (error: any) => {
+    async (error: any) => {
       console.error(`API Error [${error.config?.url}]:`, {
         message: error.message,
         response: error.response?.data,
         status: error.response?.status,
       })
 
-      if (error.response?.status === 401) {
-        console.log('Токен истек или недействителен, выполняется выход...')
-        localStorage.removeItem('token')
-        window.location.href = '/login'
+      const request = error.config
+      if (
+        error.response?.status === 401 &&
+        request &&
+        !request._retried &&
+        !NO_REFRESH_URLS.some((url) => request.url?.startsWith(url))
+      ) {
+        // Access-токен живет минуты: обмениваем refresh-токен и повторяем запрос один раз
+        request._retried = true
+        try {
+          const token = await refreshAccessToken()
+          request.headers.Authorization = `Bearer ${token}`
+          return apiInstance(request)
+        } catch (refreshError) {
+          console.log('Сессия истекла или отозвана, выполняется выход...')
+          localStorage.removeItem('token')
+          window.location.href = '/login'
+          return Promise.reject(refreshError)
+        }
       }
 
       return Promise.reject(error)
@@ -190,6 +232,15 @@ async function processMovies(movies: any[]): Promise<Film[]> {
 //   }
 // }
 
+// Страница каталога: курсор следующей страницы приходит в заголовке X-Next-Cursor
+export interface MoviesPage {
+  movies: Film[]
+  nextCursor: string | null
+}
+
+const getNextCursor = (response: any): string | null =>
+  response.headers?.['x-next-cursor'] || null
+
 interface LoginResponse {
   access_token: string
   user_type?: string
@@ -198,13 +249,17 @@ interface LoginResponse {
 }
 
 export const MovieService = {
-  // Получение списка фильмов
-  async getMovies(page: number = 1, size: number = 50) {
+  // Получение страницы каталога (keyset-пагинация: cursor - из предыдущей страницы)
+  async getMovies(
+    cursor: string | null = null,
+    limit: number = 50,
+  ): Promise<MoviesPage> {
     try {
       const response = await mainApi.get<any[]>('/movies/', {
-        params: { page, size },
+        params: { cursor: cursor || undefined, limit },
       })
       const movies = await processMovies(response.data)
+      const nextCursor = getNextCursor(response)
 
       // Для первых 10 фильмов загружаем детали, чтобы получить backdrop_url
       const moviesWithBackdrop = await Promise.all(
@@ -223,10 +278,13 @@ export const MovieService = {
       )
 
       // Объединяем фильмы с backdrop'ами и остальные
-      return [...moviesWithBackdrop, ...movies.slice(10)]
+      return {
+        movies: [...moviesWithBackdrop, ...movies.slice(10)],
+        nextCursor,
+      }
     } catch (error) {
       console.error('Error fetching movies:', error)
-      return []
+      return { movies: [], nextCursor: null }
     }
   },
 
@@ -258,23 +316,21 @@ export const MovieService = {
     }
   },
 
-  // Получение топ рейтинга
-  async getTopRated() {
+  // Получение топ рейтинга (сортирует сервер)
+  async getTopRated(limit: number = 12) {
     try {
-      const response = await mainApi.get<any[]>('/movies/')
-      const movies = await processMovies(response.data)
-      // Сортируем по рейтингу и берем первые 12
-      return movies
-        .sort((a, b) => (b.rating || 0) - (a.rating || 0))
-        .slice(0, 12)
+      const response = await mainApi.get<any[]>('/movies/', {
+        params: { order_by: 'rating', desc: true, limit },
+      })
+      return await processMovies(response.data)
     } catch (error) {
       console.error('❌ Error fetching top rated movies:', error)
       return []
     }
   },
 
-  // Поиск фильмов (пока простой поиск по названию)
-  async searchMovies(query: string) {
+  // Поиск фильмов по началу названия (фильтрует сервер)
+  async searchMovies(query: string, limit: number = 50) {
     try {
       console.log('Searching for:', query)
 
@@ -283,23 +339,18 @@ export const MovieService = {
         return []
       }
 
-      const trimmedQuery = query.trim().toLowerCase()
+      const trimmedQuery = query.trim()
       if (!trimmedQuery) {
         return []
       }
 
-      // Получаем все фильмы и фильтруем на клиенте
-
-      const response = await mainApi.get<any[]>('/movies/')
-      const allMovies = await processMovies(response.data)
-
-      // Простой поиск по названию
-      const filteredMovies = allMovies.filter((movie) =>
-        movie.title.toLowerCase().includes(trimmedQuery),
-      )
+      const response = await mainApi.get<any[]>('/movies/', {
+        params: { title: trimmedQuery, limit },
+      })
+      const foundMovies = await processMovies(response.data)
 
-      console.log('Search results:', filteredMovies)
-      return filteredMovies
+      console.log('Search results:', foundMovies)
+      return foundMovies
     } catch (error) {
       console.error('❌ Error searching movies:', error)
       return []
@@ -323,12 +374,22 @@ export const MovieService = {
     return `${API_URL}/streaming/${movieId}`
   },
 
+  // Ссылка на просмотр с токеном: <video> не обновляет access-токен, а токен просмотра живет часы
+  async getPlaybackUrl(movieId: number): Promise<string | null> {
+    try {
+      const response = await mainApi.get<{ stream_url: string }>(`/streaming/${movieId}/playback`)
+      return `${API_URL}${response.data.stream_url}`
+    } catch (error) {
+      console.error('❌ Error fetching playback url:', error)
+      return null
+    }
+  },
+
   // Прелоадинг топ фильмов
   async preloadTopMovies() {
     try {
-      const response = await mainApi.get<any[]>('/movies/')
       // Запускаем прелоадинг в фоне
-      processMovies(response.data).catch(console.error)
+      this.getTopRated().catch(console.error)
     } catch (error) {
       console.error('❌ Error preloading top movies:', error)
     }
@@ -365,27 +426,30 @@ export const MovieService = {
     }
   },
 
-  // Получение всех фильмов с пагинацией
-  async getAllMovies(page: number = 1, size: number = 24) {
+  // Получение страницы каталога без загрузки деталей
+  async getAllMovies(
+    cursor: string | null = null,
+    limit: number = 24,
+  ): Promise<MoviesPage> {
     try {
       const response = await mainApi.get<any[]>('/movies/', {
-        params: { page, size },
+        params: { cursor: cursor || undefined, limit },
       })
 
       if (!response.data) {
         console.warn('Empty response data')
-        return { movies: [], total: 0 }
+        return { movies: [], nextCursor: null }
       }
 
       const movies = await processMovies(response.data)
 
       return {
         movies,
-        total: movies.length,
+        nextCursor: getNextCursor(response),
       }
     } catch (error) {
       console.error('❌ Error fetching all movies:', error)
-      return { movies: [], total: 0 }
+      return { movies: [], nextCursor: null }
     }
   },
 }
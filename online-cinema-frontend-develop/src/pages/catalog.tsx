@@ -1,5 +1,4 @@
 import { useEffect, useState } from 'react'
-import { useSearchParams } from 'react-router-dom'
 
 import { MovieService } from '../api/movie-api'
 import { Container } from '../components/container'
@@ -9,28 +8,33 @@ import { Film } from '../interfaces'
 const PAGE_SIZE = 20
 
 export const CatalogPage = () => {
-  const [searchParams, setSearchParams] = useSearchParams()
   const [movies, setMovies] = useState<Film[]>([])
   const [isLoading, setIsLoading] = useState(true)
-  const [totalPages, setTotalPages] = useState(1)
-
-  const currentPage = Number(searchParams.get('page')) || 1
+  // Курсоры открытых страниц: cursors[i] - курсор страницы i + 1 (у первой курсора нет)
+  const [cursors, setCursors] = useState<(string | null)[]>([null])
+  const [pageIndex, setPageIndex] = useState(0)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
 
   useEffect(() => {
     const fetchMovies = async () => {
       setIsLoading(true)
-      const data = await MovieService.getMovies(currentPage, PAGE_SIZE)
-      setMovies(data)
-      // Предполагаем, что всего 1000 фильмов
-      setTotalPages(Math.ceil(1000 / PAGE_SIZE))
+      const data = await MovieService.getMovies(cursors[pageIndex], PAGE_SIZE)
+      setMovies(data.movies)
+      setNextCursor(data.nextCursor)
       setIsLoading(false)
     }
 
     fetchMovies()
-  }, [currentPage])
+  }, [cursors, pageIndex])
+
+  const handleNextPage = () => {
+    if (!nextCursor) return
+    setCursors([...cursors.slice(0, pageIndex + 1), nextCursor])
+    setPageIndex(pageIndex + 1)
+  }
 
-  const handlePageChange = (page: number) => {
-    setSearchParams({ page: page.toString() })
+  const handlePreviousPage = () => {
+    setPageIndex(Math.max(0, pageIndex - 1))
   }
 
   return (
@@ -70,44 +74,20 @@ export const CatalogPage = () => {
           </div>
 
           {/* Пагинация */}
-          <div className="mt-8 flex justify-center gap-2">
+          <div className="mt-8 flex items-center justify-center gap-2">
             <button
-              onClick={() => handlePageChange(currentPage - 1)}
-              disabled={currentPage === 1}
+              onClick={handlePreviousPage}
+              disabled={pageIndex === 0}
               className="rounded-lg bg-card px-4 py-2 text-white disabled:opacity-50"
             >
               Назад
             </button>
-            <div className="flex items-center gap-2">
-              {Array.from({ length: totalPages }, (_, i) => i + 1)
-                .filter(
-                  (page) =>
-                    page === 1 ||
-                    page === totalPages ||
-                    Math.abs(page - currentPage) <= 2,
-                )
-                .map((page, index, array) => (
-                  <>
-                    {index > 0 && array[index - 1] !== page - 1 && (
-                      <span className="px-2">...</span>
-                    )}
-                    <button
-                      key={page}
-                      onClick={() => handlePageChange(page)}
-                      className={`rounded-lg px-4 py-2 ${
-                        currentPage === page
-                          ? 'bg-primary text-white'
-                          : 'bg-card text-white hover:bg-gray-700'
-                      }`}
-                    >
-                      {page}
-                    </button>
-                  </>
-                ))}
-            </div>
+            <span className="rounded-lg bg-primary px-4 py-2 text-white">
+              {pageIndex + 1}
+            </span>
             <button
-              onClick={() => handlePageChange(currentPage + 1)}
-              disabled={currentPage === totalPages}
+              onClick={handleNextPage}
+              disabled={!nextCursor}
               className="rounded-lg bg-card px-4 py-2 text-white disabled:opacity-50"
             >
               Вперед
@@ -16,6 +16,7 @@ export const FilmPage = () => {
   const [isLoading, setIsLoading] = useState(true)
   const [error, setError] = useState<string>('')
   const [showPlayer, setShowPlayer] = useState(false)
+  const [streamUrl, setStreamUrl] = useState<string | null>(null)
 
   const navigate = useNavigate()
   const { id } = useParams()
@@ -57,9 +58,23 @@ export const FilmPage = () => {
       }
     }
 
+    setStreamUrl(null)
     fetchData()
   }, [id])
 
+  // Ссылку на просмотр (с токеном на несколько часов) запрашиваем один раз при открытии плеера
+  const togglePlayer = async () => {
+    if (!showPlayer && !streamUrl && film) {
+      const url = await MovieService.getPlaybackUrl(film.movie_id)
+      if (!url) {
+        setError('Не удалось получить ссылку на просмотр')
+        return
+      }
+      setStreamUrl(url)
+    }
+    setShowPlayer(!showPlayer)
+  }
+
   if (isLoading) {
     return (
       <div className="flex h-screen items-center justify-center">
@@ -127,7 +142,7 @@ export const FilmPage = () => {
             </p>
             <div className="flex gap-4 flex-wrap">
               <button
-                onClick={() => setShowPlayer(!showPlayer)}
+                onClick={togglePlayer}
                 className="w-fit rounded-lg bg-primary px-4 md:px-6 lg:px-8 xl:px-10 py-2 md:py-3 lg:py-4 text-sm md:text-base lg:text-lg text-white hover:bg-primary/80 transition-colors"
               >
                 {showPlayer ? 'Скрыть плеер' : 'Смотреть фильм'}
@@ -137,10 +152,10 @@ export const FilmPage = () => {
         </div>
 
         {/* Video Player */}
-        {showPlayer && (
+        {showPlayer && streamUrl && (
           <div className="mt-8">
             <VideoPlayer
-              src={`http://localhost:8001/streaming/${film.movie_id}`}
+              src={streamUrl}
               poster={film.poster_url || '/placeholder-poster.svg'}
               className="aspect-video w-full"
             />
@@ -0,0 +1 @@
+# Auth utilities (cached user principals)
@@ -0,0 +1,119 @@
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Идентификационные данные аутентифицированного пользователя (без связей и пароля)"""
+    id: int
+    username: str
+    email: str
+    is_admin: bool
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def to_claims(self) -> dict:
+        """Claims access-токена, по которым сервисы восстанавливают пользователя без запросов к БД и Redis"""
+        return {"sub": str(self.id), "username": self.username, "email": self.email, "is_admin": self.is_admin}
+
+    @classmethod
+    def from_claims(cls, payload: dict) -> Optional["Principal"]:
+        """Пользователь из claims access-токена; None, если claims неполные (токен старого формата)"""
+        try:
+            return cls(
+                id=int(payload["sub"]),
+                username=payload["username"],
+                email=payload["email"],
+                is_admin=bool(payload["is_admin"]),
+            )
+        except (KeyError, TypeError, ValueError):
+            return None
+
+
+class PrincipalCache:
+    """
+    Двухуровневый кэш пользователей для выпуска access-токенов при обновлении:
+    - в памяти процесса на local_ttl секунд (несколько секунд, без обращения к Redis);
+    - в Redis под principal:{user_id} на redis_ttl секунд, общий для всех воркеров.
+    invalidate удаляет ключ в Redis и запись текущего процесса, в остальных процессах
+    устаревшая запись живет не дольше local_ttl. При недоступности Redis данные берутся из loader.
+    """
+
+    def __init__(self, redis_client, redis_ttl: int = 300, local_ttl: float = 5.0,
+                 max_entries: int = 10000):
+        self.redis_client = redis_client
+        self.redis_ttl = redis_ttl
+        self.local_ttl = local_ttl
+        self.max_entries = max_entries
+        self._local: Dict[int, Tuple[float, Principal]] = {}
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return f"principal:{user_id}"
+
+    async def get(self, user_id: int,
+                  loader: Callable[[int], Awaitable[Optional[Principal]]]) -> Optional[Principal]:
+        """Пользователь из кэша или через loader; None, если пользователя нет (не кэшируется)"""
+        cached = self._local.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        principal = await self._get_from_redis(user_id)
+        if principal is None:
+            principal = await loader(user_id)
+            if principal is None:
+                self._local.pop(user_id, None)
+                return None
+            await self._set_to_redis(principal)
+
+        self._remember(principal)
+        return principal
+
+    async def invalidate(self, user_id: int) -> None:
+        """Сбрасывает кэш пользователя (выход, смена роли)"""
+        self._local.pop(user_id, None)
+        try:
+            await self.redis_client.delete(self.key(user_id))
+        except RedisError as e:
+            logger.warning(f"Principal cache invalidate failed for user {user_id}: {e}")
+
+    async def _get_from_redis(self, user_id: int) -> Optional[Principal]:
+        try:
+            data = await self.redis_client.get(self.key(user_id))
+        except RedisError as e:
+            logger.warning(f"Principal cache read failed for user {user_id}: {e}")
+            return None
+        if data is None:
+            return None
+        try:
+            return Principal(**json.loads(data))
+        except (TypeError, ValueError):
+            return None
+
+    async def _set_to_redis(self, principal: Principal) -> None:
+        try:
+            await self.redis_client.set(
+                self.key(principal.id), json.dumps(principal.to_dict()), ex=self.redis_ttl
+            )
+        except RedisError as e:
+            logger.warning(f"Principal cache write failed for user {principal.id}: {e}")
+
+    def _remember(self, principal: Principal):
+        if self.local_ttl <= 0:
+            return
+        now = time.monotonic()
+        if len(self._local) >= self.max_entries:
+            self._local = {key: value for key, value in self._local.items() if value[0] > now}
+            while len(self._local) >= self.max_entries:
+                self._local.pop(next(iter(self._local)))
+        self._local[principal.id] = (now + self.local_ttl, principal)
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+import uuid
+from typing import Iterable, Optional
+
+from redis.exceptions import RedisError
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REVOKED_TOKENS_KEY = "revoked_tokens"
+REVOCATIONS_CHANNEL = "token_revocations"
+
+
+class RevocationCheckError(Exception):
+    """Проверить отзыв токена не удалось (Redis недоступен), а fail_open выключен"""
+
+
+def new_token_id() -> str:
+    """Значение claim jti для нового токена"""
+    return uuid.uuid4().hex
+
+
+def get_token_id(payload: dict, token: str) -> str:
+    """jti токена; для токенов, выпущенных до появления jti, - хэш самого токена"""
+    return payload.get("jti") or hashlib.sha256(token.encode()).hexdigest()
+
+
+def revoked_token_key(jti: str) -> str:
+    return f"revoked:{jti}"
+
+
+class BloomFilter:
+    """Фильтр Блума: без ложноотрицательных ответов, ложноположительные - с долей error_rate"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class TokenRevocationList:
+    """
+    Отозванные токены по jti.
+
+    Отзыв пишет revoked:{jti} со сроком жизни, равным оставшемуся времени жизни токена,
+    а также jti в sorted set revoked_tokens (score - момент истечения) и в канал token_revocations.
+
+    С bloom_enabled каждый процесс держит фильтр Блума отозванных jti: он собирается из
+    revoked_tokens, пополняется из канала и периодически пересобирается, чтобы забыть истекшие
+    записи. Если jti в фильтре нет, токен точно не отозван и запрос к Redis не нужен. Пока
+    подписка на канал не работает, а также без bloom_enabled каждый jti проверяется в Redis.
+
+    Если Redis при проверке недоступен, is_revoked бросает RevocationCheckError (запрос
+    отклоняется с 503). С fail_open токен в этом случае принимается: отозванные токены
+    работают до конца срока, пока Redis не вернется.
+    """
+
+    def __init__(self, redis_client, bloom_enabled: bool = True, bloom_capacity: int = 100000,
+                 bloom_error_rate: float = 0.001, bloom_rebuild_interval: float = 300.0,
+                 fail_open: bool = False):
+        self.redis_client = redis_client
+        self.fail_open = fail_open
+        if fail_open:
+            logger.warning("Revocation fail-open enabled: tokens are accepted while Redis is unavailable")
+        self.bloom_enabled = bloom_enabled
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.bloom_rebuild_interval = bloom_rebuild_interval
+        self._bloom: Optional[BloomFilter] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Запускает синхронизацию фильтра Блума (если он включен)"""
+        if self.bloom_enabled and self._task is None:
+            self._task = asyncio.create_task(self._sync_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._bloom = None
+
+    async def revoke(self, jti: str, expires_at: float) -> None:
+        """Отзывает токен до момента expires_at (unix time, exp токена), после которого он не принимается и так"""
+        now = time.time()
+        ttl = int(math.ceil(expires_at - now))
+        if ttl <= 0:
+            return
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(revoked_token_key(jti), 1, ex=ttl)
+            pipe.zadd(REVOKED_TOKENS_KEY, {jti: expires_at})
+            pipe.zremrangebyscore(REVOKED_TOKENS_KEY, "-inf", now)
+            pipe.publish(REVOCATIONS_CHANNEL, jti)
+            await pipe.execute()
+        if self._bloom is not None:
+            self._bloom.add(jti)
+
+    async def is_revoked(self, jti: str) -> bool:
+        """
+        Отозван ли access-токен. С фильтром Блума к Redis идет только запрос по jti, который
+        есть в фильтре, и все запросы, пока фильтр не загружен; без фильтра - каждый запрос.
+        """
+        if self._bloom is not None and jti not in self._bloom:
+            return False
+        try:
+            return bool(await self.redis_client.exists(revoked_token_key(jti)))
+        except RedisError as e:
+            if self.fail_open:
+                logger.warning(f"Revocation check failed for {jti}, accepting token (fail-open): {e}")
+                return False
+            logger.error(f"Revocation check failed for {jti}, rejecting request: {e}")
+            raise RevocationCheckError(str(e)) from e
+
+    def _build_bloom(self, jtis: Iterable[str]) -> BloomFilter:
+        jtis = list(jtis)
+        bloom = BloomFilter(max(self.bloom_capacity, len(jtis) * 2), self.bloom_error_rate)
+        for jti in jtis:
+            bloom.add(jti)
+        return bloom
+
+    async def _load_bloom(self):
+        jtis = await self.redis_client.zrangebyscore(REVOKED_TOKENS_KEY, time.time(), "+inf")
+        self._bloom = self._build_bloom(jtis)
+
+    async def _sync_loop(self):
+        while True:
+            pubsub = self.redis_client.pubsub()
+            try:
+                # Сначала подписка, потом загрузка: отзыв между ними не потеряется
+                await pubsub.subscribe(REVOCATIONS_CHANNEL)
+                await self._load_bloom()
+                logger.info(f"Revocation bloom filter loaded, size {self._bloom.size} bits")
+                rebuild_at = time.monotonic() + self.bloom_rebuild_interval
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and self._bloom is not None:
+                        self._bloom.add(message["data"])
+                    if time.monotonic() >= rebuild_at:
+                        await self._load_bloom()
+                        rebuild_at = time.monotonic() + self.bloom_rebuild_interval
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, OSError) as e:
+                logger.warning(f"Revocation bloom filter disabled until resync: {e}")
+                self._bloom = None
+                await asyncio.sleep(1.0)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
@@ -0,0 +1 @@
+# Messaging utilities (Redis pub/sub and stream consumers)
@@ -0,0 +1,15 @@
+import json
+
+
+async def publish_log(redis_client, log_message: dict, transport: str = "pubsub",
+                      stream: str = "logs", stream_maxlen: int = 1000000) -> None:
+    """
+    Отправляет запись лога в log_service.
+    transport="pubsub" - PUBLISH в канал logs (без гарантий доставки),
+    transport="stream" - XADD в Redis Stream, обрезаемый примерно до stream_maxlen записей.
+    """
+    data = json.dumps(log_message)
+    if transport == "stream":
+        await redis_client.xadd(stream, {"data": data}, maxlen=stream_maxlen, approximate=True)
+    else:
+        await redis_client.publish(stream, data)
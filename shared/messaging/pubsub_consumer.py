@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List
+
+from shared.messaging.queued_consumer import QueuedConsumer
+
+logger = logging.getLogger(__name__)
+
+
+class PubSubConsumer(QueuedConsumer):
+    """
+    Потребитель Redis pub/sub для сервисов Cinema.
+
+    Читатель блокируется в get_message(timeout=...) вместо опроса со sleep и сразу
+    перекладывает сообщения в ограниченную очередь, откуда их разбирают несколько
+    обработчиков. Когда очередь заполнена, читатель ждет свободного места (backpressure)
+    и это отражается в метриках. При остановке очередь дочитывается до конца.
+    """
+
+    def __init__(self, redis_client, channels: List[str],
+                 handler: Callable[[dict], Awaitable[None]],
+                 workers: int = 4, queue_size: int = 1000,
+                 poll_timeout: float = 1.0, name: str = "pubsub"):
+        super().__init__(handler, workers=workers, queue_size=queue_size, name=name)
+        self.redis_client = redis_client
+        self.channels = channels
+        self.poll_timeout = poll_timeout
+        self.pubsub = None
+
+    async def start(self):
+        """Подписывается на каналы и запускает читателя и обработчиков"""
+        self.pubsub = self.redis_client.pubsub()
+        await self.pubsub.subscribe(*self.channels)
+        self._start_tasks()
+        logger.info(f"[{self.name}] Подписка на {self.channels}, обработчиков: {self.workers}")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Прекращает чтение, дообрабатывает очередь и закрывает подписку"""
+        await self._stop_reader()
+
+        if self.pubsub:
+            # Отписываемся и забираем то, что Redis уже успел отправить в соединение
+            await self.pubsub.unsubscribe()
+            while True:
+                try:
+                    message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1)
+                except Exception as e:
+                    logger.error(f"[{self.name}] Ошибка при дочитывании сообщений: {e}")
+                    break
+                if message is None:
+                    break
+                await self._enqueue(message)
+
+        await self._drain(drain_timeout)
+
+        if self.pubsub:
+            await self.pubsub.close()
+        logger.info(f"[{self.name}] Остановлен, метрики: {self.metrics()}")
+
+    async def _read_loop(self):
+        while self.running:
+            try:
+                message = await self.pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=self.poll_timeout
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[{self.name}] Ошибка при получении сообщения: {e}")
+                await asyncio.sleep(self.poll_timeout)
+                continue
+
+            if message is not None:
+                await self._enqueue(message)
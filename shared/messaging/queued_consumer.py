@@ -0,0 +1,108 @@
+import abc
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueuedConsumer(abc.ABC):
+    """
+    Общая часть потребителей сообщений Redis: ограниченная очередь между читателем
+    и пулом обработчиков, backpressure и метрики. Наследники реализуют чтение
+    (_read_loop) и, при необходимости, подтверждение обработки (_ack).
+
+    С auto_ack=False сообщение не подтверждается после обработчика: обработчик получает
+    его ack_id в message["id"] и подтверждает сам, когда данные действительно сохранены.
+    """
+
+    def __init__(self, handler: Callable[[dict], Awaitable[None]],
+                 workers: int = 4, queue_size: int = 1000, name: str = "consumer",
+                 auto_ack: bool = True):
+        self.handler = handler
+        self.workers = workers
+        self.name = name
+        self.auto_ack = auto_ack
+
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.running = False
+        self._reader_task: Optional[asyncio.Task] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.backpressure_waits = 0
+        self.backpressure_seconds = 0.0
+        self.max_queue_depth = 0
+        self.last_latency_ms = 0.0
+
+    def _start_tasks(self):
+        self.running = True
+        self._reader_task = asyncio.create_task(self._read_loop())
+        self._worker_tasks = [asyncio.create_task(self._worker_loop()) for _ in range(self.workers)]
+
+    async def _stop_reader(self):
+        self.running = False
+        if self._reader_task:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+
+    async def _drain(self, drain_timeout: float):
+        """Дожидается обработки очереди и останавливает обработчиков"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"[{self.name}] Не успели обработать {self.queue.qsize()} сообщений при остановке")
+
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+
+    def metrics(self) -> dict:
+        """Метрики пропускной способности и заполненности очереди"""
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "max_queue_depth": self.max_queue_depth,
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "backpressure_waits": self.backpressure_waits,
+            "backpressure_seconds": round(self.backpressure_seconds, 3),
+            "last_latency_ms": round(self.last_latency_ms, 3),
+        }
+
+    @abc.abstractmethod
+    async def _read_loop(self):
+        """Читает сообщения из Redis и передает их в _enqueue, пока self.running"""
+
+    async def _ack(self, ack_id: Any):
+        """Подтверждение обработанного сообщения (для pub/sub не требуется)"""
+
+    async def _enqueue(self, message: dict, ack_id: Any = None):
+        self.received += 1
+        item = (time.monotonic(), message, ack_id)
+        if self.queue.full():
+            self.backpressure_waits += 1
+            wait_started = time.monotonic()
+            await self.queue.put(item)
+            self.backpressure_seconds += time.monotonic() - wait_started
+        else:
+            self.queue.put_nowait(item)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    async def _worker_loop(self):
+        while True:
+            received_at, message, ack_id = await self.queue.get()
+            try:
+                await self.handler(message)
+                if self.auto_ack:
+                    await self._ack(ack_id)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"[{self.name}] Ошибка при обработке сообщения: {e}")
+            finally:
+                self.last_latency_ms = (time.monotonic() - received_at) * 1000
+                self.queue.task_done()
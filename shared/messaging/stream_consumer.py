@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import socket
+from typing import Awaitable, Callable, List, Optional
+
+from redis.exceptions import ResponseError
+
+from shared.messaging.queued_consumer import QueuedConsumer
+
+logger = logging.getLogger(__name__)
+
+
+class StreamConsumer(QueuedConsumer):
+    """
+    Потребитель Redis Stream в составе consumer group.
+
+    Несколько реплик с одной группой делят поток между собой. Запись подтверждается
+    (XACK) только после успешной обработки, поэтому при падении реплики ее записи
+    остаются в pending-списке группы и забираются другими репликами через XAUTOCLAIM,
+    когда простаивают дольше claim_idle_ms. Обработчик получает сообщение в том же
+    формате, что и от pub/sub: {"type": "message", "channel": ..., "data": ...}, а также
+    id записи. С auto_ack=False запись подтверждает сам обработчик через ack() - например,
+    только после того, как буферизованные данные записаны в хранилище.
+    """
+
+    def __init__(self, redis_client, stream: str, group: str,
+                 handler: Callable[[dict], Awaitable[None]],
+                 workers: int = 4, queue_size: int = 1000,
+                 batch_size: int = 100, block_ms: int = 1000,
+                 claim_idle_ms: int = 60000, consumer_name: Optional[str] = None,
+                 name: str = "stream", auto_ack: bool = True):
+        super().__init__(handler, workers=workers, queue_size=queue_size, name=name, auto_ack=auto_ack)
+        self.redis_client = redis_client
+        self.stream = stream
+        self.group = group
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self._claim_task: Optional[asyncio.Task] = None
+
+        self.acked = 0
+        self.reclaimed = 0
+
+    async def start(self):
+        """Создает группу (если ее нет) и запускает чтение, обработчиков и перехват зависших записей"""
+        try:
+            await self.redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._start_tasks()
+        self._claim_task = asyncio.create_task(self._claim_loop())
+        logger.info(f"[{self.name}] Чтение потока {self.stream}, группа {self.group}, "
+                    f"consumer {self.consumer_name}, обработчиков: {self.workers}")
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Прекращает чтение и дообрабатывает уже полученные записи"""
+        if self._claim_task:
+            self._claim_task.cancel()
+            await asyncio.gather(self._claim_task, return_exceptions=True)
+        await self._stop_reader()
+        # Неподтвержденные записи останутся в pending и будут перехвачены другими репликами
+        await self._drain(drain_timeout)
+        logger.info(f"[{self.name}] Остановлен, метрики: {self.metrics()}")
+
+    def metrics(self) -> dict:
+        return {**super().metrics(), "acked": self.acked, "reclaimed": self.reclaimed}
+
+    async def _read_loop(self):
+        # Сначала дочитываем свои неподтвержденные записи (после перезапуска с тем же именем)
+        last_id = "0"
+        while self.running:
+            try:
+                response = await self.redis_client.xreadgroup(
+                    self.group, self.consumer_name, {self.stream: last_id},
+                    count=self.batch_size, block=self.block_ms
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[{self.name}] Ошибка чтения потока: {e}")
+                await asyncio.sleep(self.block_ms / 1000)
+                continue
+
+            entries = response[0][1] if response else []
+            if last_id != ">":
+                if not entries:
+                    last_id = ">"
+                    continue
+                # По истории pending-записей двигаемся курсором, иначе читали бы одно и то же
+                last_id = entries[-1][0]
+            for entry_id, fields in entries:
+                await self._enqueue_entry(entry_id, fields)
+
+    async def _claim_loop(self):
+        """Периодически забирает записи, зависшие у упавших потребителей"""
+        while True:
+            await asyncio.sleep(self.claim_idle_ms / 1000)
+            start_id = "0-0"
+            try:
+                while True:
+                    response = await self.redis_client.xautoclaim(
+                        self.stream, self.group, self.consumer_name,
+                        min_idle_time=self.claim_idle_ms, start_id=start_id, count=self.batch_size
+                    )
+                    start_id, entries = response[0], response[1]
+                    for entry_id, fields in entries:
+                        self.reclaimed += 1
+                        await self._enqueue_entry(entry_id, fields)
+                    if start_id in ("0-0", b"0-0"):
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[{self.name}] Ошибка перехвата зависших записей: {e}")
+
+    async def _enqueue_entry(self, entry_id, fields):
+        if not fields:
+            # Запись удалена из потока (например, обрезана по MAXLEN) - просто подтверждаем
+            await self._ack(entry_id)
+            return
+        message = {"type": "message", "channel": self.stream, "data": fields.get("data"), "id": entry_id}
+        await self._enqueue(message, entry_id)
+
+    async def _ack(self, ack_id):
+        await self.ack([ack_id])
+
+    async def ack(self, entry_ids: List):
+        """Подтверждает записи группе; неподтвержденные остаются в pending и будут доставлены снова"""
+        if not entry_ids:
+            return
+        await self.redis_client.xack(self.stream, self.group, *entry_ids)
+        self.acked += len(entry_ids)